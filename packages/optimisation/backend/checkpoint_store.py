@@ -0,0 +1,67 @@
+# On-disk store of trained model checkpoints for the optimisation scripts (pnp/featured).
+# A checkpoint can only be reloaded into a model of the same shape, so checkpoints are
+# grouped by shape (e.g. state/action sizes) and tagged with a fingerprint of the
+# parameters that shaped training. A later run picks the closest one: the same
+# fingerprint if it was saved, otherwise the most recently saved checkpoint of that shape.
+#
+# The store only manages paths; the script serialises its own model (e.g. torch.save).
+
+import glob
+import hashlib
+import json
+import os
+
+# <repo>/checkpoints (this file is <repo>/packages/optimisation/backend/checkpoint_store.py)
+DEFAULT_CHECKPOINT_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+    "checkpoints"
+)
+
+
+def parameter_fingerprint(params, names):
+    """Short stable hash of the named parameters (missing ones count as None)."""
+    payload = json.dumps({name: params.get(name) for name in names}, sort_keys=True, default=str)
+    return hashlib.sha1(payload.encode("utf-8")).hexdigest()[:12]
+
+
+class CheckpointStore:
+    """
+    Checkpoint files of one model kind, named <model_name>_<shape>_<fingerprint>.pt
+    in directory. shape is a tuple of ints.
+    """
+
+    def __init__(self, model_name, directory=DEFAULT_CHECKPOINT_DIR):
+        self.model_name = model_name
+        self.directory = directory
+
+    def path_for(self, shape, fingerprint):
+        return os.path.join(self.directory, f"{self.model_name}_{self._shape_tag(shape)}_{fingerprint}.pt")
+
+    def find(self, shape, fingerprint):
+        """Path of the closest checkpoint for shape, or None if there is none."""
+        exact_path = self.path_for(shape, fingerprint)
+        if os.path.isfile(exact_path):
+            return exact_path
+        candidates = glob.glob(os.path.join(glob.escape(self.directory),
+                                            f"{self.model_name}_{self._shape_tag(shape)}_*.pt"))
+        return max(candidates, key=os.path.getmtime) if candidates else None
+
+    def save(self, shape, fingerprint, write_function):
+        """
+        Calls write_function(path) on a temporary file and moves it into place, so a reader
+        never sees a partly written checkpoint. Returns the checkpoint path.
+        """
+        os.makedirs(self.directory, exist_ok=True)
+        path = self.path_for(shape, fingerprint)
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            write_function(temp_path)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+        return path
+
+    @staticmethod
+    def _shape_tag(shape):
+        return "x".join(str(size) for size in shape)
@@ -0,0 +1,47 @@
+# Bounded least-recently-used cache of fitness values for the optimisation scripts (pnp/featured).
+# Keys are canonical, hashable encodings of a solution (genotype), so a solution that has
+# already been evaluated is never simulated again while its entry is in the cache.
+
+from collections import OrderedDict
+
+
+class FitnessCache:
+    """
+    LRU mapping of genotype keys to fitness, holding at most max_size entries.
+    hits and misses count the lookups made with get().
+    """
+    __slots__ = ("max_size", "hits", "misses", "_entries")
+
+    def __init__(self, max_size):
+        self.max_size = max_size
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+
+    def get(self, key):
+        """Cached fitness for key (marked as most recently used), or None."""
+        fitness = self._entries.get(key)
+        if fitness is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return fitness
+
+    def put(self, key, fitness):
+        """Stores fitness for key, evicting the least recently used entry when full."""
+        if self.max_size <= 0:
+            return
+        self._entries[key] = fitness
+        self._entries.move_to_end(key)
+        if len(self._entries) > self.max_size:
+            self._entries.popitem(last=False)
+
+    def __len__(self):
+        return len(self._entries)
+
+    def summary(self, label="Fitness cache"):
+        """Hit/miss counts for result messages."""
+        lookups = self.hits + self.misses
+        hit_rate = 100.0 * self.hits / lookups if lookups else 0.0
+        return f"{label}: {self.hits} hits, {self.misses} misses ({hit_rate:.1f}% hit rate)."
@@ -0,0 +1,149 @@
+# HTTP client and on-disk response cache for the LLM-based optimisation scripts (pnp/featured).
+# A chat completion is identified by its endpoint, model, sampling settings and prompt, so a
+# request that was already answered is read back from disk instead of waiting on the API.
+# Requests go through one keep-alive session per process (scripts are reloaded for every run,
+# this module is not), which retries connection errors, rate limits and server errors a
+# bounded number of times with exponential backoff.
+#
+# Endpoints whose URL starts with STUB_ENDPOINT_PREFIX are answered in this process by a
+# registered responder, so the scripts can be run without network (e.g. for testing).
+
+import hashlib
+import json
+import os
+import threading
+
+import requests
+from requests.adapters import BaseAdapter, HTTPAdapter
+from urllib3.util.retry import Retry
+
+# <repo>/llm_cache (this file is <repo>/packages/optimisation/backend/llm_client.py)
+DEFAULT_LLM_CACHE_DIR = os.path.join(
+    os.path.dirname(os.path.dirname(os.path.dirname(os.path.dirname(os.path.abspath(__file__))))),
+    "llm_cache"
+)
+STUB_ENDPOINT_PREFIX = "stub://"
+
+# Retry policy of the shared session: waits of about 2, 4, 8 s between attempts
+# (or what the server asks for in Retry-After)
+MAX_RETRIES = 3
+BACKOFF_FACTOR = 2.0
+RETRY_STATUSES = (429, 500, 502, 503, 504)
+
+_session = None
+_session_lock = threading.Lock()
+
+
+def response_cache_key(endpoint_url, model, temperature, max_tokens, prompt):
+    """Content address of a chat completion request (hex digest)."""
+    prompt_hash = hashlib.sha256(prompt.encode("utf-8")).hexdigest()
+    payload = json.dumps([endpoint_url, model, temperature, max_tokens, prompt_hash])
+    return hashlib.sha256(payload.encode("utf-8")).hexdigest()
+
+
+class LLMResponseCache:
+    """Raw API responses (parsed JSON) stored as <key>.json files in directory."""
+
+    def __init__(self, directory=DEFAULT_LLM_CACHE_DIR):
+        self.directory = directory
+
+    def get(self, key):
+        """Cached response for key, or None if there is none (or it cannot be read)."""
+        try:
+            with open(os.path.join(self.directory, f"{key}.json"), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    def put(self, key, response_data):
+        """Stores response_data for key, through a temporary file so readers never see a partial entry."""
+        os.makedirs(self.directory, exist_ok=True)
+        path = os.path.join(self.directory, f"{key}.json")
+        temp_path = f"{path}.{os.getpid()}.tmp"
+        try:
+            with open(temp_path, "w", encoding="utf-8") as f:
+                json.dump(response_data, f)
+            os.replace(temp_path, path)
+        finally:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+
+
+class StubEndpointAdapter(BaseAdapter):
+    """
+    Transport adapter answering chat completion requests in-process: responder(body) gets the
+    request body (dict) and returns the assistant message content (str).
+    """
+
+    def __init__(self, responder):
+        super().__init__()
+        self.responder = responder
+
+    def send(self, request, **kwargs):
+        body = json.loads(request.body) if request.body else {}
+        content = self.responder(body)
+        response = requests.Response()
+        response.status_code = 200
+        response.reason = "OK"
+        response.url = request.url
+        response.request = request
+        response.headers["Content-Type"] = "application/json"
+        response._content = json.dumps({
+            "model": body.get("model"),
+            "choices": [{"index": 0, "message": {"role": "assistant", "content": content}}]
+        }).encode("utf-8")
+        return response
+
+    def close(self):
+        pass
+
+
+def get_session():
+    """The process-wide keep-alive session, created on first use."""
+    global _session
+    with _session_lock:
+        if _session is None:
+            retry = Retry(
+                total=MAX_RETRIES,
+                read=0, # A read timeout means a slow generation; sending it again would only wait longer
+                backoff_factor=BACKOFF_FACTOR,
+                status_forcelist=RETRY_STATUSES,
+                allowed_methods=None, # Completion requests are POSTs
+                raise_on_status=False # The last response is returned, raise_for_status() reports it
+            )
+            session = requests.Session()
+            adapter = HTTPAdapter(max_retries=retry)
+            session.mount("https://", adapter)
+            session.mount("http://", adapter)
+            _session = session
+        return _session
+
+
+def register_stub_endpoint(name, responder):
+    """Answers requests to stub://<name> with responder (see StubEndpointAdapter). Returns the URL."""
+    endpoint_url = f"{STUB_ENDPOINT_PREFIX}{name}"
+    get_session().mount(endpoint_url, StubEndpointAdapter(responder))
+    return endpoint_url
+
+
+def post_chat_completion(endpoint_url, headers, body, timeout=180, cache=None):
+    """
+    Response (parsed JSON) of a chat completion request, and whether it came from cache.
+    Only responses carrying message content are cached. Raises requests exceptions as
+    requests.post does once the retries are used up.
+    """
+    key = None
+    if cache is not None:
+        key = response_cache_key(endpoint_url, body.get("model"), body.get("temperature"),
+                                 body.get("max_tokens"), json.dumps(body.get("messages"), sort_keys=True))
+        cached_response = cache.get(key)
+        if cached_response is not None:
+            return cached_response, True
+
+    response = get_session().post(endpoint_url, headers=headers, json=body, timeout=timeout)
+    response.raise_for_status()
+    response_data = response.json()
+    choices = response_data.get("choices") if isinstance(response_data, dict) else None
+    if key is not None and choices and (choices[0].get("message") or {}).get("content"):
+        cache.put(key, response_data)
+    return response_data, False
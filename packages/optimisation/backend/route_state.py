@@ -0,0 +1,294 @@
+# Incremental route feasibility for the optimisation scripts (pnp/featured).
+# A RouteState keeps the running load, schedule and forward time-window slack of
+# one route, so appending or inserting a parcel can be tested in O(1) instead of
+# re-simulating the whole route prefix with _calculate_route_schedule_and_feasibility.
+#
+# The checks mirror that scheduler exactly: capacity, service start/end within the
+# parcel time window, (optionally) service end within the vehicle's operating hours,
+# and the return-to-warehouse bound. Appends reproduce the scheduler's arithmetic
+# step for step; mid-route insertions are decided from the forward slack.
+
+import numpy as np
+
+from .routing_core import WAREHOUSE_NODE
+
+INFINITY = float("inf")
+
+
+class RouteProfile:
+    """
+    Constraint set and lookup tables shared by every RouteState built for one
+    vehicle (a specific delivery agent, or the generic constraints used while
+    constructing routes before agent assignment).
+    """
+    __slots__ = ("distance_rows", "travel_time_rows", "weights", "tw_open", "tw_close",
+                 "service_times", "capacity", "start_time", "end_time", "check_service_end",
+                 "return_to_warehouse", "return_offset", "min_leg_distance",
+                 "distance_matrix", "travel_time_matrix", "node_table")
+
+    def __init__(self, instance, capacity, start_time, end_time,
+                 check_service_end=True, return_to_warehouse=True, duration_limited=False,
+                 min_leg_distance=None):
+        self.distance_rows = instance.as_list("distance")
+        self.travel_time_rows = instance.as_list("travel_time")
+        self.weights = instance.as_list("weights")
+        self.tw_open = instance.as_list("tw_open")
+        self.tw_close = instance.as_list("tw_close")
+        self.service_times = instance.as_list("service_times")
+        # NumPy tables for checking many candidates at once (can_append_many): per-node rows of
+        # weight, time window open/close, service time and travel time back to the warehouse
+        self.distance_matrix = instance.matrices.distance
+        self.travel_time_matrix = instance.matrices.travel_time
+        self.node_table = np.array([instance.weights, instance.tw_open, instance.tw_close,
+                                    instance.service_times, instance.matrices.travel_time[:, WAREHOUSE_NODE]],
+                                   dtype=np.float64)
+        self.capacity = capacity
+        self.start_time = start_time
+        # Latest service end (if check_service_end) and latest return to the warehouse.
+        # With duration_limited the return is measured relative to start_time instead.
+        self.end_time = end_time
+        self.check_service_end = check_service_end
+        self.return_to_warehouse = return_to_warehouse
+        self.return_offset = start_time if duration_limited else 0
+        # Legs into a parcel no longer than this are rejected (ACO's location overlap check)
+        self.min_leg_distance = min_leg_distance
+
+
+# Profile for the delivery agent at agent_index (capacity and operating hours).
+def agent_route_profile(instance, agent_index, return_to_warehouse=True, min_leg_distance=None):
+    return RouteProfile(
+        instance,
+        capacity=instance.as_list("agent_capacities")[agent_index],
+        start_time=instance.as_list("agent_op_start")[agent_index],
+        end_time=instance.as_list("agent_op_end")[agent_index],
+        check_service_end=True,
+        return_to_warehouse=return_to_warehouse,
+        min_leg_distance=min_leg_distance
+    )
+
+
+# Profile for the generic constraints used by ACO/PSO route construction:
+# routes start at time 0 and must be back within generic_max_route_duration.
+def generic_route_profile(instance, generic_constraints, min_leg_distance=None):
+    return RouteProfile(
+        instance,
+        capacity=generic_constraints["generic_vehicle_capacity"],
+        start_time=0,
+        end_time=generic_constraints["generic_max_route_duration"],
+        check_service_end=False,
+        return_to_warehouse=True,
+        duration_limited=True,
+        min_leg_distance=min_leg_distance
+    )
+
+
+class RouteState:
+    """
+    One route under construction: warehouse -> nodes... (-> warehouse).
+    can_append/can_insert are O(1); append is O(1), insert is O(route length).
+    """
+    __slots__ = ("profile", "nodes", "arrivals", "starts", "departures", "load",
+                 "_leg_distance", "_slack")
+
+    def __init__(self, profile):
+        self.profile = profile
+        self.nodes = []
+        self.arrivals = []
+        self.starts = []
+        self.departures = []
+        self.load = 0
+        self._leg_distance = 0.0 # Sum of legs into parcels, in route order (None when stale)
+        self._slack = [] # Forward time slack per position (None when stale)
+
+    def __len__(self):
+        return len(self.nodes)
+
+    @property
+    def last_node(self):
+        return self.nodes[-1] if self.nodes else WAREHOUSE_NODE
+
+    @property
+    def departure_time(self):
+        return self.departures[-1] if self.departures else self.profile.start_time
+
+    def can_append(self, node):
+        """True if the route stays feasible with node appended at the end."""
+        p = self.profile
+        if self.load + p.weights[node] > p.capacity:
+            return False
+        last = self.nodes[-1] if self.nodes else WAREHOUSE_NODE
+        if p.min_leg_distance is not None and p.distance_rows[last][node] <= p.min_leg_distance:
+            return False
+        departure = self.departures[-1] if self.departures else p.start_time
+        return self._visit_is_feasible(node, departure + p.travel_time_rows[last][node], WAREHOUSE_NODE)
+
+    def can_append_many(self, nodes):
+        """can_append for every node of an int array at once, as a bool array."""
+        p = self.profile
+        last = self.last_node
+        weight, tw_open, tw_close, service_time, return_time = p.node_table.take(nodes, axis=1)
+        feasible = self.load + weight <= p.capacity
+        if p.min_leg_distance is not None:
+            feasible &= p.distance_matrix[last].take(nodes) > p.min_leg_distance
+        service_start = self.departure_time + p.travel_time_matrix[last].take(nodes)
+        np.maximum(service_start, tw_open, out=service_start)
+        feasible &= service_start <= tw_close
+        service_end = service_start + service_time
+        feasible &= service_end <= tw_close
+        if p.check_service_end:
+            feasible &= service_end <= p.end_time
+        if p.return_to_warehouse:
+            service_end += return_time # Arrival back at the warehouse
+            service_end -= p.return_offset
+            feasible &= service_end <= p.end_time
+        return feasible
+
+    def append_violation(self, node):
+        """Reason why node cannot be appended, or None if it can (diagnostics only)."""
+        p = self.profile
+        if self.load + p.weights[node] > p.capacity:
+            return f"Capacity exceeded - Current: {self.load + p.weights[node]}, Max: {p.capacity}"
+        last = self.last_node
+        if p.min_leg_distance is not None and p.distance_rows[last][node] <= p.min_leg_distance:
+            return f"Location overlap for node {node}"
+        arrival = self.departure_time + p.travel_time_rows[last][node]
+        service_start = max(arrival, p.tw_open[node])
+        if service_start > p.tw_close[node]:
+            return f"TW violation - Arrival: {arrival}, TW: {p.tw_open[node]}-{p.tw_close[node]}"
+        service_end = service_start + p.service_times[node]
+        if service_end > p.tw_close[node]:
+            return f"Service end {service_end} after TW close {p.tw_close[node]}"
+        if p.check_service_end and service_end > p.end_time:
+            return f"Service end {service_end} after vehicle end time {p.end_time}"
+        if p.return_to_warehouse and self._return_exceeds_bound(service_end + p.travel_time_rows[node][WAREHOUSE_NODE]):
+            return "Return to warehouse after vehicle end time"
+        return None
+
+    def append(self, node):
+        """Commits node at the end of the route (feasibility is not re-checked)."""
+        p = self.profile
+        last = self.nodes[-1] if self.nodes else WAREHOUSE_NODE
+        arrival = (self.departures[-1] if self.departures else p.start_time) + p.travel_time_rows[last][node]
+        service_start = max(arrival, p.tw_open[node])
+        self.nodes.append(node)
+        self.arrivals.append(arrival)
+        self.starts.append(service_start)
+        self.departures.append(service_start + p.service_times[node])
+        self.load += p.weights[node]
+        if self._leg_distance is not None:
+            self._leg_distance += p.distance_rows[last][node]
+        self._slack = None
+
+    def can_insert(self, node, position):
+        """True if the route stays feasible with node inserted before nodes[position]."""
+        num_stops = len(self.nodes)
+        if position >= num_stops:
+            return self.can_append(node)
+        p = self.profile
+        if self.load + p.weights[node] > p.capacity:
+            return False
+        previous = self.nodes[position - 1] if position > 0 else WAREHOUSE_NODE
+        following = self.nodes[position]
+        if p.min_leg_distance is not None and (p.distance_rows[previous][node] <= p.min_leg_distance or
+                                               p.distance_rows[node][following] <= p.min_leg_distance):
+            return False
+        departure = self.departures[position - 1] if position > 0 else p.start_time
+        arrival = departure + p.travel_time_rows[previous][node]
+        service_start = max(arrival, p.tw_open[node])
+        if service_start > p.tw_close[node]:
+            return False
+        service_end = service_start + p.service_times[node]
+        if service_end > p.tw_close[node]:
+            return False
+        if p.check_service_end and service_end > p.end_time:
+            return False
+        # The insertion pushes the following service start back; it must fit in the forward slack
+        following_arrival = service_end + p.travel_time_rows[node][following]
+        following_start = max(following_arrival, p.tw_open[following])
+        if self._slack is None:
+            self._refresh_slack()
+        return following_start - self.starts[position] <= self._slack[position]
+
+    def insert(self, node, position):
+        """Commits node before nodes[position] and reschedules the rest of the route."""
+        if position >= len(self.nodes):
+            self.append(node)
+            return
+        self.nodes.insert(position, node)
+        self.load += self.profile.weights[node]
+        self._leg_distance = None
+        self._slack = None
+        self._reschedule_from(position)
+
+    def return_arrival(self):
+        """Arrival time back at the warehouse after the last stop."""
+        return self.departure_time + self.profile.travel_time_rows[self.last_node][WAREHOUSE_NODE]
+
+    def total_distance(self):
+        """Route distance (including the return leg if enabled), summed in route order."""
+        p = self.profile
+        if self._leg_distance is None:
+            total = 0.0
+            previous = WAREHOUSE_NODE
+            for node in self.nodes:
+                total += p.distance_rows[previous][node]
+                previous = node
+            self._leg_distance = total
+        if p.return_to_warehouse:
+            return self._leg_distance + p.distance_rows[self.last_node][WAREHOUSE_NODE]
+        return self._leg_distance
+
+    # --- Internals ---
+
+    def _return_exceeds_bound(self, warehouse_arrival):
+        p = self.profile
+        return warehouse_arrival - p.return_offset > p.end_time
+
+    def _visit_is_feasible(self, node, arrival, next_node):
+        # Time-window, operating-hour and (for the last stop) return checks for one visit
+        p = self.profile
+        service_start = max(arrival, p.tw_open[node])
+        if service_start > p.tw_close[node]:
+            return False
+        service_end = service_start + p.service_times[node]
+        if service_end > p.tw_close[node]:
+            return False
+        if p.check_service_end and service_end > p.end_time:
+            return False
+        if next_node == WAREHOUSE_NODE and p.return_to_warehouse:
+            return not self._return_exceeds_bound(service_end + p.travel_time_rows[node][WAREHOUSE_NODE])
+        return True
+
+    def _reschedule_from(self, position):
+        p = self.profile
+        del self.arrivals[position:]
+        del self.starts[position:]
+        del self.departures[position:]
+        previous = self.nodes[position - 1] if position > 0 else WAREHOUSE_NODE
+        departure = self.departures[-1] if self.departures else p.start_time
+        for node in self.nodes[position:]:
+            arrival = departure + p.travel_time_rows[previous][node]
+            service_start = max(arrival, p.tw_open[node])
+            departure = service_start + p.service_times[node]
+            self.arrivals.append(arrival)
+            self.starts.append(service_start)
+            self.departures.append(departure)
+            previous = node
+
+    def _refresh_slack(self):
+        # slack[i]: how far service at position i can be pushed back without breaking
+        # its own window/operating hours or any later stop (waiting absorbs delays).
+        p = self.profile
+        num_stops = len(self.nodes)
+        slack = [0.0] * num_stops
+        downstream = INFINITY
+        if num_stops and p.return_to_warehouse:
+            downstream = p.end_time - (self.return_arrival() - p.return_offset)
+        for i in range(num_stops - 1, -1, -1):
+            node = self.nodes[i]
+            own = min(p.tw_close[node] - self.starts[i], p.tw_close[node] - self.departures[i])
+            if p.check_service_end:
+                own = min(own, p.end_time - self.departures[i])
+            slack[i] = min(own, downstream)
+            downstream = (self.starts[i] - self.arrivals[i]) + slack[i]
+        self._slack = slack
@@ -0,0 +1,189 @@
+# Shared routing primitives for the optimisation scripts (pnp/featured).
+# Builds the distance and travel-time matrices for a run once from config_data,
+# so scripts can replace repeated Euclidean distance calculations in their
+# inner loops with O(1) lookups on compact integer node ids.
+#
+# Node numbering: node 0 is the warehouse, nodes 1..N are the parcels in the
+# order they appear in config_data["parcels"]. Agents are numbered 0..M-1 in the
+# order they appear in config_data["delivery_agents"].
+
+import numpy as np
+
+WAREHOUSE_ID = "Warehouse"
+WAREHOUSE_NODE = 0
+
+# Defaults the scripts use for missing parcel/agent fields
+DEFAULT_TW_OPEN = 0
+DEFAULT_TW_CLOSE = 1439
+DEFAULT_OP_START = 0
+DEFAULT_OP_END = 1439
+
+
+# Returns a (N+1, 2) float64 array of node coordinates, warehouse first.
+def build_node_coordinates(config_data):
+    warehouse_coords = config_data.get("warehouse_coordinates_x_y", [0, 0])
+    parcels = config_data.get("parcels", [])
+    coordinates = np.empty((len(parcels) + 1, 2), dtype=np.float64)
+    coordinates[WAREHOUSE_NODE] = warehouse_coords[:2]
+    for node, parcel in enumerate(parcels, start=1):
+        coordinates[node] = parcel["coordinates_x_y"][:2]
+    return coordinates
+
+
+# Returns the full pairwise Euclidean distance matrix for an (M, 2) coordinate array.
+def build_distance_matrix(coordinates):
+    dx = coordinates[:, 0, np.newaxis] - coordinates[np.newaxis, :, 0]
+    dy = coordinates[:, 1, np.newaxis] - coordinates[np.newaxis, :, 1]
+    dx *= dx
+    dy *= dy
+    dx += dy
+    return np.sqrt(dx, out=dx)
+
+
+class RoutingMatrices:
+    """
+    Distance and travel-time matrices for one optimisation run, indexed by node id.
+    travel_time already has time_per_distance_unit folded in. Both are built on first
+    use, so scripts that only need coordinates (see spatial_index) never pay O(N^2).
+    """
+    __slots__ = ("node_ids", "node_index", "coordinates", "time_per_distance_unit",
+                 "_distance", "_travel_time", "_list_cache")
+
+    def __init__(self, node_ids, coordinates, time_per_distance_unit):
+        self.node_ids = list(node_ids)
+        self.node_index = {node_id: node for node, node_id in enumerate(self.node_ids)}
+        self.coordinates = coordinates
+        self.time_per_distance_unit = time_per_distance_unit
+        self._distance = None
+        self._travel_time = None
+        self._list_cache = {}
+
+    @property
+    def distance(self):
+        if self._distance is None:
+            self._distance = build_distance_matrix(self.coordinates)
+        return self._distance
+
+    @property
+    def travel_time(self):
+        if self._travel_time is None:
+            self._travel_time = self.distance * self.time_per_distance_unit
+        return self._travel_time
+
+    @property
+    def num_nodes(self):
+        return len(self.node_ids)
+
+    def node_of(self, stop_id):
+        """Maps a parcel id (or "Warehouse") to its node id."""
+        return self.node_index[stop_id]
+
+    def as_list(self, name):
+        """
+        Returns a cached nested-list copy of "distance", "travel_time" or "coordinates".
+        Scalar lookups from pure-Python loops are considerably faster on lists than
+        on NumPy arrays and yield plain floats for the output structures.
+        """
+        cached = self._list_cache.get(name)
+        if cached is None:
+            cached = getattr(self, name).tolist()
+            self._list_cache[name] = cached
+        return cached
+
+    def route_distance(self, nodes, return_to_warehouse=True):
+        """Total distance of warehouse -> nodes... (-> warehouse), summed leg by leg."""
+        distance_rows = self.as_list("distance")
+        total = 0.0
+        previous = WAREHOUSE_NODE
+        for node in nodes:
+            total += distance_rows[previous][node]
+            previous = node
+        if return_to_warehouse:
+            total += distance_rows[previous][WAREHOUSE_NODE]
+        return total
+
+
+# Builds the routing matrices for a run from config_data and the script's params.
+# default_time_per_distance_unit should match the default in the script's schema.
+def build_routing_matrices(config_data, params, default_time_per_distance_unit=2.0):
+    node_ids = [WAREHOUSE_ID] + [p["id"] for p in config_data.get("parcels", [])]
+    time_per_distance_unit = params.get("time_per_distance_unit", default_time_per_distance_unit)
+    return RoutingMatrices(node_ids, build_node_coordinates(config_data), time_per_distance_unit)
+
+
+class ProblemInstance:
+    """
+    Struct-of-arrays view of one run's config_data, built once per run_optimisation.
+    Parcel attributes are indexed by node (node 0 is the warehouse: no weight, no service
+    time, an unbounded time window), agent attributes by agent index. The original
+    parcel and agent dicts are kept as-is for building output, so nothing is copied.
+    """
+    __slots__ = ("parcels", "agents", "agent_ids", "agent_index", "weights", "tw_open", "tw_close",
+                 "service_times", "agent_capacities", "agent_op_start", "agent_op_end",
+                 "matrices", "_list_cache")
+
+    def __init__(self, parcels, agents, matrices, default_service_time):
+        num_nodes = len(parcels) + 1
+        self.parcels = parcels
+        self.agents = agents
+        self.agent_ids = [agent["id"] for agent in agents]
+        self.agent_index = {agent_id: index for index, agent_id in enumerate(self.agent_ids)}
+        self.matrices = matrices
+
+        # Weights and agent attributes keep the config's number type (int or float), so loads
+        # and capacities reported from them match sums over the original dicts
+        self.weights = np.array([0] + [parcel["weight"] for parcel in parcels])
+        self.tw_open = np.zeros(num_nodes, dtype=np.float64)
+        self.tw_close = np.full(num_nodes, np.inf, dtype=np.float64)
+        self.service_times = np.zeros(num_nodes, dtype=np.float64)
+        for node, parcel in enumerate(parcels, start=1):
+            self.tw_open[node] = parcel.get("time_window_open", DEFAULT_TW_OPEN)
+            self.tw_close[node] = parcel.get("time_window_close", DEFAULT_TW_CLOSE)
+            self.service_times[node] = parcel.get("service_time", default_service_time)
+
+        self.agent_capacities = np.array([agent.get("capacity_weight", 0) for agent in agents])
+        self.agent_op_start = np.array([agent.get("operating_hours_start", DEFAULT_OP_START) for agent in agents])
+        self.agent_op_end = np.array([agent.get("operating_hours_end", DEFAULT_OP_END) for agent in agents])
+        self._list_cache = {}
+
+    @property
+    def num_parcels(self):
+        return len(self.parcels)
+
+    @property
+    def num_agents(self):
+        return len(self.agents)
+
+    @property
+    def node_ids(self):
+        return self.matrices.node_ids
+
+    def node_of(self, stop_id):
+        """Maps a parcel id (or "Warehouse") to its node id."""
+        return self.matrices.node_index[stop_id]
+
+    def parcel_of(self, node):
+        """Original parcel dict for a parcel node (1..N)."""
+        return self.parcels[node - 1]
+
+    def as_list(self, name):
+        """
+        Cached list view of an attribute array or routing matrix ("distance", "travel_time",
+        "coordinates"), for scalar lookups from pure-Python loops.
+        """
+        if name in ("distance", "travel_time", "coordinates"):
+            return self.matrices.as_list(name)
+        cached = self._list_cache.get(name)
+        if cached is None:
+            cached = getattr(self, name).tolist()
+            self._list_cache[name] = cached
+        return cached
+
+
+# Builds the ProblemInstance (and its routing matrices) for a run from config_data and
+# the script's params. Defaults should match the script's schema.
+def build_problem_instance(config_data, params, default_time_per_distance_unit=2.0, default_service_time=10):
+    parcels = config_data.get("parcels", [])
+    agents = config_data.get("delivery_agents", [])
+    matrices = build_routing_matrices(config_data, params, default_time_per_distance_unit)
+    return ProblemInstance(parcels, agents, matrices, default_service_time)
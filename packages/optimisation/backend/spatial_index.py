@@ -0,0 +1,132 @@
+# Uniform-grid spatial index for the optimisation scripts (pnp/featured).
+# Points are bucketed into square cells. A nearest-first query scans the cells ring by
+# ring around the query point and yields points in increasing distance, so a caller
+# looking for the nearest point that passes some check can stop at the first one that
+# does instead of scanning every point. Removing a point is O(1) amortised: the grid is
+# rebuilt for the remaining points once most have been removed, so queries do not
+# wander through empty cells.
+#
+# Distances are computed as in routing_core.build_distance_matrix, so they are equal to
+# the matrix entries without the matrix having to be built.
+
+import heapq
+import math
+
+
+def point_distance(a, b):
+    """Euclidean distance between two (x, y) points, as in build_distance_matrix."""
+    dx = a[0] - b[0]
+    dy = a[1] - b[1]
+    return math.sqrt(dx * dx + dy * dy)
+
+
+class SpatialGridIndex:
+    """
+    Grid index over keys (e.g. node ids) located at coordinates[key] = (x, y).
+    nearest() yields (distance, key) in increasing distance; equal distances come in rank
+    order (by default the order the keys were given). Cells are sized for about
+    points_per_cell keys each.
+    """
+
+    def __init__(self, keys, coordinates, points_per_cell=2.0, ranks=None):
+        self._coordinates = coordinates
+        self._points_per_cell = points_per_cell
+        keys = list(keys)
+        self._build(keys, range(len(keys)) if ranks is None else ranks)
+
+    def __len__(self):
+        return len(self._cell_of)
+
+    def __contains__(self, key):
+        return key in self._cell_of
+
+    def remove(self, key):
+        """Removes key from the index."""
+        cell = self._cell_of.pop(key)
+        bucket = self._cells[cell]
+        del bucket[key]
+        if not bucket:
+            del self._cells[cell]
+        if len(self._cell_of) < self._built_size // 4:
+            # Re-grid the remaining points (same ranks) at their own density
+            ranked_keys = sorted((rank, key) for bucket in self._cells.values() for key, rank in bucket.items())
+            self._build([key for _, key in ranked_keys], [rank for rank, _ in ranked_keys])
+
+    def nearest(self, point, max_distance=math.inf):
+        """
+        Yields (distance, key) for the keys in the index, nearest to point first, up to
+        max_distance (inclusive) away.
+        """
+        cx, cy = self._cell(point)
+        heap = []
+        # Ring r holds the cells at Chebyshev distance r from the query cell. Once rings
+        # 0..r are scanned, every other key is farther than r * cell_size from point.
+        # Rings before the first one that reaches the grid's bounding box are empty.
+        ring = max(self._min_cx - cx, cx - self._max_cx, self._min_cy - cy, cy - self._max_cy, 0)
+        last_ring = max(cx - self._min_cx, self._max_cx - cx, cy - self._min_cy, self._max_cy - cy)
+        while ring <= last_ring and (ring - 1) * self.cell_size <= max_distance:
+            ring_cells = self._ring_cells(cx, cy, ring)
+            if len(ring_cells) > len(self._cell_of):
+                # Sparse index: taking every key not scanned yet is cheaper than the ring
+                for key, (key_cx, key_cy) in self._cell_of.items():
+                    if max(abs(key_cx - cx), abs(key_cy - cy)) >= ring:
+                        distance = point_distance(point, self._coordinates[key])
+                        if distance <= max_distance:
+                            heapq.heappush(heap, (distance, self._cells[(key_cx, key_cy)][key], key))
+                break
+            for cell in ring_cells:
+                bucket = self._cells.get(cell)
+                if bucket:
+                    for key, rank in bucket.items():
+                        distance = point_distance(point, self._coordinates[key])
+                        if distance <= max_distance:
+                            heapq.heappush(heap, (distance, rank, key))
+            bound = ring * self.cell_size
+            while heap and heap[0][0] < bound:
+                distance, _, key = heapq.heappop(heap)
+                yield distance, key
+            ring += 1
+        while heap:
+            distance, _, key = heapq.heappop(heap)
+            yield distance, key
+
+    # --- Internals ---
+
+    def _build(self, keys, ranks):
+        coordinates = self._coordinates
+        self._cells = {} # (cell x, cell y) -> {key: rank}
+        self._cell_of = {} # key -> (cell x, cell y), for every key still in the index
+        self._built_size = len(keys)
+        xs = [coordinates[key][0] for key in keys]
+        ys = [coordinates[key][1] for key in keys]
+        width = max(xs) - min(xs) if keys else 0.0
+        height = max(ys) - min(ys) if keys else 0.0
+        if width > 0 and height > 0:
+            cell_size = math.sqrt(width * height * self._points_per_cell / len(keys))
+        else: # All points on a line (or a single point)
+            cell_size = max(width, height) * self._points_per_cell / max(len(keys), 1)
+        self.cell_size = cell_size if cell_size > 0 else 1.0
+
+        for rank, key in zip(ranks, keys):
+            cell = self._cell(coordinates[key])
+            self._cells.setdefault(cell, {})[key] = rank
+            self._cell_of[key] = cell
+        cells = self._cell_of.values()
+        self._min_cx = min((cell[0] for cell in cells), default=0)
+        self._max_cx = max((cell[0] for cell in cells), default=0)
+        self._min_cy = min((cell[1] for cell in cells), default=0)
+        self._max_cy = max((cell[1] for cell in cells), default=0)
+
+    def _cell(self, point):
+        return (math.floor(point[0] / self.cell_size), math.floor(point[1] / self.cell_size))
+
+    def _ring_cells(self, cx, cy, ring):
+        # Cells of the ring that lie within the grid's bounding box
+        if ring == 0:
+            return [(cx, cy)]
+        xs = range(max(cx - ring, self._min_cx), min(cx + ring, self._max_cx) + 1)
+        ys = range(max(cy - ring + 1, self._min_cy), min(cy + ring - 1, self._max_cy) + 1)
+        cells = [(x, y) for y in (cy - ring, cy + ring) if self._min_cy <= y <= self._max_cy for x in xs]
+        cells.extend((x, y) for x in (cx - ring, cx + ring) if self._min_cx <= x <= self._max_cx for y in ys)
+        return cells
+
@@ -0,0 +1,214 @@
+# Optimal split of giant-tour chromosomes into agent routes (pnp/featured).
+# A giant tour is a permutation of the parcel nodes 1..N. The split cuts it into
+# consecutive segments, one per delivery agent in config order (a segment may be
+# empty), and may leave parcels between segments unassigned. Each segment must be a
+# feasible route for its agent under the same hard checks as RouteState: capacity,
+# service start/end within the parcel time window, service end within the agent's
+# operating hours and (optionally) the return to the warehouse.
+#
+# The split minimises total route distance + penalty_unassigned * unassigned parcels
+# with a shortest-path dynamic programme over tour positions, run for a whole
+# population of tours at once on (num_tours, N+1) NumPy arrays:
+#   V_0[j]   = penalty * j
+#   W_k[j]   = min over i <= j of V_k[i] + cost_k(tour[i:j])   (i == j: empty route)
+#   V_k+1[j] = min over j' <= j of W_k[j'] + penalty * (j - j')
+# and the split cost of a tour is V_M[N].
+
+import numpy as np
+
+from .routing_core import WAREHOUSE_NODE
+
+
+class SplitDecoder:
+    """
+    Splits giant tours (rows of an int array of parcel nodes) into one route per agent.
+    costs() scores a whole population; decode() rebuilds the routes of a single tour.
+    """
+    __slots__ = ("flat_distance", "flat_travel_time", "num_nodes", "weights", "tw_open", "tw_close",
+                 "service_times", "agent_capacities", "agent_op_start", "agent_op_end",
+                 "return_to_warehouse", "penalty_unassigned", "single_segments", "single_route_costs")
+
+    def __init__(self, instance, return_to_warehouse=True, penalty_unassigned=1000.0):
+        self.flat_distance = instance.matrices.distance.ravel()
+        self.flat_travel_time = instance.matrices.travel_time.ravel()
+        self.num_nodes = instance.matrices.num_nodes
+        self.weights = instance.weights.astype(np.float64)
+        self.tw_open = instance.tw_open
+        self.tw_close = instance.tw_close
+        self.service_times = instance.service_times
+        self.agent_capacities = instance.agent_capacities.astype(np.float64)
+        self.agent_op_start = instance.agent_op_start.astype(np.float64)
+        self.agent_op_end = instance.agent_op_end.astype(np.float64)
+        self.return_to_warehouse = return_to_warehouse
+        self.penalty_unassigned = float(penalty_unassigned)
+
+        # Single-parcel segments do not depend on the tour: summarise and score them once
+        nodes = np.arange(self.num_nodes)
+        self.single_segments = self._add_stop(
+            np.full(nodes.shape, WAREHOUSE_NODE), nodes, np.zeros(nodes.shape), np.full(nodes.shape, -np.inf),
+            np.full(nodes.shape, np.inf), np.zeros(nodes.shape), np.zeros(nodes.shape)
+        )
+        self.single_segments[-1][WAREHOUSE_NODE] = False
+        self.single_route_costs = self._single_parcel_route_costs(nodes)
+
+    def costs(self, tours):
+        """Split cost of every row of tours, as a (num_tours,) float64 array."""
+        value, _, _ = self._solve(np.atleast_2d(tours), keep_back_pointers=False)
+        return value[:, -1]
+
+    def decode(self, tour):
+        """
+        Optimal split of a single tour.
+        Returns (routes, unassigned, cost): routes[agent_idx] is a list of parcel nodes
+        in visiting order and unassigned lists the skipped nodes in tour order.
+        """
+        tour = np.asarray(tour)
+        value, route_starts, route_ends = self._solve(tour[np.newaxis, :], keep_back_pointers=True)
+        tour_nodes = tour.tolist()
+        num_agents = len(route_starts)
+        routes = [[] for _ in range(num_agents)]
+        assigned = [False] * len(tour_nodes)
+
+        j = len(tour_nodes)
+        for agent_idx in range(num_agents - 1, -1, -1):
+            end = int(route_ends[agent_idx][0, j]) # Parcels end..j-1 are skipped
+            start = int(route_starts[agent_idx][0, end])
+            routes[agent_idx] = tour_nodes[start:end]
+            for position in range(start, end):
+                assigned[position] = True
+            j = start
+
+        unassigned = [node for node, is_assigned in zip(tour_nodes, assigned) if not is_assigned]
+        return routes, unassigned, float(value[0, -1])
+
+    # --- Internals ---
+
+    def _solve(self, tours, keep_back_pointers):
+        num_tours, num_parcels = tours.shape
+        positions = np.arange(num_parcels + 1)
+        skip_costs = self.penalty_unassigned * positions
+        value = np.broadcast_to(skip_costs, (num_tours, num_parcels + 1)).copy()
+        segments = self._feasible_segments(tours)
+        route_starts = []
+        route_ends = []
+
+        for agent_idx in range(len(self.agent_capacities)):
+            best, best_start = self._best_route_ending_at(tours, segments, value, agent_idx, keep_back_pointers)
+            # Skipping parcels after the route: running minimum of best[j'] - penalty * j'
+            shifted = best - skip_costs
+            running_min = np.minimum.accumulate(shifted, axis=1)
+            value = running_min + skip_costs
+            if keep_back_pointers:
+                route_starts.append(best_start)
+                route_ends.append(np.maximum.accumulate(np.where(shifted == running_min, positions, 0), axis=1))
+
+        return value, route_starts, route_ends
+
+    def _add_stop(self, previous, node, offset, forced, latest_start, load, leg_distance):
+        # Extends segment summaries ending at previous by node. A segment's schedule depends on
+        # the agent only through its start time s: the last departure is max(s + offset, forced)
+        # and every time window holds iff each forced departure fits and s <= latest_start.
+        # Also returns whether any agent could still serve the segment; every check only gets
+        # tighter as the route grows, so segments failing it are not extended further.
+        leg = previous * self.num_nodes + node
+        travel = self.flat_travel_time.take(leg)
+        service = self.service_times.take(node)
+        tw_close = self.tw_close.take(node)
+        offset = offset + travel + service
+        forced = np.maximum(forced + travel, self.tw_open.take(node)) + service
+        latest_start = np.minimum(latest_start, tw_close - offset)
+        load = load + self.weights.take(node)
+        leg_distance = leg_distance + self.flat_distance.take(leg)
+
+        earliest_start = self.agent_op_start.min(initial=np.inf)
+        extendable = ((forced <= tw_close) & (latest_start >= earliest_start) &
+                      (load <= self.agent_capacities.max(initial=-np.inf)) &
+                      (np.maximum(offset + earliest_start, forced) <= self.agent_op_end.max(initial=-np.inf)))
+        return offset, forced, latest_start, load, leg_distance, extendable
+
+    def _return_leg(self, node, leg_distance):
+        # Travel time back to the warehouse and total route distance for segments ending at node
+        if self.return_to_warehouse:
+            return_leg = node * self.num_nodes + WAREHOUSE_NODE
+            return self.flat_travel_time.take(return_leg), leg_distance + self.flat_distance.take(return_leg)
+        return 0.0, leg_distance
+
+    def _single_parcel_route_costs(self, nodes):
+        # (num_agents, N+1) cost of serving each parcel node alone (inf if the agent cannot)
+        offset, forced, latest_start, load, leg_distance, extendable = self.single_segments
+        return_time, route_distance = self._return_leg(nodes, leg_distance)
+        start_time = self.agent_op_start[:, np.newaxis]
+        op_end = self.agent_op_end[:, np.newaxis]
+        serviceable = (extendable & (latest_start >= start_time) & (offset + return_time <= op_end - start_time) &
+                       (forced + return_time <= op_end) & (load <= self.agent_capacities[:, np.newaxis]))
+        return np.where(serviceable, route_distance, np.inf)
+
+    def _feasible_segments(self, tours):
+        # Every tour segment of two or more parcels that could be a feasible route for at least
+        # one agent, grouped by length, with the summaries _best_route_ending_at checks per agent.
+        num_tours, num_parcels = tours.shape
+
+        # Tours padded with a warehouse column, laid out like the flattened (num_tours, N+1)
+        # value arrays: the segment starting at value position p visits padded[p], padded[p+1], ...
+        # and a segment running into the padding is dropped.
+        padded = np.zeros((num_tours, num_parcels + 1), dtype=np.int64)
+        padded[:, :num_parcels] = tours
+        padded = padded.ravel()
+        start = np.flatnonzero(padded)
+        node = padded.take(start)
+        *summaries, extendable = (summary.take(node) for summary in self.single_segments)
+
+        segments = []
+        for length in range(2, num_parcels + 2):
+            # Keep the segments of length - 1 that some agent could serve, and extend them
+            kept = np.flatnonzero(extendable)
+            start, node = start.take(kept), node.take(kept)
+            summaries = [summary.take(kept) for summary in summaries]
+            if length > 2: # Single-parcel routes are scored from single_route_costs
+                offset, forced, latest_start, load, leg_distance = summaries
+                return_time, route_distance = self._return_leg(node, leg_distance)
+                segments.append((start, start + (length - 1), offset + return_time, forced + return_time,
+                                 latest_start, load, route_distance))
+            if not len(start) or length > num_parcels:
+                break
+
+            previous = node
+            node = padded.take(start + (length - 1))
+            *summaries, extendable = self._add_stop(previous, node, *summaries)
+            extendable &= node != WAREHOUSE_NODE
+
+        return segments
+
+    def _best_route_ending_at(self, tours, segments, value, agent_idx, keep_back_pointers):
+        # best[:, j] = min over i <= j of value[:, i] + cost of the route tour[i:j] (i == j: no route)
+        start_time = self.agent_op_start[agent_idx]
+        capacity = self.agent_capacities[agent_idx]
+        op_end = self.agent_op_end[agent_idx]
+        # Last departure (plus the return leg, if any) max(start_time + offset, forced) must be <= op_end
+        return_by = op_end - start_time
+        best = value.copy()
+        flat_value = value.ravel()
+        flat_best = best.ravel()
+        best_start = None
+        if keep_back_pointers:
+            best_start = np.broadcast_to(np.arange(value.shape[1]), value.shape).copy()
+            flat_best_start = best_start.ravel()
+
+        # Single-parcel routes, for every position of every tour at once
+        candidate = value[:, :-1] + self.single_route_costs[agent_idx].take(tours)
+        improved = candidate < best[:, 1:]
+        np.copyto(best[:, 1:], candidate, where=improved)
+        if keep_back_pointers:
+            np.copyto(best_start[:, 1:], np.arange(tours.shape[1]), where=improved)
+
+        for start, end, return_offset, return_forced, latest_start, load, route_distance in segments:
+            serviceable = np.flatnonzero((latest_start >= start_time) & (return_offset <= return_by) &
+                                         (return_forced <= op_end) & (load <= capacity))
+            end_served = end.take(serviceable)
+            candidate = flat_value.take(start.take(serviceable)) + route_distance.take(serviceable)
+            improved = candidate < flat_best.take(end_served)
+            flat_best[end_served[improved]] = candidate[improved]
+            if keep_back_pointers:
+                flat_best_start[end_served[improved]] = start.take(serviceable)[improved] % value.shape[1]
+
+        return best, best_start
@@ -0,0 +1,63 @@
+# Process pool for batch evaluations in the optimisation scripts (pnp/featured).
+# A pool is started once per run: every worker receives the problem data once,
+# through the pool initializer, and each later batch only sends the items to evaluate.
+#
+# Scripts are executed as temporary modules (see script_utils), which a worker started
+# with the spawn method cannot import by name, so the worker loads the function's
+# module from its file when it is not already present (as it is with fork).
+
+import importlib.util
+import os
+import sys
+from concurrent.futures import ProcessPoolExecutor
+
+# Set in each worker process by _init_worker
+_worker_function = None
+_worker_shared_args = ()
+
+
+def _init_worker(module_name, module_file, function_name, shared_args):
+    global _worker_function, _worker_shared_args
+    module = sys.modules.get(module_name)
+    if module is None:
+        spec = importlib.util.spec_from_file_location(module_name, module_file)
+        module = importlib.util.module_from_spec(spec)
+        sys.modules[module_name] = module
+        spec.loader.exec_module(module)
+    _worker_function = getattr(module, function_name)
+    _worker_shared_args = shared_args
+
+
+def _call_worker_function(item):
+    return _worker_function(item, *_worker_shared_args)
+
+
+class WorkerPool:
+    """
+    Evaluates function(item, *shared_args) for batches of items on worker processes.
+    function must be defined at module level; shared_args are sent to each worker once.
+    """
+
+    def __init__(self, function, shared_args=(), num_workers=None):
+        module = sys.modules[function.__module__]
+        self.num_workers = num_workers or os.cpu_count() or 1
+        self._executor = ProcessPoolExecutor(
+            max_workers=self.num_workers,
+            initializer=_init_worker,
+            initargs=(function.__module__, getattr(module, "__file__", None), function.__name__, tuple(shared_args))
+        )
+
+    def map(self, items):
+        """Results of function for each item, in order. Items are sent in chunks."""
+        items = list(items)
+        chunksize = max(1, -(-len(items) // (self.num_workers * 4)))
+        return list(self._executor.map(_call_worker_function, items, chunksize=chunksize))
+
+    def close(self):
+        self._executor.shutdown()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
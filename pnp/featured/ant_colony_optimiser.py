@@ -1,6 +1,9 @@
-import math
+import contextlib
 import random
-import copy
+import numpy as np
+from packages.optimisation.backend.routing_core import build_problem_instance, WAREHOUSE_NODE
+from packages.optimisation.backend.route_state import RouteState, generic_route_profile
+from packages.optimisation.backend.worker_pool import WorkerPool
 
 # Define constants for schema default values to check against for adaptive behavior
 SCHEMA_DEFAULT_INITIAL_PHEROMONE = 0.1
@@ -107,22 +110,72 @@ def get_params_schema():
                 "default": 480, # 8 hours
                 "min": 30,
                 "help": "Maximum duration for a route (warehouse-to-warehouse) during ACO route building, relative to a common start time."
+            },
+            {
+                "name": "candidate_list_size",
+                "label": "Candidate List Size (k nearest parcels)",
+                "type": "integer",
+                "default": 0,
+                "min": 0,
+                "step": 1,
+                "help": "Ants choose the next parcel among the k nearest unvisited parcels of their current location, considering all unvisited parcels only when none of those can be added. 0 always considers all unvisited parcels. 10-25 speeds up large instances."
+            },
+            {
+                "name": "workers",
+                "label": "Worker Processes",
+                "type": "integer",
+                "default": 1,
+                "min": 1,
+                "step": 1,
+                "help": "Processes the ants of each iteration are divided between (pheromones are merged in the main process). Results for a given seed are the same for any number of workers."
+            },
+            {
+                "name": "max_min_bounds",
+                "label": "MAX-MIN Pheromone Bounds",
+                "type": "boolean",
+                "default": False,
+                "help": "Clamp pheromone trails to [tau_min, tau_max] after each update (MAX-MIN Ant System), derived from the best solution cost so far. Prevents early stagnation."
+            },
+            {
+                "name": "p_best",
+                "label": "MAX-MIN p_best",
+                "type": "float",
+                "default": 0.05,
+                "min": 0.001,
+                "max": 0.999,
+                "step": 0.01,
+                "help": "Probability of an ant rebuilding the best solution once trails converge; sets tau_min relative to tau_max. Used only with MAX-MIN bounds."
             }
         ]
     }
 
-def _calculate_distance(coord1, coord2):
-    return math.sqrt((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)
-
-def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_or_generic_constraints, warehouse_coords, params, parcel_map_for_lookup):
+def _build_candidate_lists(distance_matrix, k):
+    """
+    Returns a (num_nodes, k) int array: for every node (warehouse included), its k nearest
+    parcel nodes, nearest first. Returns None if k is 0 or covers every parcel.
+    """
+    num_parcels = distance_matrix.shape[0] - 1
+    if k <= 0 or k >= num_parcels:
+        return None
+    parcel_distances = distance_matrix[:, 1:].copy()
+    parcel_distances[np.arange(1, num_parcels + 1), np.arange(num_parcels)] = np.inf # A parcel is not its own candidate
+    nearest = np.argpartition(parcel_distances, k - 1, axis=1)[:, :k]
+    order = np.argsort(np.take_along_axis(parcel_distances, nearest, axis=1), axis=1, kind="stable")
+    return np.take_along_axis(nearest, order, axis=1) + 1
+
+def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_or_generic_constraints, warehouse_coords, instance):
     """
     Calculates schedule for a sequence of parcels against specific agent or generic constraints.
     Returns: (is_feasible, schedule_details_dict) where schedule_details_dict contains "reason" key 
              explaining feasibility status
     """
     reason = "Feasible"  # Default success reason
-    time_per_dist_unit = params.get("time_per_distance_unit", 2.0)
-    default_service_time = params.get("default_service_time", 10)
+    distance_rows = instance.as_list("distance")
+    travel_time_rows = instance.as_list("travel_time")
+    weights = instance.as_list("weights")
+    tw_open = instance.as_list("tw_open")
+    tw_close = instance.as_list("tw_close")
+    service_times = instance.as_list("service_times")
 
     is_specific_agent = "operating_hours_start" in agent_or_generic_constraints
     if is_specific_agent:
@@ -145,20 +198,17 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_or_g
     departure_times = [round(route_start_time)]
 
     current_time_on_route = route_start_time # This tracks time from start of THIS route.
-    current_location = list(warehouse_coords)
+    current_node = WAREHOUSE_NODE
     current_load = 0
     total_distance = 0.0
 
-    for p_obj_original in ordered_parcel_objects:
-        # Ensure we use full parcel details from the map if only IDs were passed
-        p_obj = parcel_map_for_lookup.get(p_obj_original["id"], p_obj_original)
-
+    for p_obj in ordered_parcel_objects:
         p_id = p_obj["id"]
-        p_coords = p_obj["coordinates_x_y"]
-        p_weight = p_obj["weight"]
-        p_service_time = p_obj.get("service_time", default_service_time)
-        p_tw_open = p_obj.get("time_window_open", 0)
-        p_tw_close = p_obj.get("time_window_close", 1439)
+        p_node = instance.node_of(p_id)
+        p_weight = weights[p_node]
+        p_service_time = service_times[p_node]
+        p_tw_open = tw_open[p_node]
+        p_tw_close = tw_close[p_node]
 
         # Special case for first parcel in empty route
         if current_load == 0 and route_start_time > p_tw_close:
@@ -172,15 +222,14 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_or_g
             print(f"    [DEBUG FEASIBILITY] Capacity check failed: {reason}")
             return False, {"reason": reason}
 
-        dist_to_parcel = _calculate_distance(current_location, p_coords)
+        dist_to_parcel = distance_rows[current_node][p_node]
         if dist_to_parcel <= 0.001:  # Prevent division by zero in probabilities
             reason = f"Location overlap for parcel {p_id}"
             print(f"    [DEBUG FEASIBILITY] {reason}")
             return False, {"reason": reason}
 
-        dist_to_parcel = _calculate_distance(current_location, p_coords)
         total_distance += dist_to_parcel
-        travel_time = dist_to_parcel * time_per_dist_unit
+        travel_time = travel_time_rows[current_node][p_node]
         
         # Physical arrival time at parcel, accumulates from route_start_time
         physical_arrival_at_parcel = current_time_on_route + travel_time
@@ -202,17 +251,16 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_or_g
             return False, {}
 
         route_stop_ids.append(p_id)
-        route_stop_coordinates.append(list(p_coords))
+        route_stop_coordinates.append(list(p_obj["coordinates_x_y"]))
         arrival_times.append(round(physical_arrival_at_parcel)) # Store physical arrival
         departure_times.append(round(actual_service_end_time)) # Store service end
         
         current_time_on_route = actual_service_end_time # Update time for next leg
-        current_location = list(p_coords)
+        current_node = p_node
 
     # Return to Warehouse
-    dist_to_warehouse = _calculate_distance(current_location, warehouse_coords)
-    total_distance += dist_to_warehouse
-    travel_time_to_wh = dist_to_warehouse * time_per_dist_unit
+    total_distance += distance_rows[current_node][WAREHOUSE_NODE]
+    travel_time_to_wh = travel_time_rows[current_node][WAREHOUSE_NODE]
     physical_arrival_at_warehouse_final = current_time_on_route + travel_time_to_wh
 
     # For specific agent, check final arrival against their op_end
@@ -242,9 +290,126 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_or_g
     return True, schedule_details
 
 
+def _construct_ant_solutions(ant_block, instance, generic_profile, candidate_lists):
+    """
+    Builds the solutions of a block of ants against one attractiveness matrix (tau^alpha * eta^beta,
+    a read-only snapshot of the pheromone trails). ant_block is (iteration, attractiveness_matrix,
+    [(ant_idx, ant_seed), ...]); each ant draws from its own random.Random(ant_seed), so the
+    block can be built in any process. Returns one solution dict per ant, where "path" is an
+    int32 array of the ant's routes, each starting and ending at the warehouse: [0, a, b, 0, c, 0].
+    """
+    iteration, attractiveness_matrix, ants = ant_block
+    num_nodes = attractiveness_matrix.shape[0]
+    solutions = []
+    for ant_idx, ant_seed in ants:
+        is_unvisited = np.ones(num_nodes, dtype=bool) # Mask of parcel indices (1 to N) still to visit
+        is_unvisited[0] = False
+        num_unvisited = num_nodes - 1
+        ant_random = random.Random(ant_seed)
+        ant_solution_path = [0]
+        ant_solution_total_distance = 0.0
+
+        while num_unvisited:
+            current_route_state = RouteState(generic_profile) # Its nodes are the route's parcel indices
+            current_location_idx = 0 # Start at Warehouse
+            
+            # Try to build one route
+            while True:
+                eligible_next_parcel_indices = ()
+                if candidate_lists is not None:
+                    # Feasible unvisited parcels among the k nearest of the current location
+                    candidate_indices = candidate_lists[current_location_idx]
+                    candidate_indices = candidate_indices[is_unvisited.take(candidate_indices)]
+                    eligible_next_parcel_indices = candidate_indices[current_route_state.can_append_many(candidate_indices)]
+
+                if not len(eligible_next_parcel_indices):
+                    # Check feasibility of appending each remaining parcel under generic constraints
+                    candidate_indices = np.flatnonzero(is_unvisited)
+                    is_feasible_addition = current_route_state.can_append_many(candidate_indices)
+                    if iteration == 0 and ant_idx == 0:
+                        for p_idx in candidate_indices[~is_feasible_addition].tolist():
+                            parcel_obj = instance.parcel_of(p_idx)
+                            print(f"    [DEBUG] Could not add parcel {p_idx} ({parcel_obj['id']}) to empty route.")
+                            print(f"    [DEBUG] Parcel details: weight={parcel_obj['weight']}, coords={parcel_obj['coordinates_x_y']}, TW={parcel_obj.get('time_window_open')}-{parcel_obj.get('time_window_close')}")
+                            print(f"    [DEBUG] Fail reason: {current_route_state.append_violation(p_idx)}")
+                    eligible_next_parcel_indices = candidate_indices[is_feasible_addition]
+                
+                if not len(eligible_next_parcel_indices):
+                    if iteration == 0:
+                        print(f"  Ant {ant_idx}: No eligible parcels left to add to route. Current route has {len(current_route_state)} parcels.")
+                    print(f"    [DEBUG] No eligible parcels to add. Current route weight: {current_route_state.load}")
+                    break # Cannot add more parcels to this route
+
+                # Cumulative (unnormalised) probabilities of the eligible moves
+                cumulative_probs = np.cumsum(attractiveness_matrix[current_location_idx].take(eligible_next_parcel_indices))
+                total_prob_sum = cumulative_probs[-1]
+                
+                if total_prob_sum == 0: # No way to move, or all probs are zero
+                    break 
+
+                # Roulette wheel selection: first move whose cumulative probability reaches r
+                r = ant_random.random() * total_prob_sum
+                selected_position = min(int(np.searchsorted(cumulative_probs, r)), len(cumulative_probs) - 1)
+                selected_parcel_idx = int(eligible_next_parcel_indices[selected_position])
+
+                current_route_state.append(selected_parcel_idx)
+                is_unvisited[selected_parcel_idx] = False
+                num_unvisited -= 1
+                current_location_idx = selected_parcel_idx
+
+            if len(current_route_state):
+                # Every append was checked, so the route is feasible; cost matches the scheduler's rounded distance
+                ant_solution_path.extend(current_route_state.nodes)
+                ant_solution_path.append(0) # Back at WH
+                ant_solution_total_distance += round(current_route_state.total_distance(), 2)
+            else: # No parcels could be added to start a new route
+                if not num_unvisited: # All parcels assigned
+                    pass
+                else: # Parcels remaining, but cannot form a new route from WH
+                    if iteration == 0:
+                        print(f"  Ant {ant_idx}: Could not start new route with remaining parcels: {set(np.flatnonzero(is_unvisited).tolist())}")
+                    break # Stop trying to build routes for this ant
+
+
+        solutions.append({
+            "path": np.array(ant_solution_path, dtype=np.int32),
+            "cost": ant_solution_total_distance,
+            "unassigned_count": num_unvisited
+        })
+    return solutions
+
+def _path_routes(path):
+    """Splits a solution path [0, a, b, 0, c, 0] into routes of parcel nodes [[a, b], [c]]."""
+    route_ends = np.flatnonzero(path == 0)
+    return [path[start + 1:end].tolist() for start, end in zip(route_ends[:-1], route_ends[1:])]
+
+def _deposit_pheromone(pheromone_matrix, solutions, deposit_q):
+    """Adds deposit_q / cost to both directions of every edge in each solution's path, in one step."""
+    deposits = [(sol["path"], deposit_q / sol["cost"]) for sol in solutions
+                if sol["cost"] != 0] # Avoid division by zero for empty solutions
+    if not deposits:
+        return
+    from_nodes = np.concatenate([path[:-1] for path, _ in deposits])
+    to_nodes = np.concatenate([path[1:] for path, _ in deposits])
+    amounts = np.repeat([amount for _, amount in deposits], [len(path) - 1 for path, _ in deposits])
+    np.add.at(pheromone_matrix, (from_nodes, to_nodes), amounts)
+    np.add.at(pheromone_matrix, (to_nodes, from_nodes), amounts) # Symmetric
+
+def _max_min_pheromone_bounds(best_cost, deposit_q, evaporation_rate, num_parcels, p_best):
+    """
+    MAX-MIN Ant System trail limits (tau_min, tau_max): tau_max is the equilibrium trail of
+    the best solution's edges, Q / (rho * best_cost); tau_min is set so that, with converged
+    trails, an ant rebuilds the best solution with probability p_best.
+    """
+    tau_max = deposit_q / (evaporation_rate * best_cost)
+    root_p_best = p_best ** (1.0 / num_parcels)
+    average_choices = max(num_parcels / 2.0 - 1.0, 1.0) # Mean number of choices left per step
+    tau_min = min(tau_max * (1.0 - root_p_best) / (average_choices * root_p_best), tau_max)
+    return tau_min, tau_max
+
 def run_optimisation(config_data, params):
     warehouse_coords = config_data.get("warehouse_coordinates_x_y", [0,0])
-    all_parcels_list = [copy.deepcopy(p) for p in config_data.get("parcels", [])]
+    all_parcels_list = config_data.get("parcels", [])
     delivery_agents = config_data.get("delivery_agents", [])
 
     if not all_parcels_list:
@@ -253,10 +418,9 @@ def run_optimisation(config_data, params):
         return {"status": "success", "message": "No delivery agents available.", "optimised_routes": [], "unassigned_parcels": [p["id"] for p in all_parcels_list], "unassigned_parcels_details": all_parcels_list}
 
     num_parcels = len(all_parcels_list)
-    parcel_map = {p["id"]: p for p in all_parcels_list}
-    parcel_id_to_idx = {p["id"]: i + 1 for i, p in enumerate(all_parcels_list)} # 1 to N
-    parcel_idx_to_id = {i + 1: p["id"] for i, p in enumerate(all_parcels_list)}
-    # Node 0 is Warehouse
+    # Parcel index == routing node: 0 is the Warehouse, 1 to N the parcels in config order
+    instance = build_problem_instance(config_data, params, default_time_per_distance_unit=2.0,
+                                      default_service_time=params.get("default_service_time", 10))
 
     num_nodes = num_parcels + 1 # Warehouse + Parcels
 
@@ -331,172 +495,83 @@ def run_optimisation(config_data, params):
     print(f"ACO: Generic constraints for ants: Capacity={generic_constraints['generic_vehicle_capacity']}, "
           f"MaxDuration={generic_constraints['generic_max_route_duration']} (Adaptive)")
 
-    # Initialize distance matrix
-    dist_matrix = [[0.0] * num_nodes for _ in range(num_nodes)]
-    for i in range(num_nodes):
-        for j in range(i, num_nodes):
-            coord_i = warehouse_coords if i == 0 else parcel_map[parcel_idx_to_id[i]]["coordinates_x_y"]
-            coord_j = warehouse_coords if j == 0 else parcel_map[parcel_idx_to_id[j]]["coordinates_x_y"]
-            dist = _calculate_distance(coord_i, coord_j)
-            dist_matrix[i][j] = dist_matrix[j][i] = dist
+    # Heuristic desirability eta^beta (inverse distance) is fixed for the run
+    heuristic_matrix = np.power(1.0 / (instance.matrices.distance + 1e-6), beta) # Add epsilon to avoid div by zero
+    # Incremental feasibility for route construction; same checks as the scheduler
+    # (including its 0.001 location overlap guard), but O(1) per candidate
+    generic_profile = generic_route_profile(instance, generic_constraints, min_leg_distance=0.001)
+    # k nearest parcels of every node, tried before the full unvisited set at each step
+    candidate_lists = _build_candidate_lists(instance.matrices.distance, params.get("candidate_list_size", 0))
 
     # Initialize pheromone matrix
-    pheromone_matrix = [[effective_initial_pheromone] * num_nodes for _ in range(num_nodes)]
+    pheromone_matrix = np.full((num_nodes, num_nodes), effective_initial_pheromone)
 
-    global_best_solution_routes_parcels = [] # List of lists of parcel objects
+    global_best_solution_path = None # Routes of the best solution as a path array (see _construct_ant_solutions)
     global_best_solution_cost = float('inf')
     global_best_unassigned_count = num_parcels + 1
+    use_max_min_bounds = params.get("max_min_bounds", False)
+    p_best = params.get("p_best", 0.05)
 
+    # Parallel mode: the ants of each iteration are divided between worker processes
+    num_workers = params.get("workers", 1)
+    worker_pool = contextlib.nullcontext()
+    if num_workers > 1:
+        worker_pool = WorkerPool(_construct_ant_solutions, (instance, generic_profile, candidate_lists), num_workers)
 
     print(f"ACO: Starting optimization with {num_iterations} iterations and {num_ants} ants")
-    for iteration in range(num_iterations):
-        iteration_solutions = [] # Store solutions (list of routes, cost) from all ants this iteration
-
-        if iteration == 0 or (iteration+1) % 10 == 0:
-            print(f"\nACO: Iteration {iteration+1}/{num_iterations}")
-
-        for ant_idx in range(num_ants):
-            ant_parcels_to_visit = set(parcel_idx_to_id.keys()) # Set of parcel indices (1 to N)
-            ant_solution_routes_parcels = [] # List of lists of parcel objects for this ant's solution
-            ant_solution_total_distance = 0.0
-
-            while ant_parcels_to_visit:
-                current_single_route_parcel_objects = []
-                current_location_idx = 0 # Start at Warehouse
-                
-                # Try to build one route
-                while True:
-                    eligible_next_parcel_indices = []
-                    for p_idx in ant_parcels_to_visit:
-                        parcel_obj = parcel_map[parcel_idx_to_id[p_idx]]
-                        
-                        # Tentatively add this parcel to the current_single_route
-                        temp_route_parcels = current_single_route_parcel_objects + [parcel_obj]
-                        
-                        # Check feasibility with generic constraints
-                        is_feasible_addition, feasibility_details = _calculate_route_schedule_and_feasibility(
-                            temp_route_parcels, generic_constraints, warehouse_coords, params, parcel_map
-                        )
-                        if iteration == 0 and ant_idx == 0 and not is_feasible_addition:
-                            parcel_obj = parcel_map[parcel_idx_to_id[p_idx]]
-                            print(f"    [DEBUG] Could not add parcel {p_idx} ({parcel_obj['id']}) to empty route.")
-                            print(f"    [DEBUG] Parcel details: weight={parcel_obj['weight']}, coords={parcel_obj['coordinates_x_y']}, TW={parcel_obj.get('time_window_open')}-{parcel_obj.get('time_window_close')}")
-                            print(f"    [DEBUG] Fail reason: {feasibility_details.get('reason', 'Unknown')}")
-                        if is_feasible_addition:
-                            eligible_next_parcel_indices.append(p_idx)
-                    
-                    if not eligible_next_parcel_indices:
-                        if iteration == 0:
-                            print(f"  Ant {ant_idx}: No eligible parcels left to add to route. Current route has {len(current_single_route_parcel_objects)} parcels.")
-                        print(f"    [DEBUG] No eligible parcels to add. Current route weight: {sum(p['weight'] for p in current_single_route_parcel_objects)}")
-                        break # Cannot add more parcels to this route
-
-                    # Calculate probabilities
-                    probs = []
-                    total_prob_sum = 0.0
-                    for next_p_idx in eligible_next_parcel_indices:
-                        pheromone = pheromone_matrix[current_location_idx][next_p_idx]
-                        distance = dist_matrix[current_location_idx][next_p_idx]
-                        heuristic = 1.0 / (distance + 1e-6) # Add epsilon to avoid div by zero
-                        
-                        prob_val = (pheromone ** alpha) * (heuristic ** beta)
-                        probs.append({"idx": next_p_idx, "prob": prob_val})
-                        total_prob_sum += prob_val
-                    
-                    if total_prob_sum == 0: # No way to move, or all probs are zero
-                        break 
-
-                    # Normalize probabilities and select next parcel
-                    for p_info in probs:
-                        p_info["prob"] /= total_prob_sum
-                    
-                    # Roulette wheel selection
-                    r = random.random()
-                    cumulative_prob = 0.0
-                    selected_parcel_idx = -1
-                    for p_info in probs:
-                        cumulative_prob += p_info["prob"]
-                        if r <= cumulative_prob:
-                            selected_parcel_idx = p_info["idx"]
-                            break
-                    if selected_parcel_idx == -1 and probs: # Should not happen if probs sum to 1
-                         selected_parcel_idx = probs[-1]["idx"]
-
-
-                    if selected_parcel_idx != -1:
-                        selected_parcel_obj = parcel_map[parcel_idx_to_id[selected_parcel_idx]]
-                        current_single_route_parcel_objects.append(selected_parcel_obj)
-                        ant_parcels_to_visit.remove(selected_parcel_idx)
-                        current_location_idx = selected_parcel_idx
-                    else: # No parcel could be selected
-                        break 
-                
-                if current_single_route_parcel_objects:
-                    # Final check and details for this constructed route
-                    is_valid_final, route_generic_details = _calculate_route_schedule_and_feasibility(
-                        current_single_route_parcel_objects, generic_constraints, warehouse_coords, params, parcel_map
-                    )
-                    if is_valid_final:
-                        ant_solution_routes_parcels.append(current_single_route_parcel_objects)
-                        ant_solution_total_distance += route_generic_details["total_distance"]
-                    else:
-                        # Failed route, put parcels back (simplistic, could be smarter)
-                        for p_obj_failed in current_single_route_parcel_objects:
-                            ant_parcels_to_visit.add(parcel_id_to_idx[p_obj_failed["id"]])
-                else: # No parcels could be added to start a new route
-                    if not ant_parcels_to_visit: # All parcels assigned
-                        pass
-                    else: # Parcels remaining, but cannot form a new route from WH
-                        if iteration == 0:
-                            print(f"  Ant {ant_idx}: Could not start new route with remaining parcels: {ant_parcels_to_visit}")
-                        break # Stop trying to build routes for this ant
-
-
-            iteration_solutions.append({
-                "routes_parcels": ant_solution_routes_parcels, 
-                "cost": ant_solution_total_distance,
-                "unassigned_count": len(ant_parcels_to_visit)
-            })
-
-        # Update pheromones
-        # 1. Evaporation
-        for r in range(num_nodes):
-            for c in range(num_nodes):
-                pheromone_matrix[r][c] *= (1.0 - evaporation_rate)
-        
-        # 2. Deposition (based on all ants' solutions this iteration)
-        for sol in iteration_solutions:
-            if sol["cost"] == 0: continue # Avoid division by zero for empty solutions
-            pheromone_to_add = effective_pheromone_deposit_q / sol["cost"]
-            for route_p_list in sol["routes_parcels"]:
-                path_indices = [0] # Start at WH
-                for p_obj in route_p_list:
-                    path_indices.append(parcel_id_to_idx[p_obj["id"]])
-                path_indices.append(0) # End at WH
-                
-                for i in range(len(path_indices) - 1):
-                    u, v = path_indices[i], path_indices[i+1]
-                    pheromone_matrix[u][v] += pheromone_to_add
-                    pheromone_matrix[v][u] += pheromone_to_add # Symmetric
-
-        # Log iteration results
-        if iteration == 0 or (iteration+1) % 10 == 0:
-            best_iter_unassigned = min(sol["unassigned_count"] for sol in iteration_solutions) if iteration_solutions else num_parcels
-            print(f"ACO: Iter {iteration+1}: Best unassigned={best_iter_unassigned}/{num_parcels}")
-
-        # Update global best solution
-        # Prioritize fewer unassigned parcels, then lower cost
-        for sol in iteration_solutions:
-            if sol["unassigned_count"] < global_best_unassigned_count:
-                global_best_unassigned_count = sol["unassigned_count"]
-                global_best_solution_cost = sol["cost"]
-                global_best_solution_routes_parcels = sol["routes_parcels"]
-            elif sol["unassigned_count"] == global_best_unassigned_count:
-                if sol["cost"] < global_best_solution_cost:
+    with worker_pool as pool:
+        for iteration in range(num_iterations):
+            if iteration == 0 or (iteration+1) % 10 == 0:
+                print(f"\nACO: Iteration {iteration+1}/{num_iterations}")
+
+            # Attractiveness tau^alpha * eta^beta of every move: the pheromone snapshot the ants build against
+            attractiveness_matrix = np.power(pheromone_matrix, alpha) * heuristic_matrix
+            # Every ant gets its own seed, so the solutions do not depend on the number of workers
+            ants = [(ant_idx, random.getrandbits(64)) for ant_idx in range(num_ants)]
+
+            # Store solutions (routes path, cost) from all ants this iteration, in ant order
+            if pool is None:
+                iteration_solutions = _construct_ant_solutions((iteration, attractiveness_matrix, ants),
+                                                               instance, generic_profile, candidate_lists)
+            else:
+                block_size = -(-num_ants // pool.num_workers)
+                ant_blocks = [(iteration, attractiveness_matrix, ants[i:i + block_size]) for i in range(0, num_ants, block_size)]
+                iteration_solutions = [sol for block_solutions in pool.map(ant_blocks) for sol in block_solutions]
+
+            # Update pheromones
+            # 1. Evaporation
+            pheromone_matrix *= (1.0 - evaporation_rate)
+            # 2. Deposition (based on all ants' solutions this iteration)
+            _deposit_pheromone(pheromone_matrix, iteration_solutions, effective_pheromone_deposit_q)
+
+            # Log iteration results
+            if iteration == 0 or (iteration+1) % 10 == 0:
+                best_iter_unassigned = min(sol["unassigned_count"] for sol in iteration_solutions) if iteration_solutions else num_parcels
+                print(f"ACO: Iter {iteration+1}: Best unassigned={best_iter_unassigned}/{num_parcels}")
+
+            # Update global best solution
+            # Prioritize fewer unassigned parcels, then lower cost
+            for sol in iteration_solutions:
+                if sol["unassigned_count"] < global_best_unassigned_count:
+                    global_best_unassigned_count = sol["unassigned_count"]
                     global_best_solution_cost = sol["cost"]
-                    global_best_solution_routes_parcels = sol["routes_parcels"]
-    
-    # --- Assignment of globally best routes to specific delivery agents ---
+                    global_best_solution_path = sol["path"]
+                elif sol["unassigned_count"] == global_best_unassigned_count:
+                    if sol["cost"] < global_best_solution_cost:
+                        global_best_solution_cost = sol["cost"]
+                        global_best_solution_path = sol["path"]
+
+            # 3. MAX-MIN bounds from the best solution so far (none until it has a non-zero cost)
+            if use_max_min_bounds and 0 < global_best_solution_cost < float('inf'):
+                tau_min, tau_max = _max_min_pheromone_bounds(global_best_solution_cost, effective_pheromone_deposit_q,
+                                                             evaporation_rate, num_parcels, p_best)
+                np.clip(pheromone_matrix, tau_min, tau_max, out=pheromone_matrix)
+
+    global_best_solution_routes_parcels = [] # List of lists of parcel objects
+    if global_best_solution_path is not None:
+        global_best_solution_routes_parcels = [[instance.parcel_of(p_idx) for p_idx in route]
+                                               for route in _path_routes(global_best_solution_path)]
+        # --- Assignment of globally best routes to specific delivery agents ---
     print(f"\nACO: Starting agent assignment with {len(global_best_solution_routes_parcels)} best routes")
     optimised_routes_output = []
     assigned_parcels_globally_ids = set()
@@ -528,8 +603,7 @@ def run_optimisation(config_data, params):
                 route_parcel_obj_list,
                 agent_config, # Specific agent constraints
                 warehouse_coords,
-                params,
-                parcel_map 
+                instance
             )
             if is_feasible_for_agent:
                 print(f"    -> FEASIBLE - Assigned to agent {agent_config['id']}")
@@ -546,7 +620,7 @@ def run_optimisation(config_data, params):
             
             # Parcels in this route (IDs and full details)
             current_route_parcel_ids = [p["id"] for p in route_parcel_obj_list]
-            current_route_parcels_details = [copy.deepcopy(p) for p in route_parcel_obj_list] # Get full details
+            current_route_parcels_details = list(route_parcel_obj_list) # Full details
             for p_id in current_route_parcel_ids:
                 assigned_parcels_globally_ids.add(p_id)
 
@@ -564,7 +638,7 @@ def run_optimisation(config_data, params):
             })
 
     final_unassigned_parcel_ids = [p["id"] for p in all_parcels_list if p["id"] not in assigned_parcels_globally_ids]
-    final_unassigned_parcels_details = [copy.deepcopy(parcel_map[p_id]) for p_id in final_unassigned_parcel_ids]
+    final_unassigned_parcels_details = [p for p in all_parcels_list if p["id"] not in assigned_parcels_globally_ids]
     
     message = f"ACO completed. Iterations: {iteration+1}/{num_iterations}. Best cost: {global_best_solution_cost:.2f}. Unassigned: {len(final_unassigned_parcel_ids)}"
     if not global_best_solution_routes_parcels and all_parcels_list : # No routes formed at all
@@ -1,12 +1,17 @@
-import math
+import os
 import random
-import copy
 import numpy as np
 import torch
 import torch.nn as nn
 import torch.optim as optim
-from collections import deque
 import torch.nn.functional as F
+from packages.optimisation.backend.routing_core import build_problem_instance, WAREHOUSE_NODE
+from packages.optimisation.backend.checkpoint_store import CheckpointStore, parameter_fingerprint
+
+# Parameters that shape what the network learns; checkpoints trained with the same values
+# (and the same state/action sizes) are the preferred warm start
+CHECKPOINT_FINGERPRINT_PARAMS = ("action_space", "learning_rate", "gamma_discount_factor", "batch_size",
+                                 "target_update_frequency", "prioritised_replay")
 
 # --- DQN Model and Replay Buffer ---
 class DQN(nn.Module):
@@ -23,18 +28,117 @@ class DQN(nn.Module):
         x = F.relu(self.fc3(x))
         return self.fc4(x)
 
+class FactorisedDQN(nn.Module):
+    """
+    Parcel-then-agent Q-network: parcel_values scores every parcel for a state, agent_values
+    scores every agent for a chosen parcel (through a learned parcel embedding). One decision
+    evaluates num_parcels + num_agents outputs instead of num_parcels * num_agents.
+    """
+    def __init__(self, input_size, num_parcels, num_agents, parcel_embedding_size=32):
+        super(FactorisedDQN, self).__init__()
+        self.fc1 = nn.Linear(input_size, 128)
+        self.fc2 = nn.Linear(128, 256)
+        self.fc3 = nn.Linear(256, 128)
+        self.parcel_head = nn.Linear(128, num_parcels)
+        self.parcel_embedding = nn.Embedding(num_parcels, parcel_embedding_size)
+        self.agent_fc = nn.Linear(128 + parcel_embedding_size, 128)
+        self.agent_head = nn.Linear(128, num_agents)
+
+    # Exported so they stay callable on the TorchScript policy
+    @torch.jit.export
+    def encode(self, x):
+        x = F.relu(self.fc1(x))
+        x = F.relu(self.fc2(x))
+        return F.relu(self.fc3(x))
+
+    @torch.jit.export
+    def parcel_values(self, features):
+        return self.parcel_head(features)
+
+    @torch.jit.export
+    def agent_values(self, features, parcels):
+        x = torch.cat([features, self.parcel_embedding(parcels)], dim=1)
+        return self.agent_head(F.relu(self.agent_fc(x)))
+
+    def forward(self, x, parcels):
+        features = self.encode(x)
+        return self.parcel_values(features), self.agent_values(features, parcels)
+
 class ReplayBuffer:
-    def __init__(self, capacity):
-        self.buffer = deque(maxlen=capacity)
-    
+    """
+    Ring buffer of transitions in preallocated NumPy arrays. Batches are drawn as index arrays
+    into reused batch arrays, which torch.from_numpy wraps without copying.
+    With prioritised set, transitions are drawn in proportion to priority ** alpha (new ones at
+    the highest priority seen so far) and sample() also returns importance-sampling weights.
+    """
+
+    def __init__(self, capacity, state_size, prioritised=False, alpha=0.6, beta=0.4):
+        self.capacity = capacity
+        self.states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.actions = np.zeros(capacity, dtype=np.int64)
+        self.rewards = np.zeros(capacity, dtype=np.float32)
+        self.next_states = np.zeros((capacity, state_size), dtype=np.float32)
+        self.dones = np.zeros(capacity, dtype=np.float32) # 0.0 for not done, 1.0 for done
+        self.prioritised = prioritised
+        self.alpha = alpha
+        self.beta = beta
+        self.priorities = np.zeros(capacity, dtype=np.float64) if prioritised else None # Already ** alpha
+        self.max_priority = 1.0
+        self.rng = np.random.default_rng(random.getrandbits(64))
+        self._position = 0
+        self._size = 0
+        self._batch = None
+
     def push(self, state, action, reward, next_state, done):
-        self.buffer.append((state, action, reward, next_state, done))
-    
+        self.push_batch(state[None], [action], [reward], next_state[None], [done])
+
+    def push_batch(self, states, actions, rewards, next_states, dones):
+        """Writes one transition per row of the batch arrays, overwriting the oldest when full."""
+        indices = (self._position + np.arange(len(states))) % self.capacity
+        self.states[indices] = states
+        self.actions[indices] = actions
+        self.rewards[indices] = rewards
+        self.next_states[indices] = next_states
+        self.dones[indices] = dones
+        if self.prioritised:
+            self.priorities[indices] = self.max_priority ** self.alpha
+        self._position = (self._position + len(states)) % self.capacity
+        self._size = min(self._size + len(states), self.capacity)
+
     def sample(self, batch_size):
-        return random.sample(self.buffer, batch_size)
+        """
+        Returns (indices, states, actions, rewards, next_states, dones, weights) for a batch, as
+        tensors over the reused batch arrays (valid until the next sample). weights is None
+        unless prioritised.
+        """
+        if self.prioritised:
+            cumulative = np.cumsum(self.priorities[:self._size])
+            indices = np.searchsorted(cumulative, self.rng.random(batch_size) * cumulative[-1], side="right")
+            np.minimum(indices, self._size - 1, out=indices)
+            weights = (self._size * self.priorities[indices] / cumulative[-1]) ** -self.beta
+            weights = torch.from_numpy((weights / weights.max()).astype(np.float32))
+        else:
+            indices = self.rng.integers(0, self._size, batch_size)
+            weights = None
+
+        if self._batch is None or len(self._batch[1]) != batch_size:
+            self._batch = (np.empty((batch_size, self.states.shape[1]), dtype=np.float32),
+                           np.empty(batch_size, dtype=np.int64),
+                           np.empty(batch_size, dtype=np.float32),
+                           np.empty((batch_size, self.states.shape[1]), dtype=np.float32),
+                           np.empty(batch_size, dtype=np.float32))
+        for source, batch_array in zip((self.states, self.actions, self.rewards, self.next_states, self.dones), self._batch):
+            np.take(source, indices, axis=0, out=batch_array)
+        return (indices,) + tuple(torch.from_numpy(batch_array) for batch_array in self._batch) + (weights,)
+
+    def update_priorities(self, indices, td_errors):
+        """Sets the priorities of sampled transitions from their absolute TD errors."""
+        priorities = np.abs(td_errors) + 1e-6
+        self.priorities[indices] = priorities ** self.alpha
+        self.max_priority = max(self.max_priority, float(priorities.max()))
     
     def __len__(self):
-        return len(self.buffer)
+        return self._size
 
 # --- Optimisation Script Interface ---
 def get_params_schema():
@@ -85,6 +189,31 @@ def get_params_schema():
                 "default": 5000, "min": 1000, "max": 50000, "step": 1000, # Reduced default
                 "help": "Maximum size of the experience replay buffer."
             },
+            {
+                "name": "prioritised_replay", "label": "Prioritised Replay", "type": "boolean",
+                "default": False,
+                "help": "Sample transitions in proportion to their TD error instead of uniformly."
+            },
+            {
+                "name": "priority_alpha", "label": "Priority Exponent (α)", "type": "float",
+                "default": 0.6, "min": 0.0, "max": 1.0, "step": 0.05,
+                "help": "How strongly prioritised replay favours large TD errors (0 = uniform)."
+            },
+            {
+                "name": "priority_beta", "label": "Importance Sampling Exponent (β)", "type": "float",
+                "default": 0.4, "min": 0.0, "max": 1.0, "step": 0.05,
+                "help": "Strength of the importance-sampling correction for prioritised replay."
+            },
+            {
+                "name": "action_space", "label": "Action Space", "type": "selectbox",
+                "default": "joint", "options": ["joint", "factorised"],
+                "help": "joint: one output per (parcel, agent) pair. factorised: one head picks the parcel, a second picks the agent for it, so the network grows with parcels + agents instead of parcels x agents."
+            },
+            {
+                "name": "parallel_envs", "label": "Parallel Environments", "type": "integer",
+                "default": 1, "min": 1, "max": 64, "step": 1,
+                "help": "Episodes run in lockstep, with one batched forward pass per step for their actions."
+            },
             {
                 "name": "time_per_distance_unit", "label": "Time per distance unit (min)", "type": "float",
                 "default": 1.0, "min": 0.1, "step": 0.1,
@@ -100,21 +229,35 @@ def get_params_schema():
                 "type": "boolean",
                 "default": True,
                 "help": "Whether vehicles must return to warehouse after deliveries (for scheduling)."
+            },
+            {
+                "name": "checkpoint_mode",
+                "label": "Policy Checkpoints",
+                "type": "selectbox",
+                "default": "off",
+                "options": ["off", "save", "warm_start", "inference_only"],
+                "help": "Checkpoints are kept in the checkpoints/ folder, per state/action size. save: train from scratch and save the trained policy (with a TorchScript export for inference). warm_start: start training from the closest saved policy, then save. inference_only: skip training and assign greedily with the closest saved policy, preferring its TorchScript export (trains and saves if none exists)."
+            },
+            {
+                "name": "inference_threads", "label": "Inference Threads", "type": "integer",
+                "default": 1, "min": 1, "max": 32, "step": 1,
+                "help": "Intra-op threads for the greedy inference_only rollout (small networks run fastest on one thread)."
             }
         ]
     }
 
 # --- Helper Functions ---
-def _calculate_distance(coord1, coord2):
-    return math.sqrt((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)
-
-def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_config, warehouse_coords, params):
+def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_config, warehouse_coords, params, instance):
     """
     Calculates detailed schedule for a given sequence of parcels for a specific agent.
     Checks feasibility against agent's capacity, operating hours, and parcel time windows.
     """
-    time_per_dist_unit = params.get("time_per_distance_unit", 1.0)
-    default_service_time = params.get("default_service_time", 10)
+    distance_rows = instance.as_list("distance")
+    travel_time_rows = instance.as_list("travel_time")
+    weights = instance.as_list("weights")
+    tw_open = instance.as_list("tw_open")
+    tw_close = instance.as_list("tw_close")
+    service_times = instance.as_list("service_times")
     should_return_to_warehouse = params.get("return_to_warehouse", True)
 
     agent_capacity = agent_config["capacity_weight"]
@@ -127,7 +270,7 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_conf
     departure_times = [round(agent_op_start)]
 
     current_time = agent_op_start
-    current_location = list(warehouse_coords)
+    current_node = WAREHOUSE_NODE
     current_load = 0
     total_distance = 0.0
 
@@ -143,18 +286,17 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_conf
 
 
     for p_obj in ordered_parcel_objects:
-        p_coords = p_obj["coordinates_x_y"]
-        p_weight = p_obj["weight"]
-        p_service_time = p_obj.get("service_time", default_service_time)
-        p_tw_open = p_obj.get("time_window_open", 0)
-        p_tw_close = p_obj.get("time_window_close", 1439) # Default to full day
+        p_node = instance.node_of(p_obj["id"])
+        p_weight = weights[p_node]
+        p_service_time = service_times[p_node]
+        p_tw_open = tw_open[p_node]
+        p_tw_close = tw_close[p_node]
 
         current_load += p_weight
         if current_load > agent_capacity: return False, {} # Exceeds capacity
 
-        dist_to_parcel = _calculate_distance(current_location, p_coords)
-        total_distance += dist_to_parcel
-        travel_time = dist_to_parcel * time_per_dist_unit
+        total_distance += distance_rows[current_node][p_node]
+        travel_time = travel_time_rows[current_node][p_node]
         
         arrival_at_parcel = current_time + travel_time
         service_start_time = max(arrival_at_parcel, p_tw_open)
@@ -166,17 +308,16 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_conf
         if service_end_time > agent_op_end: return False, {} # Service ends too late for agent
 
         route_stop_ids.append(p_obj["id"])
-        route_stop_coordinates.append(list(p_coords))
+        route_stop_coordinates.append(list(p_obj["coordinates_x_y"]))
         arrival_times.append(round(arrival_at_parcel))
         departure_times.append(round(service_end_time))
         
         current_time = service_end_time
-        current_location = list(p_coords)
+        current_node = p_node
 
     if should_return_to_warehouse:
-        dist_to_warehouse = _calculate_distance(current_location, warehouse_coords)
-        total_distance += dist_to_warehouse
-        travel_time_to_wh = dist_to_warehouse * time_per_dist_unit
+        total_distance += distance_rows[current_node][WAREHOUSE_NODE]
+        travel_time_to_wh = travel_time_rows[current_node][WAREHOUSE_NODE]
         arrival_at_warehouse_final = current_time + travel_time_to_wh
 
         if arrival_at_warehouse_final > agent_op_end: return False, {} # Return to WH too late
@@ -196,156 +337,274 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_conf
     }
 
 
-def _get_initial_state(parcels_cfg, agents_cfg):
-    state = {
-        "parcels_status": [ # 0: unassigned, 1: assigned
-            0 for _ in parcels_cfg
-        ],
-        "parcels_assigned_to_agent_idx": [ # -1 if unassigned
-            -1 for _ in parcels_cfg
-        ],
-        "agents_remaining_capacity": [
-            agent["capacity_weight"] for agent in agents_cfg
-        ],
-        # Potentially add current agent locations if routing was part of DQN state
-        # For now, DQN focuses on assignment.
-    }
-    return state
+class AssignmentEnvironment:
+    """
+    Parcel-to-agent assignment episode held in NumPy arrays. The state vector and the valid
+    action mask are updated in place after each action (O(agents) per step, plus an amortised
+    trim of the agent's mask column), and state_vector/valid_actions_mask are views into them.
+    """
 
-def _state_to_vector(state, num_parcels, num_agents, max_cap_overall, max_weight_overall, max_coord_overall, parcels_config_info):
-    """Normalized state vector for DQN input."""
-    # Features:
-    # 1. For each parcel: assigned_status (0/1), assigned_agent_idx_norm (-1 to 1 after norm), weight_norm, x_norm, y_norm
-    # 2. For each agent: remaining_capacity_norm
-    
-    # Parcel features
-    parcel_features = []
-    for i in range(num_parcels):
-        parcel_features.append(state["parcels_status"][i]) # 0 or 1
-        
-        # Normalize assigned_agent_idx: map [-1, num_agents-1] to roughly [-1, 1]
-        # -1 (unassigned) -> -1. Others (0 to N-1) -> map to [0,1] then scale to avoid -1 overlap if needed
-        # Simpler: if assigned, agent_idx / (num_agents-1) if num_agents > 1 else 0.5. If unassigned, -1.
-        # For NN, better to use one-hot encoding for assigned agent, or separate flags.
-        # Here, let's use a simple normalized version of agent_idx, and status flag.
-        assigned_agent_norm = -1.0 
-        if state["parcels_assigned_to_agent_idx"][i] != -1:
-            if num_agents > 1:
-                assigned_agent_norm = state["parcels_assigned_to_agent_idx"][i] / (num_agents - 1.0)
-            elif num_agents == 1: # Only one agent
-                assigned_agent_norm = 0.0 # or 1.0, to distinguish from -1
-
-        parcel_features.append(assigned_agent_norm)
-        parcel_features.append(parcels_config_info[i]["weight"] / max_weight_overall if max_weight_overall > 0 else 0)
-        parcel_features.append(parcels_config_info[i]["coordinates_x_y"][0] / max_coord_overall if max_coord_overall > 0 else 0)
-        parcel_features.append(parcels_config_info[i]["coordinates_x_y"][1] / max_coord_overall if max_coord_overall > 0 else 0)
-
-    # Agent features
-    agent_features = [cap / max_cap_overall if max_cap_overall > 0 else 0 for cap in state["agents_remaining_capacity"]]
-    
-    # Combine and flatten
-    flat_vector = np.array(parcel_features + agent_features, dtype=np.float32)
-    return flat_vector
+    def __init__(self, instance, max_cap_overall, max_weight_overall, max_coord_overall):
+        num_parcels = instance.num_parcels
+        num_agents = instance.num_agents
+        self.num_parcels = num_parcels
+        self.num_agents = num_agents
+        self.parcel_weights = np.asarray(instance.weights[1:], dtype=np.float64)
+        self.agent_capacities = np.asarray(instance.agent_capacities, dtype=np.float64)
+        self.max_cap_overall = max_cap_overall
+        # Parcels in ascending weight order: the parcels an agent can still take are a prefix of it
+        self.parcels_by_weight = np.argsort(self.parcel_weights, kind="stable")
+        self.sorted_weights = self.parcel_weights[self.parcels_by_weight]
+
+        # Normalized state vector for DQN input:
+        # 1. For each parcel: assigned_status (0/1), assigned_agent_idx_norm (-1 if unassigned,
+        #    else agent_idx / (num_agents - 1), or 0 with one agent), weight_norm, x_norm, y_norm
+        # 2. For each agent: remaining_capacity_norm
+        self._vector = np.zeros(num_parcels * 5 + num_agents, dtype=np.float32)
+        self._parcel_features = self._vector[:num_parcels * 5].reshape(num_parcels, 5)
+        self._agent_features = self._vector[num_parcels * 5:]
+        self._static_parcel_features = np.zeros((num_parcels, 3), dtype=np.float32)
+        if max_weight_overall > 0:
+            self._static_parcel_features[:, 0] = self.parcel_weights / max_weight_overall
+        if max_coord_overall > 0:
+            self._static_parcel_features[:, 1:] = instance.matrices.coordinates[1:] / max_coord_overall
+        # Normalized assigned agent index per agent
+        self._agent_norm = (np.arange(num_agents) / (num_agents - 1.0) if num_agents > 1
+                            else np.zeros(num_agents))
+
+        self._mask = np.zeros((num_parcels, num_agents), dtype=bool) # Action p * num_agents + a
+        self.reset()
+
+    def reset(self):
+        """Starts a new episode: every parcel unassigned, every agent at full capacity."""
+        self.parcels_status = np.zeros(self.num_parcels, dtype=np.int8) # 0: unassigned, 1: assigned
+        self.parcels_assigned_to_agent_idx = np.full(self.num_parcels, -1, dtype=np.int64) # -1 if unassigned
+        self.agents_remaining_capacity = self.agent_capacities.copy()
+        self.num_unassigned = self.num_parcels
+
+        self._parcel_features[:, 0] = 0.0
+        self._parcel_features[:, 1] = -1.0
+        self._parcel_features[:, 2:] = self._static_parcel_features
+        self._agent_features[:] = self.agent_capacities / self.max_cap_overall if self.max_cap_overall > 0 else 0
+
+        # Valid actions: parcel unassigned AND agent has capacity for it
+        self._weight_cutoffs = np.searchsorted(self.sorted_weights, self.agents_remaining_capacity, side="right")
+        np.less_equal(self.parcel_weights[:, None], self.agents_remaining_capacity[None, :], out=self._mask)
+        self.num_valid_actions = int(np.count_nonzero(self._mask))
+
+    @property
+    def state_vector(self):
+        return self._vector
+
+    @property
+    def valid_actions_mask(self):
+        return self._mask.reshape(-1)
+
+    @property
+    def done(self):
+        return self.num_unassigned == 0
+
+    def valid_parcels_mask(self):
+        """Parcels with at least one valid action: unassigned and within some agent's remaining capacity."""
+        return (self.parcels_status == 0) & (self.parcel_weights <= self.agents_remaining_capacity.max())
+
+    def valid_agents_mask(self, parcel_idx):
+        """Agents that can take parcel_idx (its row of the valid action mask)."""
+        return self._mask[parcel_idx]
+
+    def assignment(self):
+        """Copy of the current assignment (for keeping the best episode's end state)."""
+        return {
+            "parcels_status": self.parcels_status.copy(),
+            "parcels_assigned_to_agent_idx": self.parcels_assigned_to_agent_idx.copy()
+        }
 
+    def step(self, action_idx):
+        """
+        Applies action (assign parcel action_idx // num_agents to agent action_idx % num_agents)
+        and returns (reward, done) for this step.
+        """
+        parcel_idx, agent_idx = divmod(int(action_idx), self.num_agents)
+
+        # Check if action is valid (should be pre-filtered by mask, but double check)
+        if self.parcels_status[parcel_idx] == 1: # Already assigned
+            return -100, self.done # Heavy penalty for trying to reassign (should not happen with mask)
+
+        parcel_weight = self.parcel_weights[parcel_idx]
+        if self.agents_remaining_capacity[agent_idx] < parcel_weight:
+            return -50, self.done # Penalty for attempting infeasible assignment (should be caught by mask)
+
+        self.parcels_status[parcel_idx] = 1
+        self.parcels_assigned_to_agent_idx[parcel_idx] = agent_idx
+        self.num_unassigned -= 1
+        remaining_capacity = self.agents_remaining_capacity[agent_idx] - parcel_weight
+        self.agents_remaining_capacity[agent_idx] = remaining_capacity
+
+        self._parcel_features[parcel_idx, 0] = 1.0
+        self._parcel_features[parcel_idx, 1] = self._agent_norm[agent_idx]
+        if self.max_cap_overall > 0:
+            self._agent_features[agent_idx] = remaining_capacity / self.max_cap_overall
+
+        parcel_row = self._mask[parcel_idx]
+        self.num_valid_actions -= int(np.count_nonzero(parcel_row))
+        parcel_row[:] = False
+        # Parcels now heavier than the agent's remaining capacity leave its column
+        cutoff = int(np.searchsorted(self.sorted_weights, remaining_capacity, side="right"))
+        dropped = self.parcels_by_weight[cutoff:self._weight_cutoffs[agent_idx]]
+        if len(dropped):
+            self.num_valid_actions -= int(np.count_nonzero(self._mask[dropped, agent_idx]))
+            self._mask[dropped, agent_idx] = False
+        self._weight_cutoffs[agent_idx] = cutoff
 
-def _select_action(state_vector, policy_net, epsilon, n_total_actions, valid_actions_mask):
-    if random.random() < epsilon:
-        # Exploration: choose random valid action
-        valid_indices = [i for i, valid in enumerate(valid_actions_mask) if valid]
-        return random.choice(valid_indices) if valid_indices else -1 # -1 if no valid action
-    
-    # Exploitation
-    with torch.no_grad():
-        state_tensor = torch.from_numpy(state_vector).unsqueeze(0)
-        q_values = policy_net(state_tensor).squeeze(0).numpy()
-        
-        masked_q = q_values.copy()
-        masked_q[~valid_actions_mask] = -np.inf # Mask out invalid actions
-        
-        if np.all(np.isinf(masked_q)): # All actions are invalid or lead to -inf
-            return -1 # No valid action
-        return np.argmax(masked_q)
+        reward = 20 # Positive reward for successful assignment
+        done = self.done
+        if done:
+            reward += 100 # Bonus for completing all assignments
+            # Further reward/penalty based on quality of full solution could be added here,
+            # but that requires building and evaluating routes, which is costly per step.
+            # Current reward is step-based. Final solution quality check is done outside training loop.
+        return reward, done
 
 
-def _apply_action_and_get_reward(current_state, action_idx, parcels_cfg, agents_cfg, params):
+def _select_actions(state_batch, policy_net, epsilon, envs):
     """
-    Applies action, calculates reward for this step.
-    Action: assign parcel_idx_in_list to agent_idx_in_list.
-    Returns (next_state, reward, done)
+    Epsilon-greedy action for the state of each environment (-1 where there is no valid action).
+    The exploiting states share one forward pass.
     """
-    num_parcels = len(parcels_cfg)
-    num_agents = len(agents_cfg)
-
-    parcel_to_assign_idx = action_idx // num_agents
-    agent_to_assign_to_idx = action_idx % num_agents
-
-    next_state = copy.deepcopy(current_state)
-    reward = 0
-    
-    # Check if action is valid in current_state context (should be pre-filtered by mask, but double check)
-    if next_state["parcels_status"][parcel_to_assign_idx] == 1: # Already assigned
-        reward = -100 # Heavy penalty for trying to reassign (should not happen with mask)
-        done = all(s == 1 for s in next_state["parcels_status"])
-        return next_state, reward, done
-
-    parcel_obj = parcels_cfg[parcel_to_assign_idx]
-    if next_state["agents_remaining_capacity"][agent_to_assign_to_idx] >= parcel_obj["weight"]:
-        # Valid assignment
-        next_state["parcels_status"][parcel_to_assign_idx] = 1
-        next_state["parcels_assigned_to_agent_idx"][parcel_to_assign_idx] = agent_to_assign_to_idx
-        next_state["agents_remaining_capacity"][agent_to_assign_to_idx] -= parcel_obj["weight"]
-        reward = 20 # Positive reward for successful assignment
-    else:
-        # Invalid assignment (capacity) - should be caught by mask
-        reward = -50 # Penalty for attempting infeasible assignment
-    
-    done = all(s == 1 for s in next_state["parcels_status"])
-    
-    # Bonus for completing all assignments
-    if done:
-        reward += 100
-        # Further reward/penalty based on quality of full solution could be added here,
-        # but that requires building and evaluating routes, which is costly per step.
-        # Current reward is step-based. Final solution quality check is done outside training loop.
-
-    return next_state, reward, done
+    valid_actions_masks = [env.valid_actions_mask for env in envs]
+    actions = np.full(len(state_batch), -1, dtype=np.int64)
+    exploit_rows = []
+    for row, valid_actions_mask in enumerate(valid_actions_masks):
+        if random.random() < epsilon:
+            # Exploration: choose random valid action
+            valid_indices = np.flatnonzero(valid_actions_mask)
+            if len(valid_indices):
+                actions[row] = random.choice(valid_indices)
+        else:
+            exploit_rows.append(row)
+
+    if exploit_rows:
+        # Exploitation
+        with torch.no_grad():
+            q_values = policy_net(torch.from_numpy(state_batch[exploit_rows])).numpy()
+        q_values[~np.stack([valid_actions_masks[row] for row in exploit_rows])] = -np.inf # Mask out invalid actions
+        best_actions = q_values.argmax(axis=1)
+        # All actions are invalid or lead to -inf: no valid action
+        has_valid_action = q_values[np.arange(len(exploit_rows)), best_actions] > -np.inf
+        actions[exploit_rows] = np.where(has_valid_action, best_actions, -1)
+    return actions
+
+
+def _select_factorised_actions(state_batch, policy_net, epsilon, envs):
+    """
+    _select_actions for a FactorisedDQN: the parcel is chosen first (from the valid parcels),
+    then the agent for it. Returns joint action indices (parcel * num_agents + agent).
+    """
+    num_agents = envs[0].num_agents
+    actions = np.full(len(state_batch), -1, dtype=np.int64)
+    exploit_rows = []
+    for row, env in enumerate(envs):
+        if random.random() < epsilon:
+            # Exploration: random valid parcel, then random agent that can take it
+            valid_parcels = np.flatnonzero(env.valid_parcels_mask())
+            if len(valid_parcels):
+                parcel_idx = random.choice(valid_parcels)
+                actions[row] = parcel_idx * num_agents + random.choice(np.flatnonzero(env.valid_agents_mask(parcel_idx)))
+        else:
+            exploit_rows.append(row)
+
+    if exploit_rows:
+        # Exploitation
+        exploit_envs = [envs[row] for row in exploit_rows]
+        with torch.no_grad():
+            features = policy_net.encode(torch.from_numpy(state_batch[exploit_rows]))
+            parcel_q = policy_net.parcel_values(features).numpy()
+            parcel_q[~np.stack([env.valid_parcels_mask() for env in exploit_envs])] = -np.inf
+            parcels = parcel_q.argmax(axis=1)
+            agent_q = policy_net.agent_values(features, torch.from_numpy(parcels)).numpy()
+        agent_q[~np.stack([env.valid_agents_mask(parcel_idx) for env, parcel_idx in zip(exploit_envs, parcels)])] = -np.inf
+        agents = agent_q.argmax(axis=1)
+        rows = np.arange(len(exploit_rows))
+        has_valid_action = (parcel_q[rows, parcels] > -np.inf) & (agent_q[rows, agents] > -np.inf)
+        actions[exploit_rows] = np.where(has_valid_action, parcels * num_agents + agents, -1)
+    return actions
+
+
+def _greedy_rollout(env, policy_net, select_actions, max_steps, num_threads=None):
+    """
+    Runs one episode taking the best valid action each step, under torch.inference_mode()
+    with num_threads intra-op threads (if given); returns its end assignment.
+    policy_net may be a module or its TorchScript export.
+    """
+    previous_num_threads = torch.get_num_threads()
+    if num_threads:
+        torch.set_num_threads(num_threads)
+    try:
+        with torch.inference_mode():
+            env.reset()
+            for _ in range(max_steps):
+                if env.num_valid_actions == 0:
+                    break
+                action = select_actions(env.state_vector[None], policy_net, 0.0, [env])[0]
+                if action == -1:
+                    break
+                _, done = env.step(action)
+                if done:
+                    break
+    finally:
+        torch.set_num_threads(previous_num_threads)
+    return env.assignment()
 
 
 def _optimize_model(policy_net, target_net, optimizer, replay_buffer, batch_size, gamma_discount):
     if len(replay_buffer) < batch_size:
         return
     
-    transitions = replay_buffer.sample(batch_size)
-    batch_state_vec, batch_action, batch_reward, batch_next_state_vec, batch_done = zip(*transitions)
-    
-    batch_state_t = torch.from_numpy(np.array(batch_state_vec))
-    batch_action_t = torch.from_numpy(np.array(batch_action)).long().unsqueeze(1) # Ensure it's Long and correct shape
-    batch_reward_t = torch.from_numpy(np.array(batch_reward)).float()
-    batch_next_state_t = torch.from_numpy(np.array(batch_next_state_vec))
-    batch_done_t = torch.from_numpy(np.array(batch_done)).float() # 0.0 for not done, 1.0 for done
-
-    # Q(s_t, a_t)
-    current_q_values = policy_net(batch_state_t).gather(1, batch_action_t)
-    
-    # max_a Q_target(s_{t+1}, a)
-    # Use .detach() to prevent gradients from flowing into the target network
-    next_q_values_target_net = target_net(batch_next_state_t).max(1)[0].detach()
+    (indices, batch_state_t, batch_action_t, batch_reward_t,
+     batch_next_state_t, batch_done_t, weights_t) = replay_buffer.sample(batch_size)
+
+    if isinstance(policy_net, FactorisedDQN):
+        # Both heads regress to the same target: Q(s_t, p_t) from the parcel head and
+        # Q(s_t, p_t, a_t) from the agent head; the next state is valued by the parcel head
+        num_agents = policy_net.agent_head.out_features
+        batch_parcel_t = torch.div(batch_action_t, num_agents, rounding_mode="floor")
+        features = policy_net.encode(batch_state_t)
+        current_q_values = (
+            policy_net.parcel_values(features).gather(1, batch_parcel_t.unsqueeze(1)).squeeze(1),
+            policy_net.agent_values(features, batch_parcel_t).gather(1, (batch_action_t % num_agents).unsqueeze(1)).squeeze(1)
+        )
+        with torch.no_grad():
+            next_q_values_target_net = target_net.parcel_values(target_net.encode(batch_next_state_t)).max(1)[0]
+    else:
+        # Q(s_t, a_t)
+        current_q_values = (policy_net(batch_state_t).gather(1, batch_action_t.unsqueeze(1)).squeeze(1),)
+        
+        # max_a Q_target(s_{t+1}, a)
+        # Use .detach() to prevent gradients from flowing into the target network
+        next_q_values_target_net = target_net(batch_next_state_t).max(1)[0].detach()
     
     # Expected Q values: r + gamma * max_a Q_target(s_{t+1}, a) if not done, else r
     expected_q_values = batch_reward_t + (gamma_discount * next_q_values_target_net * (1 - batch_done_t))
     
-    loss = F.mse_loss(current_q_values.squeeze(), expected_q_values)
+    if weights_t is None:
+        loss = sum(F.mse_loss(q_values, expected_q_values) for q_values in current_q_values)
+    else:
+        # Importance-weighted loss; the TD errors become the sampled transitions' new priorities
+        td_errors = [expected_q_values - q_values for q_values in current_q_values]
+        loss = sum((weights_t * td.pow(2)).mean() for td in td_errors)
+        replay_buffer.update_priorities(indices, td_errors[-1].detach().numpy())
     
     optimizer.zero_grad()
     loss.backward()
     # Gradient clipping can be useful: torch.nn.utils.clip_grad_norm_(policy_net.parameters(), max_norm=1.0)
     optimizer.step()
 
-def _build_final_routes_from_state(final_state, parcels_cfg, agents_cfg, warehouse_coords, params):
+def _build_final_routes_from_state(final_state, parcels_cfg, agents_cfg, warehouse_coords, params, instance):
     """
     Constructs DVRS-compatible routes from the final assignment state.
     Includes sequencing and scheduling.
     """
+    distance_rows = instance.as_list("distance")
     optimised_routes_output = []
     assigned_parcels_globally_ids = set()
 
@@ -358,36 +617,34 @@ def _build_final_routes_from_state(final_state, parcels_cfg, agents_cfg, warehou
         if not agent_assigned_parcels_indices:
             continue # No parcels for this agent
 
-        agent_parcels_objects = [parcels_cfg[i] for i in agent_assigned_parcels_indices]
 
         # --- Simple Sequencing: Maintain original relative order or NN ---
         # For now, use a very simple greedy nearest-neighbor from warehouse/last parcel
         # This is a placeholder; a better TSP heuristic should be used for robust sequencing.
         
         current_route_parcels_ordered = []
-        if agent_parcels_objects:
-            remaining_p_for_agent = list(agent_parcels_objects)
-            current_loc_for_nn = warehouse_coords
+        remaining_nodes_for_agent = [p_idx + 1 for p_idx in agent_assigned_parcels_indices]
+        current_node_for_nn = WAREHOUSE_NODE
+        
+        while remaining_nodes_for_agent:
+            best_node = None
+            min_dist = float('inf')
+            for cand_node in remaining_nodes_for_agent:
+                dist = distance_rows[current_node_for_nn][cand_node]
+                if dist < min_dist:
+                    min_dist = dist
+                    best_node = cand_node
             
-            while remaining_p_for_agent:
-                best_p = None
-                min_dist = float('inf')
-                for p_cand in remaining_p_for_agent:
-                    dist = _calculate_distance(current_loc_for_nn, p_cand["coordinates_x_y"])
-                    if dist < min_dist:
-                        min_dist = dist
-                        best_p = p_cand
-                
-                if best_p:
-                    current_route_parcels_ordered.append(best_p)
-                    current_loc_for_nn = best_p["coordinates_x_y"]
-                    remaining_p_for_agent.remove(best_p)
-                else: # Should not happen if remaining_p_for_agent is not empty
-                    break
+            if best_node is not None:
+                current_route_parcels_ordered.append(parcels_cfg[best_node - 1])
+                current_node_for_nn = best_node
+                remaining_nodes_for_agent.remove(best_node)
+            else: # Should not happen if remaining_nodes_for_agent is not empty
+                break
         
         # Calculate schedule and check feasibility for the *specific agent*
         is_feasible, route_details = _calculate_route_schedule_and_feasibility(
-            current_route_parcels_ordered, agent_config, warehouse_coords, params
+            current_route_parcels_ordered, agent_config, warehouse_coords, params, instance
         )
 
         if is_feasible and current_route_parcels_ordered: # Ensure route is not empty and feasible
@@ -397,7 +654,7 @@ def _build_final_routes_from_state(final_state, parcels_cfg, agents_cfg, warehou
             optimised_routes_output.append({
                 "agent_id": agent_config["id"],
                 "parcels_assigned_ids": [p["id"] for p in current_route_parcels_ordered],
-                "parcels_assigned_details": [copy.deepcopy(p) for p in current_route_parcels_ordered],
+                "parcels_assigned_details": list(current_route_parcels_ordered),
                 "route_stop_ids": route_details["route_stop_ids"],
                 "route_stop_coordinates": route_details["route_stop_coordinates"],
                 "total_weight": route_details["total_load"],
@@ -408,7 +665,7 @@ def _build_final_routes_from_state(final_state, parcels_cfg, agents_cfg, warehou
             })
     
     unassigned_parcels_details = [
-        copy.deepcopy(p) for p_idx, p in enumerate(parcels_cfg)
+        p for p_idx, p in enumerate(parcels_cfg)
         if final_state["parcels_status"][p_idx] == 0 or p["id"] not in assigned_parcels_globally_ids
     ]
     unassigned_parcels_ids = [p["id"] for p in unassigned_parcels_details]
@@ -438,13 +695,16 @@ def run_optimisation(config_data, params):
             "status": "warning", "message": "No parcels or delivery agents for DQN.",
             "optimised_routes": [], 
             "unassigned_parcels": [p["id"] for p in parcels_cfg_orig],
-            "unassigned_parcels_details": copy.deepcopy(parcels_cfg_orig)
+            "unassigned_parcels_details": list(parcels_cfg_orig)
         }
     
-    parcels_cfg = copy.deepcopy(parcels_cfg_orig)
-    agents_cfg = copy.deepcopy(agents_cfg_orig)
+    # config_data is already a per-run copy; parcel dicts are only read
+    parcels_cfg = parcels_cfg_orig
+    agents_cfg = agents_cfg_orig
     num_parcels = len(parcels_cfg)
     num_agents = len(agents_cfg)
+    instance = build_problem_instance(config_data, params, default_time_per_distance_unit=1.0,
+                                      default_service_time=params.get("default_service_time", 10))
 
     # Normalization constants
     max_cap = max(a["capacity_weight"] for a in agents_cfg) if agents_cfg else 1
@@ -458,97 +718,169 @@ def run_optimisation(config_data, params):
     state_size = (num_parcels * 5) + num_agents 
     action_size = num_parcels * num_agents # Assign parcel P to agent A
 
-    policy_net = DQN(state_size, action_size)
-    target_net = DQN(state_size, action_size)
+    factorised = params.get("action_space", "joint") == "factorised"
+    if factorised:
+        policy_net = FactorisedDQN(state_size, num_parcels, num_agents)
+        target_net = FactorisedDQN(state_size, num_parcels, num_agents)
+        select_actions = _select_factorised_actions
+    else:
+        policy_net = DQN(state_size, action_size)
+        target_net = DQN(state_size, action_size)
+        select_actions = _select_actions
     target_net.load_state_dict(policy_net.state_dict())
     target_net.eval()
 
     optimizer = optim.Adam(policy_net.parameters(), lr=learning_rate)
-    replay_buffer = ReplayBuffer(buffer_capacity)
+    replay_buffer = ReplayBuffer(buffer_capacity, state_size, prioritised=params.get("prioritised_replay", False),
+                                 alpha=params.get("priority_alpha", 0.6), beta=params.get("priority_beta", 0.4))
     epsilon = epsilon_start
 
+    # Checkpoints: optionally start from (or only use) a saved policy of the same shape
+    checkpoint_mode = params.get("checkpoint_mode", "off")
+    checkpoint_store = CheckpointStore("dqn_factorised" if factorised else "dqn")
+    scripted_policy_store = CheckpointStore(f"{checkpoint_store.model_name}_scripted") # TorchScript exports
+    checkpoint_shape = (state_size, num_parcels, num_agents) if factorised else (state_size, action_size)
+    checkpoint_fingerprint = parameter_fingerprint(params, CHECKPOINT_FINGERPRINT_PARAMS)
+    checkpoint_notes = []
+    loaded_checkpoint = False
+    inference_policy = policy_net
+    if checkpoint_mode == "inference_only":
+        scripted_policy_path = scripted_policy_store.find(checkpoint_shape, checkpoint_fingerprint)
+        if scripted_policy_path is not None:
+            inference_policy = torch.jit.load(scripted_policy_path, map_location="cpu")
+            loaded_checkpoint = True
+            checkpoint_notes.append(f"Loaded TorchScript policy {os.path.basename(scripted_policy_path)}.")
+    if checkpoint_mode in ("warm_start", "inference_only") and not loaded_checkpoint:
+        checkpoint_path = checkpoint_store.find(checkpoint_shape, checkpoint_fingerprint)
+        if checkpoint_path is not None:
+            checkpoint = torch.load(checkpoint_path, map_location="cpu")
+            policy_net.load_state_dict(checkpoint["policy_state_dict"])
+            target_net.load_state_dict(policy_net.state_dict())
+            loaded_checkpoint = True
+            checkpoint_notes.append(f"Loaded policy checkpoint {os.path.basename(checkpoint_path)}.")
+        else:
+            checkpoint_notes.append("No saved policy checkpoint for this problem size; trained from scratch.")
+    train_policy = not (checkpoint_mode == "inference_only" and loaded_checkpoint)
+    if not train_policy:
+        num_episodes = 0
+
     best_final_state_overall = None
     min_unassigned_parcels_overall = num_parcels + 1
     
     episode_rewards = []
 
-    for episode in range(num_episodes):
-        current_state = _get_initial_state(parcels_cfg, agents_cfg)
-        episode_total_reward = 0
-        done = False
-        
-        # Max steps per episode to prevent infinite loops if goal is hard to reach
-        max_steps_per_episode = num_parcels * 2 # Allow some mistakes/re-exploration
-        for step in range(max_steps_per_episode):
-            state_vector = _state_to_vector(current_state, num_parcels, num_agents, max_cap, max_weight, max_coord, parcels_cfg)
-            
-            # Valid actions mask: True if parcel unassigned AND agent has capacity
-            valid_actions_mask = np.zeros(action_size, dtype=bool)
-            can_assign_more = False
-            for p_idx in range(num_parcels):
-                if current_state["parcels_status"][p_idx] == 0: # If parcel is unassigned
-                    for a_idx in range(num_agents):
-                        if current_state["agents_remaining_capacity"][a_idx] >= parcels_cfg[p_idx]["weight"]:
-                            valid_actions_mask[p_idx * num_agents + a_idx] = True
-                            can_assign_more = True
-            
-            if not can_assign_more: # No valid moves left or all assigned
-                done = True
-                # Check if all parcels are assigned
-                if not all(s == 1 for s in current_state["parcels_status"]):
-                     episode_total_reward -= 200 # Penalty if stuck with unassigned parcels
-
-            if done:
-                break
-
-            action = _select_action(state_vector, policy_net, epsilon, action_size, valid_actions_mask)
-            if action == -1 : # No valid action selected
-                done = True
-                if not all(s == 1 for s in current_state["parcels_status"]):
-                    episode_total_reward -= 150 # Penalty if stuck with unassigned parcels and no valid moves
-                break 
-
-            next_state, reward_step, step_done = _apply_action_and_get_reward(current_state, action, parcels_cfg, agents_cfg, params)
-            episode_total_reward += reward_step
-            done = step_done # Update overall done flag
-
-            next_state_vector = _state_to_vector(next_state, num_parcels, num_agents, max_cap, max_weight, max_coord, parcels_cfg)
-            replay_buffer.push(state_vector, action, reward_step, next_state_vector, done)
+    # Episodes run in lockstep on num_envs independent environments; each finished
+    # episode is replaced by a new one until num_episodes have been started
+    num_envs = max(1, min(params.get("parallel_envs", 1), num_episodes))
+    envs = [AssignmentEnvironment(instance, max_cap, max_weight, max_coord) for _ in range(num_envs)]
+    state_batch = np.stack([env.state_vector for env in envs]) # Current state vector of each environment
+    episode_steps = [0] * num_envs
+    episode_total_rewards = [0] * num_envs
+    active_envs = list(range(num_envs)) if train_policy else []
+    episodes_started = num_envs
+    episodes_completed = 0
+    # Max steps per episode to prevent infinite loops if goal is hard to reach
+    max_steps_per_episode = num_parcels * 2 # Allow some mistakes/re-exploration
+
+    while active_envs:
+        finished_envs = []
+        acting_envs = []
+        for env_idx in active_envs:
+            if envs[env_idx].num_valid_actions == 0: # No valid moves left or all assigned
+                if not envs[env_idx].done:
+                    episode_total_rewards[env_idx] -= 200 # Penalty if stuck with unassigned parcels
+                finished_envs.append(env_idx)
+            else:
+                acting_envs.append(env_idx)
+
+        if acting_envs:
+            actions = select_actions(state_batch[acting_envs], policy_net, epsilon,
+                                     [envs[env_idx] for env_idx in acting_envs])
+            stepping_envs = []
+            for env_idx, action in zip(acting_envs, actions):
+                if action == -1: # No valid action selected
+                    if not envs[env_idx].done:
+                        episode_total_rewards[env_idx] -= 150 # Penalty if stuck with unassigned parcels and no valid moves
+                    finished_envs.append(env_idx)
+                else:
+                    stepping_envs.append(env_idx)
+
+            if stepping_envs:
+                step_actions = actions[actions != -1]
+                rewards = np.empty(len(stepping_envs), dtype=np.float32)
+                dones = np.empty(len(stepping_envs), dtype=bool)
+                next_state_batch = np.empty((len(stepping_envs), state_size), dtype=np.float32)
+                for row, env_idx in enumerate(stepping_envs):
+                    env = envs[env_idx]
+                    rewards[row], dones[row] = env.step(step_actions[row])
+                    next_state_batch[row] = env.state_vector
+                    episode_total_rewards[env_idx] += rewards[row]
+                    episode_steps[env_idx] += 1
+                    if dones[row] or episode_steps[env_idx] >= max_steps_per_episode:
+                        finished_envs.append(env_idx)
+
+                replay_buffer.push_batch(state_batch[stepping_envs], step_actions, rewards, next_state_batch, dones)
+                state_batch[stepping_envs] = next_state_batch
+                _optimize_model(policy_net, target_net, optimizer, replay_buffer, batch_size, gamma_discount)
+
+        for env_idx in finished_envs:
+            env = envs[env_idx]
+            episode_rewards.append(episode_total_rewards[env_idx])
+            num_unassigned_in_episode_end_state = env.num_unassigned
+
+            if num_unassigned_in_episode_end_state < min_unassigned_parcels_overall:
+                min_unassigned_parcels_overall = num_unassigned_in_episode_end_state
+                best_final_state_overall = env.assignment()
+            elif num_unassigned_in_episode_end_state == min_unassigned_parcels_overall:
+                # If same number unassigned, could add a secondary metric (e.g. estimated distance)
+                # For now, just update if it's the first time we hit this low number or by chance
+                best_final_state_overall = env.assignment()
+
+            episodes_completed += 1
+            if episodes_completed % target_update_freq == 0:
+                target_net.load_state_dict(policy_net.state_dict())
             
-            current_state = next_state
-            _optimize_model(policy_net, target_net, optimizer, replay_buffer, batch_size, gamma_discount)
-
-            if done:
-                break
-        
-        episode_rewards.append(episode_total_reward)
-        num_unassigned_in_episode_end_state = sum(1 for s in current_state["parcels_status"] if s == 0)
-
-        if num_unassigned_in_episode_end_state < min_unassigned_parcels_overall:
-            min_unassigned_parcels_overall = num_unassigned_in_episode_end_state
-            best_final_state_overall = copy.deepcopy(current_state)
-        elif num_unassigned_in_episode_end_state == min_unassigned_parcels_overall:
-            # If same number unassigned, could add a secondary metric (e.g. estimated distance)
-            # For now, just update if it's the first time we hit this low number or by chance
-            best_final_state_overall = copy.deepcopy(current_state)
-
-
-        if (episode + 1) % target_update_freq == 0:
-            target_net.load_state_dict(policy_net.state_dict())
-        
-        epsilon = max(epsilon_end, epsilon * epsilon_decay_rate)
-
-        # Optional: Print progress
-        # if (episode + 1) % 10 == 0:
-        #     print(f"Episode {episode+1}/{num_episodes}, Avg Reward (last 10): {np.mean(episode_rewards[-10:]):.2f}, Epsilon: {epsilon:.3f}, Min Unassigned: {min_unassigned_parcels_overall}")
-
+            epsilon = max(epsilon_end, epsilon * epsilon_decay_rate)
+
+            # Optional: Print progress
+            # if episodes_completed % 10 == 0:
+            #     print(f"Episode {episodes_completed}/{num_episodes}, Avg Reward (last 10): {np.mean(episode_rewards[-10:]):.2f}, Epsilon: {epsilon:.3f}, Min Unassigned: {min_unassigned_parcels_overall}")
+
+            if episodes_started < num_episodes:
+                env.reset()
+                state_batch[env_idx] = env.state_vector
+                episode_steps[env_idx] = 0
+                episode_total_rewards[env_idx] = 0
+                episodes_started += 1
+            else:
+                active_envs.remove(env_idx)
+
+
+    if not train_policy:
+        best_final_state_overall = _greedy_rollout(envs[0], inference_policy, select_actions, max_steps_per_episode,
+                                                   num_threads=params.get("inference_threads", 1))
+    elif checkpoint_mode != "off":
+        try:
+            saved_path = checkpoint_store.save(
+                checkpoint_shape, checkpoint_fingerprint,
+                lambda path: torch.save({"policy_state_dict": policy_net.state_dict(),
+                                         "episodes": num_episodes}, path)
+            )
+            # Inference-only artefact: loads without this script's classes
+            policy_net.eval()
+            scripted_policy_store.save(checkpoint_shape, checkpoint_fingerprint,
+                                       lambda path: torch.jit.save(torch.jit.script(policy_net), path))
+            checkpoint_notes.append(f"Saved policy checkpoint {os.path.basename(saved_path)} and its TorchScript export.")
+        except OSError as e:
+            checkpoint_notes.append(f"Could not save policy checkpoint: {e}")
 
     if best_final_state_overall is None: # Should not happen if episodes > 0
-        best_final_state_overall = _get_initial_state(parcels_cfg, agents_cfg) # Fallback to initial
+        envs[0].reset()
+        best_final_state_overall = envs[0].assignment() # Fallback to initial
 
     # Build final routes using the best assignment state found
     opt_routes, unassigned_ids, unassigned_details = _build_final_routes_from_state(
-        best_final_state_overall, parcels_cfg, agents_cfg, warehouse_coords, params
+        best_final_state_overall, parcels_cfg, agents_cfg, warehouse_coords, params, instance
     )
     
     message = f"DQN optimization completed. Episodes: {num_episodes}. Best found solution has {len(unassigned_ids)} unassigned parcels."
@@ -556,6 +888,8 @@ def run_optimisation(config_data, params):
     if not opt_routes and parcels_cfg:
         message = "DQN optimization completed, but no feasible routes could be constructed from assignments for any agent."
         status_type = "error"
+    if checkpoint_notes:
+        message = " ".join([message] + checkpoint_notes)
 
 
     return {
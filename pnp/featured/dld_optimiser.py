@@ -1,9 +1,8 @@
 import json
-import math
 import re
-import copy
 import requests # For synchronous HTTP requests
-import time # For retry delay
+from packages.optimisation.backend.llm_client import LLMResponseCache, post_chat_completion, register_stub_endpoint
+from packages.optimisation.backend.routing_core import build_problem_instance, WAREHOUSE_NODE
 
 def get_params_schema():
     return {
@@ -35,6 +34,21 @@ def get_params_schema():
                 "max": 4096,
                 "help": "Maximum tokens in LLM response."
             },
+            {
+                "name": "llm_endpoint",
+                "label": "LLM Endpoint",
+                "type": "selectbox",
+                "default": "openrouter",
+                "options": ["openrouter", "local_stub"],
+                "help": "Where prompts are sent. local_stub answers in-process with a first-fit plan (no network), for offline testing."
+            },
+            {
+                "name": "llm_response_cache",
+                "label": "Cache LLM responses",
+                "type": "boolean",
+                "default": True,
+                "help": "Reuse the saved response (in llm_cache/) when the same prompt is sent with the same model, temperature and max tokens. Turn off to draw a fresh response."
+            },
             {
                 "name": "time_per_distance_unit",
                 "label": "Time per distance unit",
@@ -61,9 +75,6 @@ def get_params_schema():
         ]
     }
 
-def _calculate_distance(coord1, coord2):
-    return math.sqrt((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)
-
 def _build_llm_prompt(warehouse_coords, parcels, delivery_agents):
     prompt = "You are an expert logistics planner. Your task is to solve a Vehicle Routing Problem (VRP).\n"
     prompt += "You need to assign parcels to delivery agents and suggest an order for deliveries for each agent.\n"
@@ -117,7 +128,28 @@ def _build_llm_prompt(warehouse_coords, parcels, delivery_agents):
     prompt += "\nIMPORTANT: Your response must be ONLY the raw JSON object, without any additional text, explanations, or markdown formatting before or after it. Start with '{' and end with '}'.\n"
     return prompt
 
-def _invoke_llm_sync(api_token, model_name, prompt_content, api_endpoint_url, temperature=1.0, max_tokens=2048, site_url=None, site_name=None):
+def _stub_plan(parcels, delivery_agents):
+    """
+    Plan returned by the local stub endpoint: parcels by time window opening, each given to
+    the first agent with capacity left for it. Sent as a ```json block, as the models reply.
+    """
+    remaining_capacity = {da["id"]: da["capacity_weight"] for da in delivery_agents}
+    routes = {da["id"]: [] for da in delivery_agents}
+    unassigned_ids = []
+    for p in sorted(parcels, key=lambda p: p.get("time_window_open", 0)):
+        agent_id = next((a_id for a_id, cap in remaining_capacity.items() if cap >= p["weight"]), None)
+        if agent_id is None:
+            unassigned_ids.append(p["id"])
+            continue
+        routes[agent_id].append(p["id"])
+        remaining_capacity[agent_id] -= p["weight"]
+    plan = {
+        "optimised_routes": [{"agent_id": a_id, "parcels_assigned_ids": ids} for a_id, ids in routes.items() if ids],
+        "unassigned_parcels_ids": unassigned_ids
+    }
+    return f"```json\n{json.dumps(plan, indent=2)}\n```"
+
+def _invoke_llm_sync(api_token, model_name, prompt_content, api_endpoint_url, temperature=1.0, max_tokens=2048, site_url=None, site_name=None, cache=None):
     if not api_token:
         return {"error": "LLM API key is missing. Please configure it in parameters."}
 
@@ -141,14 +173,10 @@ def _invoke_llm_sync(api_token, model_name, prompt_content, api_endpoint_url, te
     }
 
     try:
-        response = requests.post(
-            api_endpoint_url,
-            headers=headers,
-            json=body,
-            timeout=180
-        )
-        response.raise_for_status()
-        response_data = response.json()
+        # Pooled session with bounded retries; the response is read from cache if already received
+        response_data, from_cache = post_chat_completion(api_endpoint_url, headers, body, timeout=180, cache=cache)
+        if from_cache:
+            print("LLM: Using cached response for this prompt.")
 
         if response_data.get("choices") and \
            len(response_data["choices"]) > 0 and \
@@ -198,7 +226,7 @@ def _invoke_llm_sync(api_token, model_name, prompt_content, api_endpoint_url, te
         return {"error": f"Unexpected error during LLM API call: {str(e)}"}
 
 
-def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_config, warehouse_coords, params, parcel_map_for_lookup):
+def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_config, warehouse_coords, params, instance):
     """
     (Copied and adapted from other optimisers - ensures consistency)
     Calculates detailed schedule for a given sequence of parcels for a specific agent.
@@ -208,8 +236,12 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_conf
     as a simple local re-ordering heuristic before detailed scheduling.
     """
     should_return_to_warehouse = params.get("return_to_warehouse", True)
-    time_per_dist_unit = params.get("time_per_distance_unit", 1.0)
-    default_service_time = params.get("default_service_time", 10)
+    distance_rows = instance.as_list("distance")
+    travel_time_rows = instance.as_list("travel_time")
+    weights = instance.as_list("weights")
+    tw_open = instance.as_list("tw_open")
+    tw_close = instance.as_list("tw_close")
+    service_times = instance.as_list("service_times") # Fixed service time (10 min default)
 
     agent_capacity = agent_config["capacity_weight"]
     agent_op_start = agent_config.get("operating_hours_start", 0) # Default if missing
@@ -221,15 +253,15 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_conf
     departure_times = [round(agent_op_start)]
 
     current_time = agent_op_start
-    current_location = list(warehouse_coords)
+    current_node = WAREHOUSE_NODE
     current_load = 0
     total_distance = 0.0
 
     # Simple local re-ordering: Sort parcels for this agent by their time window open.
     # More sophisticated local search (e.g., 2-opt) could be applied here.
-    locally_ordered_parcels = sorted(ordered_parcel_objects, key=lambda p: p.get("time_window_open", 0))
+    locally_ordered_nodes = sorted((instance.node_of(p["id"]) for p in ordered_parcel_objects), key=tw_open.__getitem__)
 
-    if not locally_ordered_parcels: # Changed from ordered_parcel_objects
+    if not locally_ordered_nodes: # Changed from ordered_parcel_objects
         if should_return_to_warehouse:
              pass # Already initialized
         else:
@@ -239,21 +271,18 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_conf
                 "total_distance": 0.0, "total_load": 0.0
             }
 
-    for p_obj in locally_ordered_parcels: # Iterate over the locally re-ordered parcel objects
-        # p_obj is already the full parcel object. No need for parcel_map_for_lookup here.
-
-        p_coords = p_obj["coordinates_x_y"]
-        p_weight = p_obj["weight"]
-        p_service_time = p_obj.get("service_time", 10)  # Fixed service time (10 min default)
-        p_tw_open = p_obj.get("time_window_open", 0)
-        p_tw_close = p_obj.get("time_window_close", 1439)
+    for p_node in locally_ordered_nodes: # Iterate over the locally re-ordered parcel nodes
+        p_obj = instance.parcel_of(p_node)
+        p_weight = weights[p_node]
+        p_service_time = service_times[p_node]
+        p_tw_open = tw_open[p_node]
+        p_tw_close = tw_close[p_node]
 
         current_load += p_weight
         if current_load > agent_capacity: return False, {"reason": f"Exceeded capacity for agent {agent_config['id']}"}
 
-        dist_to_parcel = _calculate_distance(current_location, p_coords)
-        total_distance += dist_to_parcel
-        travel_time = dist_to_parcel * time_per_dist_unit
+        total_distance += distance_rows[current_node][p_node]
+        travel_time = travel_time_rows[current_node][p_node]
         
         arrival_at_parcel = current_time + travel_time
         service_start_time = max(arrival_at_parcel, p_tw_open)
@@ -265,17 +294,16 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, agent_conf
         if service_end_time > agent_op_end: return False, {"reason": f"Service end for {p_obj['id']} after agent op end"}
 
         route_stop_ids.append(p_obj["id"])
-        route_stop_coordinates.append(list(p_coords))
+        route_stop_coordinates.append(list(p_obj["coordinates_x_y"]))
         arrival_times.append(round(arrival_at_parcel))
         departure_times.append(round(service_end_time))
         
         current_time = service_end_time
-        current_location = list(p_coords)
+        current_node = p_node
 
     if should_return_to_warehouse:
-        dist_to_warehouse = _calculate_distance(current_location, warehouse_coords)
-        total_distance += dist_to_warehouse
-        travel_time_to_wh = dist_to_warehouse * time_per_dist_unit
+        total_distance += distance_rows[current_node][WAREHOUSE_NODE]
+        travel_time_to_wh = travel_time_rows[current_node][WAREHOUSE_NODE]
         arrival_at_warehouse_final = current_time + travel_time_to_wh
 
         if arrival_at_warehouse_final > agent_op_end: return False, {"reason": "Return to WH after agent op end"}
@@ -318,7 +346,7 @@ def run_optimisation(config_data, params):
         return {
             "status": "warning", "message": "No delivery agents available to assign parcels.",
             "optimised_routes": [], "unassigned_parcels": [p["id"] for p in parcels_cfg],
-            "unassigned_parcels_details": copy.deepcopy(parcels_cfg)
+            "unassigned_parcels_details": list(parcels_cfg)
         }
 
     prompt = _build_llm_prompt(warehouse_coords, parcels_cfg, agents_cfg)
@@ -326,32 +354,26 @@ def run_optimisation(config_data, params):
     print("Optimiser: Sending prompt to routing assistant...")
     # print(f"LLM Prompt:\n{prompt[:500]}...\n...\n{prompt[-500:]}") # Log snippet of prompt
 
-    max_retries = 3
-    retry_delay = 5  # seconds
-    llm_response_data = None
-    
-    for attempt in range(max_retries):
-        try:
-            llm_temperature = params.get("llm_temperature", 0.5)
-            llm_max_tokens = params.get("llm_max_tokens", 2048)
-            llm_response_data = _invoke_llm_sync(
-                api_token,
-                llm_model,
-                prompt,
-                api_endpoint_url,
-                llm_temperature,
-                llm_max_tokens,
-                site_url,
-                site_name
-            )
-            break  # Exit loop if successful
-        except Exception as e:
-            print(f"LLM API attempt {attempt + 1} failed: {str(e)}")
-            if attempt < max_retries - 1:
-                print(f"Retrying in {retry_delay} seconds...")
-                time.sleep(retry_delay)
-            else:
-                llm_response_data = {"error": f"All {max_retries} attempts failed"}
+    if params.get("llm_endpoint", "openrouter") == "local_stub":
+        # Offline: answered in this process from the configuration, no network needed
+        api_endpoint_url = register_stub_endpoint("dld_optimiser", lambda body: _stub_plan(parcels_cfg, agents_cfg))
+    response_cache = LLMResponseCache() if params.get("llm_response_cache", True) else None
+
+    # Transient failures (connection errors, rate limits, server errors) are retried with
+    # backoff by the shared session (see llm_client)
+    llm_temperature = params.get("llm_temperature", 0.5)
+    llm_max_tokens = params.get("llm_max_tokens", 2048)
+    llm_response_data = _invoke_llm_sync(
+        api_token,
+        llm_model,
+        prompt,
+        api_endpoint_url,
+        llm_temperature,
+        llm_max_tokens,
+        site_url,
+        site_name,
+        response_cache
+    )
 
     error_msg = "Unknown error during LLM processing"
     raw_content_msg = ""
@@ -373,7 +395,7 @@ def run_optimisation(config_data, params):
             "status": "error",
             "message": f"LLM API call failed or returned unusable data: {error_msg}.{raw_content_msg}",
             "optimised_routes": [], "unassigned_parcels": [p["id"] for p in parcels_cfg],
-            "unassigned_parcels_details": copy.deepcopy(parcels_cfg)
+            "unassigned_parcels_details": list(parcels_cfg)
         }
 
     # --- Post-process LLM Output ---
@@ -388,7 +410,7 @@ def run_optimisation(config_data, params):
             "message": "LLM returned empty or invalid response format",
             "optimised_routes": [],
             "unassigned_parcels": [p["id"] for p in parcels_cfg],
-            "unassigned_parcels_details": copy.deepcopy(parcels_cfg)
+            "unassigned_parcels_details": list(parcels_cfg)
         }
 
     # If routes are missing or not in expected format
@@ -398,7 +420,7 @@ def run_optimisation(config_data, params):
             "message": "LLM output 'optimised_routes' was missing or not a list of route objects",
             "optimised_routes": [],
             "unassigned_parcels": [p["id"] for p in parcels_cfg],
-            "unassigned_parcels_details": copy.deepcopy(parcels_cfg)
+            "unassigned_parcels_details": list(parcels_cfg)
         }
 
 
@@ -406,6 +428,8 @@ def run_optimisation(config_data, params):
     actually_assigned_parcel_ids = set()
     parcel_map = {p["id"]: p for p in parcels_cfg} # For quick lookup
     agent_map = {a["id"]: a for a in agents_cfg}   # For quick lookup
+    # Service time is fixed at 10 minutes when a parcel does not specify one
+    instance = build_problem_instance(config_data, params, default_time_per_distance_unit=1.0, default_service_time=10)
 
     for llm_route_proposal in llm_proposed_routes:
         # Add robust type checking before processing route proposal
@@ -444,7 +468,7 @@ def run_optimisation(config_data, params):
             agent_config,
             warehouse_coords,
             params,
-            parcel_map # Pass the map for the scheduler to use
+            instance
         )
 
         if is_feasible and route_details.get("route_stop_ids") and len(route_details["route_stop_ids"]) > (1 if params.get("return_to_warehouse") else 0) : # Has at least one parcel if not returning, or WH start/end
@@ -455,7 +479,7 @@ def run_optimisation(config_data, params):
             final_optimised_routes.append({
                 "agent_id": agent_id,
                 "parcels_assigned_ids": scheduled_parcel_ids_in_route,
-                "parcels_assigned_details": [copy.deepcopy(parcel_map[pid]) for pid in scheduled_parcel_ids_in_route],
+                "parcels_assigned_details": [parcel_map[pid] for pid in scheduled_parcel_ids_in_route],
                 "route_stop_ids": route_details["route_stop_ids"],
                 "route_stop_coordinates": route_details["route_stop_coordinates"],
                 "total_weight": route_details["total_load"],
@@ -482,7 +506,7 @@ def run_optimisation(config_data, params):
             final_unassigned_ids_set.add(p_cfg["id"])
     
     final_unassigned_ids_list = sorted(list(final_unassigned_ids_set))
-    final_unassigned_details = [copy.deepcopy(parcel_map[pid]) for pid in final_unassigned_ids_list if pid in parcel_map]
+    final_unassigned_details = [parcel_map[pid] for pid in final_unassigned_ids_list if pid in parcel_map]
     
     # Build final output message with more detailed status
     if not final_optimised_routes:
@@ -1,19 +1,12 @@
 # DVRS Optimisation Script: Genetic Algorithm
+import contextlib
 import math
 import random
-import copy
-
-# --- Helper Functions ---
-def _calculate_distance(coord1, coord2):
-    """Calculates Euclidean distance."""
-    return math.sqrt((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)
-
-def _get_coords(stop_id, warehouse_coords, parcels_map):
-    """Gets coordinates for a stop ID (parcel or warehouse)."""
-    if stop_id == "Warehouse":
-        return warehouse_coords
-    parcel = parcels_map.get(stop_id)
-    return parcel["coordinates_x_y"] if parcel else None
+import numpy as np
+from packages.optimisation.backend.fitness_cache import FitnessCache
+from packages.optimisation.backend.routing_core import build_problem_instance, WAREHOUSE_NODE
+from packages.optimisation.backend.split_decoder import SplitDecoder
+from packages.optimisation.backend.worker_pool import WorkerPool
 
 # --- GA Core Components ---
 
@@ -50,6 +43,14 @@ def _create_random_individual(all_parcel_ids, agents_list, agents_map):
 
     return {"routes": individual_routes, "unassigned": individual_unassigned, "fitness": float('inf')}
 
+def _copy_individual(individual):
+    """Copies an individual's route and unassigned lists (parcel ids are immutable strings)."""
+    return {
+        "routes": {agent_id: list(parcel_ids) for agent_id, parcel_ids in individual["routes"].items()},
+        "unassigned": list(individual["unassigned"]),
+        "fitness": individual["fitness"]
+    }
+
 def _initialize_population(population_size, all_parcel_ids, agents_list, agents_map):
     """Initializes a population of random individuals."""
     population = []
@@ -58,7 +59,7 @@ def _initialize_population(population_size, all_parcel_ids, agents_list, agents_
     return population
 
 # 3. Fitness Evaluation
-def _calculate_fitness(individual, agents_map, parcels_map, warehouse_coords, params):
+def _calculate_fitness(individual, instance, params):
     """
     Evaluates the cost of an individual. Lower cost is better fitness.
     Very similar to SA's _evaluate_solution.
@@ -67,8 +68,17 @@ def _calculate_fitness(individual, agents_map, parcels_map, warehouse_coords, pa
     routes_struct = individual["routes"]
     unassigned_parcel_ids = individual["unassigned"]
 
-    time_per_dist_unit = params.get("time_per_distance_unit", 2.0)
-    default_service_time = params.get("default_service_time", 10)
+    distance_rows = instance.as_list("distance")
+    travel_time_rows = instance.as_list("travel_time")
+    weights = instance.as_list("weights")
+    tw_open = instance.as_list("tw_open")
+    tw_close = instance.as_list("tw_close")
+    service_times = instance.as_list("service_times")
+    agent_capacities = instance.as_list("agent_capacities")
+    agent_op_starts = instance.as_list("agent_op_start")
+    agent_op_ends = instance.as_list("agent_op_end")
+    node_index = instance.matrices.node_index
+    agent_index = instance.agent_index
     return_to_warehouse = params.get("return_to_warehouse", True)
 
     penalty_factor_unassigned = params.get("penalty_unassigned_parcel", 1000.0)
@@ -79,12 +89,12 @@ def _calculate_fitness(individual, agents_map, parcels_map, warehouse_coords, pa
     total_cost += len(unassigned_parcel_ids) * penalty_factor_unassigned
 
     for agent_id, parcel_ids_for_agent in routes_struct.items():
-        agent_config = agents_map.get(agent_id)
-        if not agent_config: continue # Should not happen if data is consistent
+        agent_idx = agent_index.get(agent_id)
+        if agent_idx is None: continue # Should not happen if data is consistent
 
-        agent_op_start = agent_config.get("operating_hours_start", 0)
-        agent_op_end = agent_config.get("operating_hours_end", 1439)
-        agent_capacity = agent_config["capacity_weight"]
+        agent_op_start = agent_op_starts[agent_idx]
+        agent_op_end = agent_op_ends[agent_idx]
+        agent_capacity = agent_capacities[agent_idx]
 
         current_route_stops = ["Warehouse"] + parcel_ids_for_agent
         if return_to_warehouse or not parcel_ids_for_agent:
@@ -95,47 +105,39 @@ def _calculate_fitness(individual, agents_map, parcels_map, warehouse_coords, pa
 
 
         current_time = float(agent_op_start)
-        current_loc_coords = list(warehouse_coords)
-        current_weight_on_agent = 0
+        from_node = WAREHOUSE_NODE
         route_dist_for_agent = 0.0
 
         # First pass to check capacity only, as it's cumulative
         temp_weight_check = 0
         for parcel_id in parcel_ids_for_agent:
-            parcel_obj = parcels_map.get(parcel_id)
-            if parcel_obj:
-                temp_weight_check += parcel_obj["weight"]
+            parcel_node = node_index.get(parcel_id)
+            if parcel_node is not None:
+                temp_weight_check += weights[parcel_node]
         if temp_weight_check > agent_capacity:
             total_cost += (temp_weight_check - agent_capacity) * penalty_factor_capacity
 
 
         # Simulate route for time-based penalties and distance
         for i in range(len(current_route_stops) -1):
-            from_stop_id = current_route_stops[i]
             to_stop_id = current_route_stops[i+1]
+            to_node = node_index.get(to_stop_id)
+            if to_node is None: continue # Should not happen
 
-            from_coords = _get_coords(from_stop_id, warehouse_coords, parcels_map)
-            to_coords = _get_coords(to_stop_id, warehouse_coords, parcels_map)
-            
-            if from_coords is None or to_coords is None: continue # Should not happen
-
-            dist = _calculate_distance(from_coords, to_coords)
-            route_dist_for_agent += dist
-            travel_time = dist * time_per_dist_unit
+            route_dist_for_agent += distance_rows[from_node][to_node]
+            travel_time = travel_time_rows[from_node][to_node]
+            from_node = to_node
             arrival_at_to_stop = current_time + travel_time
 
-            if to_stop_id == "Warehouse":
+            if to_node == WAREHOUSE_NODE:
                 current_time = arrival_at_to_stop
                 if i == len(current_route_stops) - 2: # Final arrival at warehouse
                     if current_time > agent_op_end:
                         total_cost += (current_time - agent_op_end) * penalty_factor_ophours
             else:
-                parcel_obj = parcels_map.get(to_stop_id)
-                if not parcel_obj: continue
-
-                parcel_tw_open = parcel_obj.get("time_window_open", 0)
-                parcel_tw_close = parcel_obj.get("time_window_close", 1439)
-                parcel_service_time = parcel_obj.get("service_time", default_service_time)
+                parcel_tw_open = tw_open[to_node]
+                parcel_tw_close = tw_close[to_node]
+                parcel_service_time = service_times[to_node]
 
                 service_start_time = max(arrival_at_to_stop, parcel_tw_open)
                 
@@ -154,13 +156,71 @@ def _calculate_fitness(individual, agents_map, parcels_map, warehouse_coords, pa
                     total_cost += (service_end_time - agent_op_end) * penalty_factor_ophours
                 
                 current_time = service_end_time
-                current_loc_coords = list(to_coords)
         
         total_cost += route_dist_for_agent
     
     individual["fitness"] = total_cost # Store fitness in the individual
     return total_cost
 
+def _genotype_key(individual):
+    """
+    Canonical, hashable form of an individual's routes and unassigned parcels (its fitness
+    cache key). Routes are keyed in agent order; the order of unassigned parcels is irrelevant.
+    """
+    return (tuple((agent_id, tuple(parcel_ids)) for agent_id, parcel_ids in individual["routes"].items()),
+            frozenset(individual["unassigned"]))
+
+def _evaluate_population(individuals, instance, params, pool=None, cache=None):
+    """
+    Calculates the fitness of each individual, as one batch on the worker pool if there is one.
+    With a cache, only genotypes not already cached (or repeated in the batch) are evaluated.
+    """
+    if cache is None:
+        to_evaluate = individuals
+    else:
+        pending = {} # Genotype key -> individuals sharing it
+        for ind in individuals:
+            key = _genotype_key(ind)
+            if key in pending: # Evaluated once with the first individual
+                cache.hits += 1
+                pending[key].append(ind)
+                continue
+            fitness = cache.get(key)
+            if fitness is None:
+                pending[key] = [ind]
+            else:
+                ind["fitness"] = fitness
+        to_evaluate = [same_genotype[0] for same_genotype in pending.values()]
+
+    if pool is None:
+        for ind in to_evaluate:
+            _calculate_fitness(ind, instance, params)
+    else:
+        for ind, fitness in zip(to_evaluate, pool.map(to_evaluate)):
+            ind["fitness"] = fitness
+
+    if cache is not None:
+        for key, same_genotype in pending.items():
+            fitness = same_genotype[0]["fitness"]
+            cache.put(key, fitness)
+            for ind in same_genotype[1:]:
+                ind["fitness"] = fitness
+
+def _fitness_cache(params):
+    """FitnessCache of params["fitness_cache_size"] entries, or None if caching is off (size 0)."""
+    cache_size = params.get("fitness_cache_size", 10000)
+    return FitnessCache(cache_size) if cache_size > 0 else None
+
+def _fitness_worker_pool(function, shared_args, params):
+    """
+    WorkerPool with params["workers"] processes for batch fitness evaluation, or a
+    null context (evaluation in this process) for a single worker.
+    """
+    workers = params.get("workers", 1)
+    if workers > 1:
+        return WorkerPool(function, shared_args, workers)
+    return contextlib.nullcontext()
+
 
 # 4. Selection
 def _tournament_selection(population, tournament_size):
@@ -238,7 +298,7 @@ def _crossover(parent1, parent2, agents_list, all_parcel_ids_set):
 # 6. Mutation
 def _mutate(individual, agents_list, all_parcel_ids_set, mutation_rate_param, params):
     """Applies random mutations to an individual."""
-    new_individual = copy.deepcopy(individual) # Work on a copy
+    new_individual = _copy_individual(individual) # Work on a copy
 
     # Mutation 1: Swap two parcels within a random agent's route
     if random.random() < mutation_rate_param:
@@ -286,16 +346,180 @@ def _mutate(individual, agents_list, all_parcel_ids_set, mutation_rate_param, pa
             new_individual["routes"][agent_id].insert(insert_idx, parcel_to_assign)
             new_individual["unassigned"].remove(parcel_to_assign)
             
-    # Re-calculate fitness after mutation
-    _calculate_fitness(new_individual, params['agents_map_ref'], params['parcels_map_ref'], params['warehouse_coords_ref'], params)
+    # Fitness is recalculated with the rest of the new population
     return new_individual
 
+# --- Permutation Encoding ---
+# Each individual is a giant tour: a permutation of the parcel nodes 1..N, stored as one
+# row of a (population_size, N) int array. SplitDecoder cuts a tour optimally into one
+# feasible route per agent (parcels it cannot place are unassigned), so the fitness of a
+# whole generation is computed in one vectorised pass.
+
+def _order_crossover(keep_parents, fill_parents, cut_start, cut_end):
+    """
+    Order crossover (OX) on rows of two parent arrays. Each child keeps
+    keep_parents[cut_start:cut_end] in place and fills the other positions, starting
+    after the cut, with the remaining genes in the order they follow the cut in fill_parents.
+    """
+    num_children, num_genes = keep_parents.shape
+    rows = np.arange(num_children)[:, np.newaxis]
+    columns = np.arange(num_genes)
+    in_segment = (columns >= cut_start[:, np.newaxis]) & (columns < cut_end[:, np.newaxis])
+    gene_in_segment = np.zeros((num_children, num_genes + 1), dtype=bool) # Indexed by node (1..N)
+    gene_in_segment[rows, keep_parents] = in_segment
+
+    wrapped = (cut_end[:, np.newaxis] + columns) % num_genes # Positions from the second cut, wrapping
+    fill_genes = fill_parents[rows, wrapped]
+    # Stable sort moves the genes still needed to the front, in fill order
+    fill_order = np.argsort(gene_in_segment[rows, fill_genes], axis=1, kind="stable")
+    fill_genes = fill_genes[rows, fill_order]
+
+    children = keep_parents.copy()
+    outside = columns < (num_genes - (cut_end - cut_start))[:, np.newaxis]
+    children[np.broadcast_to(rows, outside.shape)[outside], wrapped[outside]] = fill_genes[outside]
+    return children
+
+def _swap_mutation(population, rows, mutation_strength, rng):
+    """Swaps two random genes in each given row, then again with probability mutation_strength, and so on."""
+    num_genes = population.shape[1]
+    for _ in range(num_genes): # Bounds the number of swaps if mutation_strength is 1
+        if not len(rows):
+            break
+        first = rng.integers(0, num_genes, len(rows))
+        second = rng.integers(0, num_genes, len(rows))
+        population[rows, first], population[rows, second] = population[rows, second], population[rows, first]
+        rows = rows[rng.random(len(rows)) < mutation_strength]
+
+def _split_costs(tours, decoder):
+    """Split costs of a block of tours (the unit of work sent to pool workers)."""
+    return decoder.costs(tours)
+
+def _evaluate_tours(tours, decoder, pool=None, cache=None):
+    """
+    Split costs of tours, divided into one block per worker if there is a pool.
+    With a cache (keyed by the tour's bytes), only tours not already cached are decoded.
+    """
+    if cache is not None:
+        costs = np.empty(len(tours))
+        pending = {} # Tour key -> rows sharing it
+        for row, tour in enumerate(tours):
+            key = tour.tobytes()
+            if key in pending:
+                cache.hits += 1
+                pending[key].append(row)
+                continue
+            fitness = cache.get(key)
+            if fitness is None:
+                pending[key] = [row]
+            else:
+                costs[row] = fitness
+        if pending:
+            first_rows = [rows[0] for rows in pending.values()]
+            new_costs = _evaluate_tours(tours[first_rows], decoder, pool)
+            for (key, rows), fitness in zip(pending.items(), new_costs.tolist()):
+                cache.put(key, fitness)
+                costs[rows] = fitness
+        return costs
+    if pool is None or len(tours) < 2:
+        return decoder.costs(tours)
+    return np.concatenate(pool.map(np.array_split(tours, min(pool.num_workers, len(tours)))))
+
+def _run_permutation_ga(instance, warehouse_coords, params, cache=None):
+    """GA over giant-tour permutations (see Permutation Encoding above)."""
+    population_size = params.get("population_size", 50)
+    num_generations = params.get("num_generations", 100)
+    crossover_rate = params.get("crossover_rate", 0.8)
+    mutation_rate_individual = params.get("mutation_rate", 0.1)
+    mutation_strength_gene = params.get("mutation_strength", 0.2)
+    tournament_size = params.get("tournament_size", 5)
+    elitism_count = min(params.get("elitism_count", 2), population_size)
+
+    decoder = SplitDecoder(instance, params.get("return_to_warehouse", True),
+                           params.get("penalty_unassigned_parcel", 1000.0))
+    rng = np.random.default_rng(random.getrandbits(64)) # Follows the random module's seed
+    num_parcels = instance.num_parcels
+
+    with _fitness_worker_pool(_split_costs, (decoder,), params) as pool:
+        # Initialize population: random permutations of the parcel nodes
+        population = rng.permuted(np.tile(np.arange(1, num_parcels + 1), (population_size, 1)), axis=1)
+        fitness = _evaluate_tours(population, decoder, pool, cache)
+
+        best_index = int(np.argmin(fitness))
+        best_tour = population[best_index].copy()
+        best_fitness = float(fitness[best_index])
+        print(f"GA Initial Best Fitness: {best_fitness}")
+
+        num_offspring = population_size - elitism_count
+        num_pairs = (num_offspring + 1) // 2
+        pair_rows = np.arange(num_pairs)
+
+        # GA Main Loop
+        for gen in range(num_generations):
+            # Elitism: Carry over best individuals (they keep their fitness)
+            elite = np.argsort(fitness, kind="stable")[:elitism_count]
+
+            # Tournament selection for all parents at once
+            contenders = rng.integers(0, population_size, (2 * num_pairs, tournament_size))
+            parents = contenders[np.arange(2 * num_pairs), np.argmin(fitness[contenders], axis=1)]
+            parents1 = population[parents[:num_pairs]]
+            parents2 = population[parents[num_pairs:]]
+
+            # Order crossover for the pairs that cross; the others pass on copies of their parents
+            offspring1, offspring2 = parents1.copy(), parents2.copy()
+            crossing = pair_rows[rng.random(num_pairs) < crossover_rate]
+            changed = np.zeros(2 * num_pairs, dtype=bool)
+            if len(crossing) and num_parcels:
+                cuts = np.sort(rng.integers(0, num_parcels, (len(crossing), 2)), axis=1)
+                cut_start, cut_end = cuts[:, 0], cuts[:, 1] + 1
+                offspring1[crossing] = _order_crossover(parents1[crossing], parents2[crossing], cut_start, cut_end)
+                offspring2[crossing] = _order_crossover(parents2[crossing], parents1[crossing], cut_start, cut_end)
+                changed[crossing] = True
+                changed[crossing + num_pairs] = True
+            offspring = np.concatenate((offspring1, offspring2))[:num_offspring]
+            changed = changed[:num_offspring]
+
+            if num_parcels:
+                mutating = np.flatnonzero(rng.random(num_offspring) < mutation_rate_individual)
+                _swap_mutation(offspring, mutating, mutation_strength_gene, rng)
+                changed[mutating] = True
+
+            # Unchanged copies keep their parent's fitness; only new tours are decoded
+            offspring_fitness = fitness[parents[:num_offspring]]
+            offspring_fitness[changed] = _evaluate_tours(offspring[changed], decoder, pool, cache)
+
+            population = np.concatenate((population[elite], offspring))
+            fitness = np.concatenate((fitness[elite], offspring_fitness))
+
+            current_gen_best_index = int(np.argmin(fitness))
+            if fitness[current_gen_best_index] < best_fitness:
+                best_tour = population[current_gen_best_index].copy()
+                best_fitness = float(fitness[current_gen_best_index])
+
+            if (gen + 1) % 10 == 0: # Log every 10 generations
+                 print(f"Generation {gen+1}/{num_generations} - Best Fitness: {best_fitness:.2f}, Current Gen Best: {fitness[current_gen_best_index]:.2f}")
+
+    print(f"GA Final Best Fitness: {best_fitness}")
+
+    # Decode the best tour into the routes/unassigned structure used for output
+    routes, unassigned, best_fitness = decoder.decode(best_tour)
+    node_ids = instance.node_ids
+    best_individual = {
+        "routes": {agent_id: [node_ids[node] for node in routes[agent_idx]]
+                   for agent_idx, agent_id in enumerate(instance.agent_ids)},
+        "unassigned": [node_ids[node] for node in unassigned],
+        "fitness": best_fitness
+    }
+    return _format_solution_for_output(best_individual, instance, warehouse_coords, params)
+
+
 # --- Formatting Output (Similar to SA) ---
-def _format_solution_for_output(best_individual, agents_map, parcels_map, warehouse_coords, params):
+def _format_solution_for_output(best_individual, instance, warehouse_coords, params):
     """Formats the best GA individual into the required DVRS output structure."""
     optimised_routes_output = []
-    time_per_dist_unit = params.get("time_per_distance_unit", 2.0)
-    default_service_time = params.get("default_service_time", 10)
+    distance_rows = instance.as_list("distance")
+    travel_time_rows = instance.as_list("travel_time")
+    tw_open = instance.as_list("tw_open")
+    service_times = instance.as_list("service_times")
     return_to_warehouse_flag = params.get("return_to_warehouse", True)
     
     best_routes_struct = best_individual["routes"]
@@ -303,8 +527,9 @@ def _format_solution_for_output(best_individual, agents_map, parcels_map, wareho
     assigned_parcel_ids_globally = set()
 
     for agent_id, parcel_ids_in_route in best_routes_struct.items():
-        agent_config = agents_map.get(agent_id)
-        if not agent_config: continue
+        agent_idx = instance.agent_index.get(agent_id)
+        if agent_idx is None: continue
+        agent_config = instance.agents[agent_idx]
         
         if not parcel_ids_in_route and not return_to_warehouse_flag:
             continue
@@ -335,33 +560,31 @@ def _format_solution_for_output(best_individual, agents_map, parcels_map, wareho
         output_route_stop_coords_sim = [list(warehouse_coords)]
         output_arrival_times_sim = [round(current_time_sim)]
         output_departure_times_sim = [round(current_time_sim)]
-        current_loc_for_calc_sim = list(warehouse_coords)
+        from_node_sim = WAREHOUSE_NODE
 
         for stop_idx in range(1, len(route_stop_ids_final)):
             to_stop_id_sim = route_stop_ids_final[stop_idx]
-            to_coords_sim = _get_coords(to_stop_id_sim, warehouse_coords, parcels_map)
-            if to_coords_sim is None: continue
+            to_node_sim = instance.matrices.node_index.get(to_stop_id_sim)
+            if to_node_sim is None: continue
+            to_coords_sim = warehouse_coords if to_node_sim == WAREHOUSE_NODE else instance.parcel_of(to_node_sim)["coordinates_x_y"]
 
-            dist_sim = _calculate_distance(current_loc_for_calc_sim, to_coords_sim)
-            route_total_dist_sim += dist_sim
-            travel_time_sim = dist_sim * time_per_dist_unit
+            route_total_dist_sim += distance_rows[from_node_sim][to_node_sim]
+            travel_time_sim = travel_time_rows[from_node_sim][to_node_sim]
             arrival_at_current_physical_sim = current_time_sim + travel_time_sim
             
             output_route_stop_coords_sim.append(list(to_coords_sim))
             output_arrival_times_sim.append(round(arrival_at_current_physical_sim))
 
-            if to_stop_id_sim == "Warehouse":
+            if to_node_sim == WAREHOUSE_NODE:
                 current_time_sim = arrival_at_current_physical_sim
                 output_departure_times_sim.append(round(current_time_sim))
             else:
-                parcel_obj_sim = parcels_map.get(to_stop_id_sim)
-                if not parcel_obj_sim: continue
-
-                output_parcels_details.append(copy.deepcopy(parcel_obj_sim))
+                parcel_obj_sim = instance.parcel_of(to_node_sim)
+                output_parcels_details.append(parcel_obj_sim)
                 assigned_parcel_ids_globally.add(to_stop_id_sim)
 
-                parcel_tw_open_sim = parcel_obj_sim.get("time_window_open", 0)
-                parcel_service_time_sim = parcel_obj_sim.get("service_time", default_service_time)
+                parcel_tw_open_sim = tw_open[to_node_sim]
+                parcel_service_time_sim = service_times[to_node_sim]
                 
                 actual_service_start_time_sim = max(arrival_at_current_physical_sim, parcel_tw_open_sim)
                 departure_from_current_sim = actual_service_start_time_sim + parcel_service_time_sim
@@ -370,7 +593,7 @@ def _format_solution_for_output(best_individual, agents_map, parcels_map, wareho
                 
                 current_time_sim = departure_from_current_sim
                 current_total_weight_sim += parcel_obj_sim["weight"]
-                current_loc_for_calc_sim = list(to_coords_sim)
+                from_node_sim = to_node_sim
         
         optimised_routes_output.append({
             "agent_id": agent_id,
@@ -385,9 +608,9 @@ def _format_solution_for_output(best_individual, agents_map, parcels_map, wareho
             "departure_times": output_departure_times_sim
         })
     
-    all_configured_parcel_ids = {p["id"] for p in parcels_map.values()}
+    all_configured_parcel_ids = {p["id"] for p in instance.parcels}
     final_unassigned_output_ids = list(all_configured_parcel_ids - assigned_parcel_ids_globally)
-    final_unassigned_details = [parcels_map[pid] for pid in final_unassigned_output_ids if pid in parcels_map]
+    final_unassigned_details = [instance.parcel_of(instance.node_of(pid)) for pid in final_unassigned_output_ids]
 
     return {
         "status": "success",
@@ -397,6 +620,12 @@ def _format_solution_for_output(best_individual, agents_map, parcels_map, wareho
         "unassigned_parcels_details": final_unassigned_details
     }
 
+def _with_cache_summary(result, cache):
+    """Appends the fitness cache hit/miss counts to the result message."""
+    if cache is not None:
+        result["message"] = f"{result['message']} {cache.summary()}"
+    return result
+
 
 # --- Main Optimisation Function and Schema ---
 def get_params_schema():
@@ -438,6 +667,21 @@ def get_params_schema():
                 "type": "integer", "default": 2, "min": 0, "step": 1,
                 "help": "Number of best individuals to carry over to next generation."
             },
+            {
+                "name": "workers", "label": "Worker Processes",
+                "type": "integer", "default": 1, "min": 1, "step": 1,
+                "help": "Processes used to evaluate each generation's fitness in one batch. 1 evaluates in this process; more start a worker pool that is reused for the whole run (worthwhile for large instances)."
+            },
+            {
+                "name": "fitness_cache_size", "label": "Fitness Cache Size",
+                "type": "integer", "default": 10000, "min": 0, "step": 1000,
+                "help": "Fitness values kept for already evaluated individuals (least recently used dropped first), so identical genotypes are not re-evaluated. 0 disables the cache."
+            },
+            {
+                "name": "encoding", "label": "Encoding",
+                "type": "selectbox", "default": "routes", "options": ["routes", "permutation"],
+                "help": "routes: per-agent route lists with agent-based crossover. permutation: giant-tour permutations (NumPy array) with order crossover and swap mutation, split optimally into feasible agent routes."
+            },
             # VRP Specifics (copied from SA, ensure steps are float for float types)
             {
                 "name": "time_per_distance_unit", "label": "Time per distance unit (minutes)",
@@ -495,10 +739,15 @@ def run_optimisation(config_data, params):
     # Store maps and warehouse_coords in params for easy access in fitness/mutation
     # This is a bit of a workaround to pass more data to static/helper methods
     # without changing their signatures drastically.
-    params['agents_map_ref'] = agents_map
-    params['parcels_map_ref'] = parcels_map
     params['warehouse_coords_ref'] = warehouse_coords
+    # Parcel/agent attribute arrays and routing matrices, built once for the run
+    instance = build_problem_instance(config_data, params, default_time_per_distance_unit=2.0,
+                                      default_service_time=params.get("default_service_time", 10))
 
+    # Fitness of already evaluated genotypes (identical offspring, unchanged parents)
+    cache = _fitness_cache(params)
+    if params.get("encoding", "routes") == "permutation":
+        return _with_cache_summary(_run_permutation_ga(instance, warehouse_coords, params, cache), cache)
 
     population_size = params.get("population_size", 50)
     num_generations = params.get("num_generations", 100)
@@ -508,63 +757,61 @@ def run_optimisation(config_data, params):
     tournament_size = params.get("tournament_size", 5)
     elitism_count = params.get("elitism_count", 2)
 
-    # Initialize population
-    population = _initialize_population(population_size, list(all_parcel_ids_set), agents_list, agents_map)
+    with _fitness_worker_pool(_calculate_fitness, (instance, params), params) as pool:
+        # Initialize population
+        population = _initialize_population(population_size, list(all_parcel_ids_set), agents_list, agents_map)
 
-    # Evaluate initial population
-    for ind in population:
-        _calculate_fitness(ind, agents_map, parcels_map, warehouse_coords, params)
+        # Evaluate initial population
+        _evaluate_population(population, instance, params, pool, cache)
 
-    best_overall_individual = min(population, key=lambda ind: ind["fitness"])
-    print(f"GA Initial Best Fitness: {best_overall_individual['fitness']}")
+        best_overall_individual = min(population, key=lambda ind: ind["fitness"])
+        print(f"GA Initial Best Fitness: {best_overall_individual['fitness']}")
 
-    # GA Main Loop
-    for gen in range(num_generations):
-        new_population = []
+        # GA Main Loop
+        for gen in range(num_generations):
+            new_population = []
 
-        # Elitism: Carry over best individuals
-        if elitism_count > 0:
-            population.sort(key=lambda ind: ind["fitness"]) # Sort by fitness (lower is better)
-            new_population.extend(copy.deepcopy(population[:elitism_count]))
+            # Elitism: Carry over best individuals
+            if elitism_count > 0:
+                population.sort(key=lambda ind: ind["fitness"]) # Sort by fitness (lower is better)
+                new_population.extend(_copy_individual(ind) for ind in population[:elitism_count])
+            num_elites = len(new_population)
 
-        # Fill the rest of the population
-        while len(new_population) < population_size:
-            parent1 = _tournament_selection(population, tournament_size)
-            parent2 = _tournament_selection(population, tournament_size)
+            # Fill the rest of the population
+            while len(new_population) < population_size:
+                parent1 = _tournament_selection(population, tournament_size)
+                parent2 = _tournament_selection(population, tournament_size)
+                
+                if parent1 is None or parent2 is None : # Should not happen with proper population
+                    # Fallback: add random individuals if selection fails
+                    new_population.append(_create_random_individual(list(all_parcel_ids_set), agents_list, agents_map))
+                    continue
+
+                offspring1, offspring2 = parent1, parent2 # Default to parents if no crossover
+                if random.random() < crossover_rate:
+                    offspring1, offspring2 = _crossover(parent1, parent2, agents_list, all_parcel_ids_set)
+                
+                # Mutate offspring (or parents if no crossover)
+                if random.random() < mutation_rate_individual:
+                    offspring1 = _mutate(offspring1, agents_list, all_parcel_ids_set, mutation_strength_gene, params)
+                if random.random() < mutation_rate_individual:
+                    offspring2 = _mutate(offspring2, agents_list, all_parcel_ids_set, mutation_strength_gene, params)
+
+                new_population.append(offspring1)
+                if len(new_population) < population_size:
+                    new_population.append(offspring2)
             
-            if parent1 is None or parent2 is None : # Should not happen with proper population
-                # Fallback: add random individuals if selection fails
-                new_population.append(_create_random_individual(list(all_parcel_ids_set), agents_list, agents_map))
-                _calculate_fitness(new_population[-1], agents_map, parcels_map, warehouse_coords, params)
-                continue
+            # Calculate fitness for the new individuals (elites keep theirs) in one batch
+            _evaluate_population(new_population[num_elites:], instance, params, pool, cache)
+            population = new_population
+            current_gen_best_ind = min(population, key=lambda ind: ind["fitness"])
 
-            offspring1, offspring2 = parent1, parent2 # Default to parents if no crossover
-            if random.random() < crossover_rate:
-                offspring1, offspring2 = _crossover(parent1, parent2, agents_list, all_parcel_ids_set)
+            if current_gen_best_ind["fitness"] < best_overall_individual["fitness"]:
+                best_overall_individual = _copy_individual(current_gen_best_ind)
             
-            # Mutate offspring (or parents if no crossover)
-            if random.random() < mutation_rate_individual:
-                offspring1 = _mutate(offspring1, agents_list, all_parcel_ids_set, mutation_strength_gene, params)
-            if random.random() < mutation_rate_individual:
-                offspring2 = _mutate(offspring2, agents_list, all_parcel_ids_set, mutation_strength_gene, params)
-
-            # Calculate fitness for new offspring (if not already done in mutate)
-            _calculate_fitness(offspring1, agents_map, parcels_map, warehouse_coords, params)
-            _calculate_fitness(offspring2, agents_map, parcels_map, warehouse_coords, params)
-
-            new_population.append(offspring1)
-            if len(new_population) < population_size:
-                new_population.append(offspring2)
-        
-        population = new_population
-        current_gen_best_ind = min(population, key=lambda ind: ind["fitness"])
-
-        if current_gen_best_ind["fitness"] < best_overall_individual["fitness"]:
-            best_overall_individual = copy.deepcopy(current_gen_best_ind)
-        
-        if (gen + 1) % 10 == 0: # Log every 10 generations
-             print(f"Generation {gen+1}/{num_generations} - Best Fitness: {best_overall_individual['fitness']:.2f}, Current Gen Best: {current_gen_best_ind['fitness']:.2f}")
+            if (gen + 1) % 10 == 0: # Log every 10 generations
+                 print(f"Generation {gen+1}/{num_generations} - Best Fitness: {best_overall_individual['fitness']:.2f}, Current Gen Best: {current_gen_best_ind['fitness']:.2f}")
 
 
     print(f"GA Final Best Fitness: {best_overall_individual['fitness']}")
-    return _format_solution_for_output(best_overall_individual, agents_map, parcels_map, warehouse_coords, params)
\ No newline at end of file
+    return _with_cache_summary(_format_solution_for_output(best_overall_individual, instance, warehouse_coords, params), cache)
\ No newline at end of file
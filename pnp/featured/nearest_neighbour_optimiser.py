@@ -1,5 +1,13 @@
 # DVRS Optimisation Script: Greedy Nearest Neighbour
-import math
+import contextlib
+import random
+import time
+
+from packages.optimisation.backend.routing_core import build_problem_instance, WAREHOUSE_NODE
+from packages.optimisation.backend.spatial_index import SpatialGridIndex, point_distance
+from packages.optimisation.backend.worker_pool import WorkerPool
+
+SORT_PARCELS_OPTIONS = ["none", "weight_asc", "weight_desc"]
 
 def get_params_schema():
     return {
@@ -9,7 +17,7 @@ def get_params_schema():
                 "label": "Sort parcels by",
                 "type": "selectbox",
                 "default": "none",
-                "options": ["none", "weight_asc", "weight_desc"],
+                "options": SORT_PARCELS_OPTIONS,
                 "help": "Initial sorting of parcels before assignment"
             },
             {
@@ -37,32 +45,125 @@ def get_params_schema():
                 "min": 0,
                 "step": 1,
                 "help": "Default time spent at each parcel stop for service"
+            },
+            {
+                "name": "multi_starts",
+                "label": "Multi-start runs",
+                "type": "integer",
+                "default": 1,
+                "min": 1,
+                "step": 1,
+                "help": "Greedy runs to try. The first uses the agents in their configured order and the sort option above; every other run uses a random agent order and sort option. The best result is returned (fewest unassigned parcels, then shortest total distance)."
+            },
+            {
+                "name": "time_budget_seconds",
+                "label": "Multi-start time budget (seconds)",
+                "type": "float",
+                "default": 10.0,
+                "min": 0.0,
+                "step": 1.0,
+                "help": "Wall-clock time after which no further multi-start runs are started (runs already started are finished). The first run always completes."
+            },
+            {
+                "name": "workers",
+                "label": "Worker Processes",
+                "type": "integer",
+                "default": 1,
+                "min": 1,
+                "step": 1,
+                "help": "Processes the multi-start runs are divided between. 1 runs them in this process."
             }
         ]
     }
 
-def _calculate_distance(coord1, coord2):
-    # Calculates Euclidean distance between two points.
-    return math.sqrt((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)
-
 def run_optimisation(config_data, params):
+    num_starts = params.get("multi_starts", 1)
+    configured_start = (None, params.get("sort_parcels", "none"))
+    start_time = time.perf_counter()
+    best_result = _greedy_routes(config_data, params, *configured_start)
+    if num_starts <= 1:
+        return best_result
+
+    # Multi-start: random agent orders and sort options, drawn in this process (so they follow
+    # the random module's seed), tried until num_starts runs or the time budget is used up
+    time_budget = params.get("time_budget_seconds", 10.0)
+    num_agents = len(config_data.get("delivery_agents", []))
+    best_start = configured_start
+    best_score = _result_score(best_result)
+    starts_run = 1
+    num_workers = params.get("workers", 1)
+    worker_pool = contextlib.nullcontext()
+    if num_workers > 1:
+        worker_pool = WorkerPool(_evaluate_start, (config_data, params), num_workers)
+    with worker_pool as pool:
+        while starts_run < num_starts and time.perf_counter() - start_time < time_budget:
+            # One start per worker at a time, so the budget is checked between batches
+            batch_size = min(pool.num_workers if pool is not None else 1, num_starts - starts_run)
+            starts = [(random.sample(range(num_agents), num_agents), random.choice(SORT_PARCELS_OPTIONS))
+                      for _ in range(batch_size)]
+            if pool is None:
+                results = [_greedy_routes(config_data, params, *starts[0])]
+                scores = [_result_score(results[0])]
+            else:
+                results = [None] * batch_size # Only the best start is rebuilt, in this process
+                scores = pool.map(starts)
+            for start, result, score in zip(starts, results, scores):
+                if score < best_score:
+                    best_start, best_result, best_score = start, result, score
+            starts_run += batch_size
+
+    if best_result is None:
+        best_result = _greedy_routes(config_data, params, *best_start)
+    agent_order, sort_parcels = best_start
+    best_run = "configured agent order" if agent_order is None else "random agent order"
+    best_result["message"] = (f"Greedy optimisation completed (best of {starts_run} multi-start runs: "
+                              f"{best_run}, parcels sorted by {sort_parcels}).")
+    return best_result
+
+def _result_score(result):
+    """(unassigned parcels, total distance) of a greedy result; lower is better."""
+    return (len(result["unassigned_parcels"]),
+            sum(route["total_distance"] for route in result["optimised_routes"]))
+
+def _evaluate_start(start, config_data, params):
+    """Score of the greedy run for start = (agent_order, sort_parcels), for worker processes."""
+    return _result_score(_greedy_routes(config_data, params, *start))
+
+def _greedy_routes(config_data, params, agent_order, sort_parcels):
+    """
+    Greedy nearest-neighbour routes, taking the agents in agent_order (indices into
+    delivery_agents, or None for their configured order) with parcels sorted by
+    sort_parcels (one of SORT_PARCELS_OPTIONS).
+    """
     warehouse_coords = config_data.get("warehouse_coordinates_x_y", [0,0])
     unassigned_parcels = [dict(p) for p in config_data.get("parcels", [])]
     delivery_agents = config_data.get("delivery_agents", [])
+    if agent_order is not None:
+        delivery_agents = [delivery_agents[i] for i in agent_order]
     
     # Sort parcels based on time window opening if not already sorted
-    if params.get("sort_parcels", "none") == "none":
+    if sort_parcels == "none":
         unassigned_parcels.sort(key=lambda x: x.get("time_window_open", 0))
-    elif params["sort_parcels"] != "none":
-        reverse_sort = params["sort_parcels"] == "weight_desc"
+    else:
+        reverse_sort = sort_parcels == "weight_desc"
         unassigned_parcels.sort(key=lambda x: x["weight"], reverse=reverse_sort)
 
     optimised_routes = []
     parcels_assigned_globally = set()
-    time_per_dist_unit = params.get("time_per_distance_unit", 2.0)
-    default_service_time = params.get("default_service_time", 10)
+    # Parcel attributes by node id, built once for the run. Distances come from coordinates
+    # (equal to the routing matrix entries), so no O(N^2) matrix is built.
+    instance = build_problem_instance(config_data, params, default_time_per_distance_unit=2.0,
+                                      default_service_time=params.get("default_service_time", 10))
+    time_per_distance_unit = instance.matrices.time_per_distance_unit
+    coordinates = instance.as_list("coordinates")
+    parcel_weights = instance.as_list("weights")
+    parcel_tw_opens = instance.as_list("tw_open")
+    parcel_tw_closes = instance.as_list("tw_close")
+    parcel_service_times = instance.as_list("service_times")
+    warehouse_point = coordinates[WAREHOUSE_NODE]
+    warehouse_distances = [point_distance(point, warehouse_point) for point in coordinates]
+    latest_tw_close = max(parcel_tw_closes[1:], default=0)
     return_to_warehouse_flag = params.get("return_to_warehouse", True)
-    sort_parcels_option = params.get("sort_parcels", "none")
 
     # Ensure all parcels have required fields
     for p in unassigned_parcels:
@@ -71,86 +172,97 @@ def run_optimisation(config_data, params):
         if "time_window_close" not in p:
             p["time_window_close"] = 1439  # 23:59
 
+    # Unassigned parcels by node, and a spatial index over them that yields candidates nearest
+    # first (equal distances in sorted parcel order, as the original linear scan picked them)
+    unassigned_parcel_by_node = {instance.node_of(p["id"]): p for p in unassigned_parcels}
+    unassigned_index = SpatialGridIndex(unassigned_parcel_by_node, coordinates)
+    # Unassigned parcels by weight (assigned ones are skipped lazily), so an agent whose
+    # remaining capacity fits no parcel stops without a search
+    nodes_by_weight = sorted(unassigned_parcel_by_node, key=lambda node: parcel_weights[node])
+    lightest_position = 0
+
     for agent in delivery_agents:
         current_capacity = agent["capacity_weight"]
-        current_location = list(warehouse_coords) # Use a mutable copy
+        current_node = WAREHOUSE_NODE
         # Agent's time starts at their operating_hours_start
         agent_op_start_time = agent.get("operating_hours_start", 0) # Default to 0 (midnight) if not specified
         agent_op_end_time = agent.get("operating_hours_end", 1439) # Default to 1439 (23:59)
         current_time = agent_op_start_time
 
         agent_route_parcels = [] # List of parcel objects for this agent
-        agent_route_stops_coords = [list(warehouse_coords)] # List of coordinates for distance calculation
+        agent_route_stops_coords = [list(warehouse_coords)] # List of coordinates for display
         agent_route_stop_ids = ["Warehouse"] # List of IDs for display
         agent_arrival_times = [current_time] # Arrival at warehouse is op_start_time
         agent_departure_times = [current_time] # Departure from warehouse is also op_start_time initially
         current_time = agent_op_start_time  # Reset to ensure clean start
 
+        total_distance = 0.0
+
         while True:
-            best_parcel_idx = -1
-            min_dist_candidate = float('inf')
-            best_parcel_candidate_details = None
-
-            # Find the nearest, eligible, unassigned parcel
-            for i, parcel_data in enumerate(unassigned_parcels):
-                if parcel_data["weight"] <= current_capacity:
-                    parcel_coords = parcel_data["coordinates_x_y"]
-                    dist_to_parcel = _calculate_distance(current_location, parcel_coords)
-                    travel_time = dist_to_parcel * time_per_dist_unit
-
-                    # Timing for this specific candidate parcel
-                    candidate_physical_arrival = current_time + travel_time # current_time is departure from previous stop
-                    parcel_tw_open = parcel_data.get("time_window_open", 0)
-                    parcel_tw_close = parcel_data.get("time_window_close", 1439)
-                    parcel_service_time = parcel_data.get("service_time", default_service_time)
-
-                    candidate_service_start_time = max(candidate_physical_arrival, parcel_tw_open)
-                    candidate_service_end_time = candidate_service_start_time + parcel_service_time
-
-                    feasible = True
-                    if candidate_service_end_time > parcel_tw_close:
-                        feasible = False
-                    if candidate_service_end_time > agent_op_end_time: # Agent cannot finish service within op hours
-                        feasible = False
-                    
-                    if return_to_warehouse_flag:
-                        dist_from_parcel_to_wh = _calculate_distance(parcel_coords, warehouse_coords)
-                        travel_time_to_wh = dist_from_parcel_to_wh * time_per_dist_unit
-                        arrival_at_wh_after_parcel = candidate_service_end_time + travel_time_to_wh
-                        if arrival_at_wh_after_parcel > agent_op_end_time:
-                            feasible = False
-
-                    if feasible and dist_to_parcel < min_dist_candidate:
-                        min_dist_candidate = dist_to_parcel
-                        best_parcel_idx = i
-                        # Store all necessary details for the best candidate found so far
-                        best_parcel_candidate_details = {
-                            "parcel_data": parcel_data, # Keep the data object
-                            "physical_arrival": candidate_physical_arrival,
-                            "service_end": candidate_service_end_time
-                        }
+            while lightest_position < len(nodes_by_weight) and nodes_by_weight[lightest_position] not in unassigned_parcel_by_node:
+                lightest_position += 1
+            if lightest_position == len(nodes_by_weight) or parcel_weights[nodes_by_weight[lightest_position]] > current_capacity:
+                break # No parcel left that fits the remaining capacity
+
+            best_parcel_node = None
+            best_parcel_distance = None
+            best_candidate_arrival = None
+            best_candidate_service_end = None
+
+            # Find the nearest, eligible, unassigned parcel: candidates come nearest first,
+            # so the first feasible one is the nearest. Service cannot end before the arrival,
+            # so parcels farther than the travel time left before the agent's end (or the
+            # latest time window close) are never feasible; the bound is slightly widened
+            # against rounding, the checks below stay exact.
+            if time_per_distance_unit > 0:
+                time_left = min(agent_op_end_time, latest_tw_close) - current_time
+                max_candidate_distance = time_left / time_per_distance_unit * (1 + 1e-9) + 1e-9
+            else:
+                max_candidate_distance = float('inf')
+            for dist_to_parcel, parcel_node in unassigned_index.nearest(coordinates[current_node], max_candidate_distance):
+                if parcel_weights[parcel_node] > current_capacity:
+                    continue
+                travel_time = dist_to_parcel * time_per_distance_unit
+
+                # Timing for this specific candidate parcel
+                candidate_physical_arrival = current_time + travel_time # current_time is departure from previous stop
+                candidate_service_start_time = max(candidate_physical_arrival, parcel_tw_opens[parcel_node])
+                candidate_service_end_time = candidate_service_start_time + parcel_service_times[parcel_node]
+
+                if candidate_service_end_time > parcel_tw_closes[parcel_node]:
+                    continue
+                if candidate_service_end_time > agent_op_end_time: # Agent cannot finish service within op hours
+                    continue
+                if return_to_warehouse_flag:
+                    travel_time_to_wh = warehouse_distances[parcel_node] * time_per_distance_unit
+                    if candidate_service_end_time + travel_time_to_wh > agent_op_end_time:
+                        continue
+
+                best_parcel_node = parcel_node
+                best_parcel_distance = dist_to_parcel
+                best_candidate_arrival = candidate_physical_arrival
+                best_candidate_service_end = candidate_service_end_time
+                break
             
-            if best_parcel_idx != -1: # Check if a best parcel was found
-                try:
-                    # Assign the best found parcel
-                    assigned_parcel_data = unassigned_parcels.pop(best_parcel_idx) # Remove from unassigned
-                    parcels_assigned_globally.add(assigned_parcel_data["id"])
-
-                    agent_route_parcels.append(assigned_parcel_data)
-                    agent_route_stops_coords.append(list(assigned_parcel_data["coordinates_x_y"]))
-                    agent_route_stop_ids.append(assigned_parcel_data["id"])
-                except (KeyError, IndexError) as e:
-                    print(f"Error assigning parcel: {e}")
-                    continue  # Skip this parcel if any issues
+            if best_parcel_node is not None: # Check if a best parcel was found
+                # Assign the best found parcel
+                assigned_parcel_data = unassigned_parcel_by_node.pop(best_parcel_node) # Remove from unassigned
+                unassigned_index.remove(best_parcel_node)
+                parcels_assigned_globally.add(assigned_parcel_data["id"])
+
+                agent_route_parcels.append(assigned_parcel_data)
+                agent_route_stops_coords.append(list(assigned_parcel_data["coordinates_x_y"]))
+                agent_route_stop_ids.append(assigned_parcel_data["id"])
+                total_distance += best_parcel_distance
                 
                 # Append calculated times for the selected parcel
-                agent_arrival_times.append(round(best_parcel_candidate_details["physical_arrival"]))
-                agent_departure_times.append(round(best_parcel_candidate_details["service_end"]))
+                agent_arrival_times.append(round(best_candidate_arrival))
+                agent_departure_times.append(round(best_candidate_service_end))
                 
                 current_capacity -= assigned_parcel_data["weight"]
-                current_location = list(assigned_parcel_data["coordinates_x_y"])
+                current_node = best_parcel_node
                 # Update agent's current time to be the departure time from the just-assigned parcel
-                current_time = best_parcel_candidate_details["service_end"]
+                current_time = best_candidate_service_end
             else:
                 # No more parcels can be assigned to this agent
                 break
@@ -159,16 +271,14 @@ def run_optimisation(config_data, params):
         if params.get("return_to_warehouse", True):
             agent_route_stops_coords.append(list(warehouse_coords))
             agent_route_stop_ids.append("Warehouse")
-            dist_to_wh = _calculate_distance(current_location, warehouse_coords)
-            travel_time_to_wh = dist_to_wh * time_per_dist_unit
+            travel_time_to_wh = warehouse_distances[current_node] * time_per_distance_unit
             arrival_at_wh = current_time + travel_time_to_wh
             agent_arrival_times.append(round(arrival_at_wh))
             agent_departure_times.append(round(arrival_at_wh)) # Arrival and departure are same for final WH
 
-        # Calculate total distance for the agent's route
-        total_distance = 0
-        for i in range(len(agent_route_stops_coords) - 1):
-            total_distance += _calculate_distance(agent_route_stops_coords[i], agent_route_stops_coords[i+1])
+        # Total distance for the agent's route: legs summed in route order (+ return leg)
+        if params.get("return_to_warehouse", True):
+            total_distance += warehouse_distances[current_node]
 
         if agent_route_parcels: # Only add route if parcels were assigned
             optimised_routes.append({
@@ -1,6 +1,8 @@
-import math
 import random
-import copy
+import numpy as np
+from packages.optimisation.backend.fitness_cache import FitnessCache
+from packages.optimisation.backend.routing_core import build_problem_instance, WAREHOUSE_NODE
+from packages.optimisation.backend.route_state import RouteState, generic_route_profile
 
 # --- Schema Default Constants (for adaptive logic) ---
 SCHEMA_DEFAULT_NUM_ITERATIONS = 100
@@ -101,22 +103,40 @@ def get_params_schema():
                 "default": 720, # 12 hours, made more accommodating
                 "min": 30,
                 "help": "Maximum duration for a route (warehouse-to-warehouse) during PSO's internal route building."
+            },
+            {
+                "name": "decode_cache_size",
+                "label": "Decode Cache Size",
+                "type": "integer",
+                "default": 10000,
+                "min": 0,
+                "step": 1000,
+                "help": "Decoded particle permutations (fitness and routes) kept so an unchanged permutation is never decoded again; least recently used dropped first. 0 disables the cache."
+            },
+            {
+                "name": "decoder",
+                "label": "Permutation Decoder",
+                "type": "selectbox",
+                "default": "greedy",
+                "options": ["greedy", "split", "optimal_split"],
+                "help": "How a particle's parcel order becomes routes. greedy: each route takes every remaining parcel that still fits, in order (O(n^2) checks). split: one pass, starting a new route whenever the next parcel does not fit (O(n), fastest). optimal_split: cuts the order into consecutive routes with the fewest unassigned parcels, then least distance (shortest path over the order)."
             }
         ]
     }
 
-def _calculate_distance(coord1, coord2):
-    return math.sqrt((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)
-
 def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, # List of parcel objects
                                               agent_or_generic_constraints,
-                                              warehouse_coords, params, parcel_map_for_lookup):
+                                              warehouse_coords, instance):
     """
     Calculates schedule for a sequence of parcels against specific agent or generic constraints.
     Returns: (is_feasible, schedule_details_dict)
     """
-    time_per_dist_unit = params.get("time_per_distance_unit", 2.0)
-    default_service_time = params.get("default_service_time", 10)
+    distance_rows = instance.as_list("distance")
+    travel_time_rows = instance.as_list("travel_time")
+    weights = instance.as_list("weights")
+    tw_open = instance.as_list("tw_open")
+    tw_close = instance.as_list("tw_close")
+    service_times = instance.as_list("service_times")
 
     is_specific_agent = "operating_hours_start" in agent_or_generic_constraints
     if is_specific_agent:
@@ -134,25 +154,23 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, # List of
     departure_times = [round(route_start_time)]
 
     current_time_on_route = route_start_time
-    current_location = list(warehouse_coords)
+    current_node = WAREHOUSE_NODE
     current_load = 0
     total_distance = 0.0
 
-    for p_obj_original in ordered_parcel_objects:
-        p_obj = parcel_map_for_lookup.get(p_obj_original["id"], p_obj_original)
+    for p_obj in ordered_parcel_objects:
         p_id = p_obj["id"]
-        p_coords = p_obj["coordinates_x_y"]
-        p_weight = p_obj["weight"]
-        p_service_time = p_obj.get("service_time", default_service_time)
-        p_tw_open = p_obj.get("time_window_open", 0)
-        p_tw_close = p_obj.get("time_window_close", 1439)
+        p_node = instance.node_of(p_id)
+        p_weight = weights[p_node]
+        p_service_time = service_times[p_node]
+        p_tw_open = tw_open[p_node]
+        p_tw_close = tw_close[p_node]
 
         current_load += p_weight
         if current_load > vehicle_capacity: return False, {}
 
-        dist_to_parcel = _calculate_distance(current_location, p_coords)
-        total_distance += dist_to_parcel
-        travel_time = dist_to_parcel * time_per_dist_unit
+        total_distance += distance_rows[current_node][p_node]
+        travel_time = travel_time_rows[current_node][p_node]
         physical_arrival_at_parcel = current_time_on_route + travel_time
         actual_service_start_time = max(physical_arrival_at_parcel, p_tw_open)
 
@@ -162,15 +180,14 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, # List of
         if is_specific_agent and actual_service_end_time > vehicle_op_end_time: return False, {}
 
         route_stop_ids.append(p_id)
-        route_stop_coordinates.append(list(p_coords))
+        route_stop_coordinates.append(list(p_obj["coordinates_x_y"]))
         arrival_times.append(round(physical_arrival_at_parcel))
         departure_times.append(round(actual_service_end_time))
         current_time_on_route = actual_service_end_time
-        current_location = list(p_coords)
+        current_node = p_node
 
-    dist_to_warehouse = _calculate_distance(current_location, warehouse_coords)
-    total_distance += dist_to_warehouse
-    travel_time_to_wh = dist_to_warehouse * time_per_dist_unit
+    total_distance += distance_rows[current_node][WAREHOUSE_NODE]
+    travel_time_to_wh = travel_time_rows[current_node][WAREHOUSE_NODE]
     physical_arrival_at_warehouse_final = current_time_on_route + travel_time_to_wh
 
     if is_specific_agent and physical_arrival_at_warehouse_final > vehicle_op_end_time: return False, {}
@@ -189,55 +206,43 @@ def _calculate_route_schedule_and_feasibility(ordered_parcel_objects, # List of
         "route_duration_actual": round(route_duration_from_wh_to_wh)
     }
 
-def _decode_particle_to_routes_and_evaluate(particle_position_keys, # List of random keys
+def _decode_particle_to_routes_and_evaluate(permutation_indices, # Parcel positions sorted by the particle's keys
                                             all_parcel_objects_original_order, # To map sorted keys back to parcels
-                                            warehouse_coords, params, parcel_map_for_lookup,
-                                            effective_generic_constraints_for_decode): # New argument
+                                            decode_route_profile): # RouteProfile for the generic constraints
     """
-    Decodes a particle's random key position into a set of routes using generic constraints.
+    Decodes a particle's parcel permutation (its random keys in sorted order, see
+    Swarm.permutations) into a set of routes using generic constraints.
+    Parcel position i in the permutation is routing node i + 1.
     Returns: (fitness_tuple, list_of_routes_of_parcel_objects, list_of_unassigned_parcel_objects)
     Fitness tuple: (number_of_unassigned_parcels, total_distance_of_assigned_routes)
     """
-    # Create pairs of (key, parcel_object) then sort by key to get permutation
-    keyed_parcels = sorted(zip(particle_position_keys, all_parcel_objects_original_order), key=lambda x: x[0])
-    parcel_permutation = [p_obj for key, p_obj in keyed_parcels]
-
-
     routes_formed_parcels = [] # List of lists of parcel objects
     parcels_assigned_in_solution = set()
     total_distance_for_solution = 0.0
     
-    parcels_to_assign_in_permutation = list(parcel_permutation) # Make a mutable copy
+    parcels_to_assign_in_permutation = permutation_indices
 
     while parcels_to_assign_in_permutation:
-        current_route_parcels = []
         # Try to build one route using generic constraints
+        route_state = RouteState(decode_route_profile)
         
         # Greedily add parcels from the *remaining* permutation
         temp_unassigned_this_route = []
-        for i in range(len(parcels_to_assign_in_permutation)):
-            p_obj_to_try = parcels_to_assign_in_permutation[i]
-            
-            # Check if adding this parcel is feasible for the current_route_parcels
-            temp_candidate_route = current_route_parcels + [p_obj_to_try]
-            is_feasible_addition, _ = _calculate_route_schedule_and_feasibility(
-                temp_candidate_route, effective_generic_constraints_for_decode, warehouse_coords, params, parcel_map_for_lookup
-            )
-            if is_feasible_addition:
-                current_route_parcels.append(p_obj_to_try)
+        for parcel_index in parcels_to_assign_in_permutation:
+            # Check if appending this parcel keeps the current route feasible
+            if route_state.can_append(parcel_index + 1):
+                route_state.append(parcel_index + 1)
             else:
-                temp_unassigned_this_route.append(p_obj_to_try)
+                temp_unassigned_this_route.append(parcel_index)
         
         # Update parcels_to_assign_in_permutation for the next route attempt
         parcels_to_assign_in_permutation = temp_unassigned_this_route
 
-        if current_route_parcels: # A valid route was formed
-            # Final calculation for this route's details
-            _, route_details = _calculate_route_schedule_and_feasibility(
-                current_route_parcels, effective_generic_constraints_for_decode, warehouse_coords, params, parcel_map_for_lookup
-            )
+        if route_state.nodes: # A valid route was formed
+            current_route_parcels = [all_parcel_objects_original_order[node - 1] for node in route_state.nodes]
             routes_formed_parcels.append(current_route_parcels) # Store list of parcel objects
-            total_distance_for_solution += route_details["total_distance"]
+            # Rounded like the scheduler's total_distance
+            total_distance_for_solution += round(route_state.total_distance(), 2)
             for p_obj in current_route_parcels:
                 parcels_assigned_in_solution.add(p_obj["id"])
         else: # No parcel could be added to start/continue this route
@@ -249,37 +254,164 @@ def _decode_particle_to_routes_and_evaluate(particle_position_keys, # List of ra
     return fitness, routes_formed_parcels, unassigned_parcel_objects
 
 
-class Particle:
-    def __init__(self, num_dimensions, pos_min=0.0, pos_max=1.0, max_velocity_factor=0.2):
-        self.position = [random.uniform(pos_min, pos_max) for _ in range(num_dimensions)]
-        self.velocity = [random.uniform(-max_velocity_factor, max_velocity_factor) for _ in range(num_dimensions)] # Vmax based on range of 1.0
-        self.pbest_position = list(self.position)
-        self.pbest_fitness = (float('inf'), float('inf')) # (unassigned_count, total_distance)
-        self.current_fitness = (float('inf'), float('inf'))
-        self.current_routes_parcels = [] # List of lists of parcel objects
+def _split_result(route_states, all_parcel_objects_original_order):
+    """(fitness_tuple, routes, unassigned) in the format of _decode_particle_to_routes_and_evaluate."""
+    routes_formed_parcels = [[all_parcel_objects_original_order[node - 1] for node in route_state.nodes]
+                             for route_state in route_states]
+    # Rounded like the scheduler's total_distance
+    total_distance_for_solution = 0.0
+    for route_state in route_states:
+        total_distance_for_solution += round(route_state.total_distance(), 2)
+    assigned_nodes = {node for route_state in route_states for node in route_state.nodes}
+    unassigned_parcel_objects = [p for node, p in enumerate(all_parcel_objects_original_order, start=1)
+                                 if node not in assigned_nodes]
+    fitness = (len(unassigned_parcel_objects), total_distance_for_solution)
+    return fitness, routes_formed_parcels, unassigned_parcel_objects
+
+def _split_particle_to_routes_and_evaluate(permutation_indices, all_parcel_objects_original_order, decode_route_profile):
+    """
+    Splits a particle's parcel permutation into consecutive routes in one pass: each parcel is
+    appended to the current route if it stays feasible, otherwise it starts a new route.
+    Parcels that cannot even start a route are unassigned. O(n) feasibility checks.
+    Returns the same (fitness_tuple, routes, unassigned) as _decode_particle_to_routes_and_evaluate.
+    """
+    route_states = []
+    route_state = RouteState(decode_route_profile)
+    for parcel_index in permutation_indices:
+        node = parcel_index + 1
+        if route_state.can_append(node):
+            route_state.append(node)
+            continue
+        new_route_state = RouteState(decode_route_profile)
+        if not new_route_state.can_append(node): # Infeasible on its own: leave unassigned
+            continue
+        if route_state.nodes:
+            route_states.append(route_state)
+        route_state = new_route_state
+        route_state.append(node)
+    if route_state.nodes:
+        route_states.append(route_state)
+    return _split_result(route_states, all_parcel_objects_original_order)
+
+def _optimal_split_particle_to_routes_and_evaluate(permutation_indices, all_parcel_objects_original_order, decode_route_profile):
+    """
+    Optimal split of a particle's parcel permutation into consecutive routes: a shortest path
+    over the permutation DAG, where an edge i -> j is the route of parcels i..j-1 (feasible as
+    built by appending). As in the one-pass split, parcels that cannot start a route on their
+    own are unassigned and left out of the order, so every remaining parcel is assigned and the
+    split has the least total distance. O(n * route length) feasibility checks.
+    Returns the same (fitness_tuple, routes, unassigned) as _decode_particle_to_routes_and_evaluate.
+    """
+    empty_route_state = RouteState(decode_route_profile)
+    nodes = [parcel_index + 1 for parcel_index in permutation_indices if empty_route_state.can_append(parcel_index + 1)]
+    num_nodes = len(nodes)
+    best_distance = [0.0] + [float('inf')] * num_nodes # best_distance[j]: least distance of nodes[:j]
+    route_start = [0] * (num_nodes + 1) # Start of the last route of that split
+
+    for i in range(num_nodes):
+        distance = best_distance[i]
+        route_state = RouteState(decode_route_profile)
+        for j in range(i, num_nodes):
+            if not route_state.can_append(nodes[j]):
+                break
+            route_state.append(nodes[j])
+            candidate = distance + round(route_state.total_distance(), 2)
+            if candidate < best_distance[j + 1]:
+                best_distance[j + 1] = candidate
+                route_start[j + 1] = i
+
+    # Rebuild the routes from the back pointers
+    route_states = []
+    j = num_nodes
+    while j > 0:
+        i = route_start[j]
+        route_state = RouteState(decode_route_profile)
+        for node in nodes[i:j]:
+            route_state.append(node)
+        route_states.append(route_state)
+        j = i
+    route_states.reverse()
+    return _split_result(route_states, all_parcel_objects_original_order)
+
+# Permutation decoders selectable with the "decoder" parameter
+PERMUTATION_DECODERS = {
+    "greedy": _decode_particle_to_routes_and_evaluate,
+    "split": _split_particle_to_routes_and_evaluate,
+    "optimal_split": _optimal_split_particle_to_routes_and_evaluate
+}
+
+def _decode_permutations(permutations, all_parcel_objects_original_order, decode_route_profile, cache=None,
+                         decoder=_decode_particle_to_routes_and_evaluate):
+    """
+    Decodes each row of a (num_particles, num_parcels) permutation array (see Swarm.permutations)
+    with decoder (one of PERMUTATION_DECODERS). Returns one (fitness_tuple, list_of_routes_of_parcel_objects)
+    per row. With a cache (keyed by the permutation's bytes), permutations already decoded are looked up instead.
+    """
+    decoded = []
+    for permutation in permutations:
+        key = permutation.tobytes() if cache is not None else None
+        result = cache.get(key) if cache is not None else None
+        if result is None:
+            fitness, routes_parcels, _ = decoder(
+                permutation.tolist(), all_parcel_objects_original_order, decode_route_profile
+            )
+            result = (fitness, routes_parcels)
+            if cache is not None:
+                cache.put(key, result)
+        decoded.append(result)
+    return decoded
+
+
+class Swarm:
+    """
+    The whole swarm as (num_particles, num_dimensions) arrays: positions (random keys, one per
+    parcel), velocities and personal best positions. Fitness is (unassigned count, total
+    distance), compared lexicographically; personal best fitness is kept as two arrays.
+    """
+    def __init__(self, num_particles, num_dimensions, rng, pos_min=0.0, pos_max=1.0, max_velocity_factor=0.2):
+        self.rng = rng
+        self.positions = rng.uniform(pos_min, pos_max, (num_particles, num_dimensions))
+        self.velocities = rng.uniform(-max_velocity_factor, max_velocity_factor, (num_particles, num_dimensions)) # Vmax based on range of 1.0
+        self.pbest_positions = self.positions.copy()
+        self.pbest_unassigned = np.full(num_particles, np.inf)
+        self.pbest_distance = np.full(num_particles, np.inf)
         self.pos_min = pos_min
         self.pos_max = pos_max
         self.max_velocity = max_velocity_factor * (pos_max - pos_min)
 
-    def update_velocity(self, gbest_position, w, c1, c2):
-        for i in range(len(self.position)):
-            r1, r2 = random.random(), random.random()
-            cognitive_comp = c1 * r1 * (self.pbest_position[i] - self.position[i])
-            social_comp = c2 * r2 * (gbest_position[i] - self.position[i])
-            self.velocity[i] = w * self.velocity[i] + cognitive_comp + social_comp
-            # Clamp velocity
-            self.velocity[i] = max(-self.max_velocity, min(self.max_velocity, self.velocity[i]))
-
-    def update_position(self):
-        for i in range(len(self.position)):
-            self.position[i] += self.velocity[i]
-            # Clamp position to [pos_min, pos_max]
-            self.position[i] = max(self.pos_min, min(self.pos_max, self.position[i]))
+    def permutations(self):
+        """Every particle's parcel order (positions sorted by key, ties in parcel order) in one argsort."""
+        return np.argsort(self.positions, axis=1, kind="stable")
+
+    def update_pbest(self, unassigned, distance):
+        """Replaces the personal bests improved on by the current positions' fitness arrays."""
+        improved = (unassigned < self.pbest_unassigned) | \
+                   ((unassigned == self.pbest_unassigned) & (distance < self.pbest_distance))
+        self.pbest_positions[improved] = self.positions[improved]
+        self.pbest_unassigned[improved] = unassigned[improved]
+        self.pbest_distance[improved] = distance[improved]
+
+    def best_index(self):
+        """Index of the best personal best (lowest index among equals)."""
+        return int(np.lexsort((self.pbest_distance, self.pbest_unassigned))[0])
+
+    def update(self, gbest_position, w, c1, c2):
+        """Velocity and position update of every particle at once, clamped to the velocity/position limits."""
+        r1 = self.rng.random(self.positions.shape)
+        r2 = self.rng.random(self.positions.shape)
+        cognitive_comp = c1 * r1 * (self.pbest_positions - self.positions)
+        social_comp = c2 * r2 * (gbest_position - self.positions)
+        self.velocities *= w
+        self.velocities += cognitive_comp
+        self.velocities += social_comp
+        np.clip(self.velocities, -self.max_velocity, self.max_velocity, out=self.velocities)
+        self.positions += self.velocities
+        np.clip(self.positions, self.pos_min, self.pos_max, out=self.positions)
 
 
 def run_optimisation(config_data, params):
     warehouse_coords = config_data.get("warehouse_coordinates_x_y", [0,0])
-    all_parcels_list_orig = [copy.deepcopy(p) for p in config_data.get("parcels", [])] # Keep original
+    all_parcels_list_orig = config_data.get("parcels", []) # Config order == routing node order
     delivery_agents = config_data.get("delivery_agents", [])
 
     if not all_parcels_list_orig:
@@ -289,7 +421,8 @@ def run_optimisation(config_data, params):
 
     num_parcels = len(all_parcels_list_orig)
     num_dimensions = num_parcels # Each dimension corresponds to a parcel's random key
-    parcel_map = {p["id"]: p for p in all_parcels_list_orig}
+    instance = build_problem_instance(config_data, params, default_time_per_distance_unit=2.0,
+                                      default_service_time=params.get("default_service_time", 10))
 
     # --- Adaptive PSO Parameters ---
     # Number of Iterations
@@ -346,9 +479,15 @@ def run_optimisation(config_data, params):
         "generic_vehicle_capacity": effective_generic_capacity_pso,
         "generic_max_route_duration": effective_generic_max_route_duration_pso
     }
+    decode_route_profile = generic_route_profile(instance, effective_generic_constraints)
+    # Fitness and routes of decoded permutations, so no permutation is decoded twice
+    decode_cache_size = params.get("decode_cache_size", 10000)
+    decode_cache = FitnessCache(decode_cache_size) if decode_cache_size > 0 else None
+    decoder = PERMUTATION_DECODERS.get(params.get("decoder", "greedy"), _decode_particle_to_routes_and_evaluate)
 
     # Initialize swarm using effective_num_particles
-    swarm = [Particle(num_dimensions, pos_min_val, pos_max_val, max_velocity_factor) for _ in range(effective_num_particles)]
+    rng = np.random.default_rng(random.getrandbits(64)) # Follows the random module's seed
+    swarm = Swarm(effective_num_particles, num_dimensions, rng, pos_min_val, pos_max_val, max_velocity_factor)
     
     gbest_position = None
     gbest_fitness = (float('inf'), float('inf')) # (unassigned_count, total_distance)
@@ -356,50 +495,26 @@ def run_optimisation(config_data, params):
 
     # Main PSO loop using effective_num_iterations
     for iteration in range(effective_num_iterations):
-        for particle in swarm:
-            # Decode particle's position (random keys) into routes and evaluate fitness
-            fitness, routes_p_objs, _ = _decode_particle_to_routes_and_evaluate(
-                particle.position, all_parcels_list_orig, warehouse_coords, params, parcel_map,
-                effective_generic_constraints
-            )
-            particle.current_fitness = fitness
-            particle.current_routes_parcels = routes_p_objs
-
-            # Update pbest
-            if (particle.current_fitness[0] < particle.pbest_fitness[0]) or \
-               (particle.current_fitness[0] == particle.pbest_fitness[0] and particle.current_fitness[1] < particle.pbest_fitness[1]):
-                particle.pbest_fitness = particle.current_fitness
-                particle.pbest_position = list(particle.position)
-            
-            # Update gbest
-            if (particle.pbest_fitness[0] < gbest_fitness[0]) or \
-               (particle.pbest_fitness[0] == gbest_fitness[0] and particle.pbest_fitness[1] < gbest_fitness[1]):
-                gbest_fitness = particle.pbest_fitness
-                gbest_position = list(particle.pbest_position)
-                # Store the routes corresponding to this gbest
-                # Need to re-decode pbest_position because current_routes_parcels is from current_position
-                _, gbest_routes_parcels, _ = _decode_particle_to_routes_and_evaluate(
-                    gbest_position, all_parcels_list_orig, warehouse_coords, params, parcel_map,
-                    effective_generic_constraints
-                )
-
-        if gbest_position is None: # Should only happen if all particles failed to assign any parcel on first iter
-            # This is unlikely if there's at least one parcel and generic constraints are reasonable.
-            # If it does, pick a random particle's pbest as gbest to start.
-            if swarm and swarm[0].pbest_position:
-                 gbest_position = list(swarm[0].pbest_position)
-                 # And re-evaluate to get its routes for gbest_routes_parcels
-                 _, gbest_routes_parcels, _ = _decode_particle_to_routes_and_evaluate(
-                    gbest_position, all_parcels_list_orig, warehouse_coords, params, parcel_map
-                )
-            else: # No parcels or catastrophic failure.
-                 break
-
+        # Decode every particle's position (random keys) into routes and evaluate fitness
+        decoded = _decode_permutations(swarm.permutations(), all_parcels_list_orig, decode_route_profile,
+                                       decode_cache, decoder)
+        current_unassigned, current_distance = (np.array(values, dtype=np.float64)
+                                                for values in zip(*(fitness for fitness, _ in decoded)))
+
+        # Update pbest
+        swarm.update_pbest(current_unassigned, current_distance)
+
+        # Update gbest
+        best_index = swarm.best_index()
+        best_fitness = (int(swarm.pbest_unassigned[best_index]), float(swarm.pbest_distance[best_index]))
+        if best_fitness < gbest_fitness:
+            gbest_fitness = best_fitness
+            gbest_position = swarm.pbest_positions[best_index].copy()
+            # A pbest that beats gbest was set this iteration, so its routes were just decoded
+            gbest_routes_parcels = decoded[best_index][1]
 
         # Update velocities and positions for next iteration
-        for particle in swarm:
-            particle.update_velocity(gbest_position, w_inertia, c1_cognitive, c2_social)
-            particle.update_position()
+        swarm.update(gbest_position, w_inertia, c1_cognitive, c2_social)
 
     # --- Final assignment of gbest_routes_parcels to specific delivery agents ---
     optimised_routes_output = []
@@ -428,7 +543,7 @@ def run_optimisation(config_data, params):
                     continue
 
                 is_feasible_for_agent, schedule_details = _calculate_route_schedule_and_feasibility(
-                    route_parcel_obj_list, agent_config, warehouse_coords, params, parcel_map
+                    route_parcel_obj_list, agent_config, warehouse_coords, instance
                 )
                 if is_feasible_for_agent:
                     best_agent_for_this_route = agent_config
@@ -440,7 +555,7 @@ def run_optimisation(config_data, params):
                 used_agent_ids.add(assigned_agent_id)
                 
                 current_route_parcel_ids = [p_obj["id"] for p_obj in route_parcel_obj_list]
-                current_route_parcels_details = [copy.deepcopy(p_obj) for p_obj in route_parcel_obj_list]
+                current_route_parcels_details = list(route_parcel_obj_list)
                 for p_id in current_route_parcel_ids:
                     assigned_parcels_globally_ids.add(p_id)
 
@@ -458,10 +573,12 @@ def run_optimisation(config_data, params):
                 })
         
         final_unassigned_parcel_ids = [p["id"] for p in all_parcels_list_orig if p["id"] not in assigned_parcels_globally_ids]
-        final_unassigned_parcels_details = [copy.deepcopy(parcel_map[p_id]) for p_id in final_unassigned_parcel_ids]
+        final_unassigned_parcels_details = [p for p in all_parcels_list_orig if p["id"] not in assigned_parcels_globally_ids]
         message = (f"PSO completed. Iterations: {effective_num_iterations}. "
                    f"Best solution: {gbest_fitness[0]} unassigned, {gbest_fitness[1]:.2f} distance. "
                    f"Final unassigned after agent assignment: {len(final_unassigned_parcel_ids)}")
+    if decode_cache is not None:
+        message = f"{message} {decode_cache.summary('Decode cache')}"
 
 
     return {
@@ -1,19 +1,8 @@
 # DVRS Optimisation Script: Simulated Annealing
+import bisect
 import math
 import random
-import copy # For deepcopying solutions
-
-# --- Helper Functions ---
-def _calculate_distance(coord1, coord2):
-    """Calculates Euclidean distance."""
-    return math.sqrt((coord1[0] - coord2[0])**2 + (coord1[1] - coord2[1])**2)
-
-def _get_coords(stop_id, warehouse_coords, parcels_map):
-    """Gets coordinates for a stop ID (parcel or warehouse)."""
-    if stop_id == "Warehouse":
-        return warehouse_coords
-    parcel = parcels_map.get(stop_id)
-    return parcel["coordinates_x_y"] if parcel else None
+from packages.optimisation.backend.routing_core import build_problem_instance, WAREHOUSE_NODE
 
 # --- Core SA Logic ---
 
@@ -44,179 +33,247 @@ def _generate_initial_solution(parcels_list, agents_list, parcels_map):
     return solution_routes, unassigned_parcels
 
 
-def _evaluate_solution(current_routes_struct, unassigned_parcel_ids,
-                       agents_map, parcels_map, warehouse_coords, params):
+def _evaluate_solution(solution, instance, params):
     """
     Evaluates the cost of a given solution.
     Cost = total_distance + penalty_over_capacity + penalty_time_window +
            penalty_op_hour_violation + penalty_unassigned_parcel.
+    Returns (total_cost, route_costs) where route_costs[agent_idx] is the cost
+    of that agent's route, so neighbours can be evaluated by delta.
+    """
+    total_cost = len(solution.unassigned) * params.get("penalty_unassigned_parcel", 1000)
+    route_costs = []
+    for agent_idx, route_nodes in enumerate(solution.routes):
+        route_costs.append(_evaluate_route(agent_idx, route_nodes, instance, params))
+        total_cost += route_costs[agent_idx]
+    return total_cost, route_costs
+
+
+def _evaluate_route(agent_idx, route_nodes, instance, params):
+    """
+    Cost of a single agent's route (list of parcel nodes): its distance plus
+    capacity, time window and operating hour penalties. Empty routes cost nothing.
     """
+    if not route_nodes: # Agent has no parcels
+        return 0
+
     total_cost = 0
-    time_per_dist_unit = params.get("time_per_distance_unit", 2.0)
-    default_service_time = params.get("default_service_time", 10)
-    return_to_warehouse = params.get("return_to_warehouse", True)
+    distance_rows = instance.as_list("distance")
+    travel_time_rows = instance.as_list("travel_time")
+    weights = instance.as_list("weights")
+    tw_open = instance.as_list("tw_open")
+    tw_close = instance.as_list("tw_close")
+    service_times = instance.as_list("service_times")
+    agent_op_end = instance.as_list("agent_op_end")[agent_idx]
+    agent_capacity = instance.as_list("agent_capacities")[agent_idx]
 
     # Penalty factors from params
-    penalty_factor_unassigned = params.get("penalty_unassigned_parcel", 1000)
     penalty_factor_capacity = params.get("penalty_over_capacity", 100)
     penalty_factor_tw = params.get("penalty_time_window_violation", 50)
     penalty_factor_ophours = params.get("penalty_op_hour_violation", 200)
 
-    # Cost from unassigned parcels
-    total_cost += len(unassigned_parcel_ids) * penalty_factor_unassigned
+    current_time = float(instance.as_list("agent_op_start")[agent_idx])
+    from_node = WAREHOUSE_NODE # Start at warehouse
+    current_weight = 0
+    route_dist = 0
 
-    for agent_id, parcel_ids_for_agent in current_routes_struct.items():
-        agent_config = agents_map[agent_id]
-        agent_op_start = agent_config.get("operating_hours_start", 0)
-        agent_op_end = agent_config.get("operating_hours_end", 1439) # 23:59
-        agent_capacity = agent_config["capacity_weight"]
+    for to_node in route_nodes:
+        route_dist += distance_rows[from_node][to_node]
+        arrival_at_to_stop = current_time + travel_time_rows[from_node][to_node]
 
-        current_route_stops = ["Warehouse"] + parcel_ids_for_agent
-        if return_to_warehouse or not parcel_ids_for_agent: # Always return if empty, or if flag is true
-             current_route_stops.append("Warehouse")
+        parcel_tw_close = tw_close[to_node]
+        service_start_time = max(arrival_at_to_stop, tw_open[to_node])
         
-        if len(current_route_stops) <= 1 and parcel_ids_for_agent : # e.g. ["P001"] -> needs WH
-            # This case should be handled by ensuring routes always start/end with WH if they have parcels
-             current_route_stops = ["Warehouse"] + parcel_ids_for_agent + ["Warehouse"]
-        elif not parcel_ids_for_agent : # Agent has no parcels
-            continue # No distance or penalties for this agent
+        if service_start_time > parcel_tw_close : # Arrived too late even before service
+             total_cost += (service_start_time - parcel_tw_close) * penalty_factor_tw * 2 # Heavier penalty
 
+        service_end_time = service_start_time + service_times[to_node]
 
-        current_time = float(agent_op_start)
-        current_loc_coords = list(warehouse_coords) # Start at warehouse
-        current_weight = 0
-        route_dist = 0
-
-        for i in range(len(current_route_stops) - 1):
-            from_stop_id = current_route_stops[i]
-            to_stop_id = current_route_stops[i+1]
-
-            from_coords = _get_coords(from_stop_id, warehouse_coords, parcels_map)
-            to_coords = _get_coords(to_stop_id, warehouse_coords, parcels_map)
-
-            dist = _calculate_distance(from_coords, to_coords)
-            route_dist += dist
-            travel_time = dist * time_per_dist_unit
-            
-            arrival_at_to_stop = current_time + travel_time
-
-            if to_stop_id == "Warehouse": # Moving to (or arriving at final) Warehouse
-                current_time = arrival_at_to_stop
-                if i == len(current_route_stops) - 2: # This is the final arrival at warehouse
-                    if current_time > agent_op_end:
-                        total_cost += (current_time - agent_op_end) * penalty_factor_ophours
-            else: # Moving to a parcel
-                parcel_obj = parcels_map[to_stop_id]
-                parcel_tw_open = parcel_obj.get("time_window_open", 0)
-                parcel_tw_close = parcel_obj.get("time_window_close", 1439)
-                parcel_service_time = parcel_obj.get("service_time", default_service_time)
-
-                service_start_time = max(arrival_at_to_stop, parcel_tw_open)
-                
-                if service_start_time > parcel_tw_close : # Arrived too late even before service
-                     total_cost += (service_start_time - parcel_tw_close) * penalty_factor_tw * 2 # Heavier penalty
-
-                service_end_time = service_start_time + parcel_service_time
-
-                if service_end_time > parcel_tw_close:
-                    total_cost += (service_end_time - parcel_tw_close) * penalty_factor_tw
-                
-                if service_end_time > agent_op_end:
-                    total_cost += (service_end_time - agent_op_end) * penalty_factor_ophours
+        if service_end_time > parcel_tw_close:
+            total_cost += (service_end_time - parcel_tw_close) * penalty_factor_tw
+        
+        if service_end_time > agent_op_end:
+            total_cost += (service_end_time - agent_op_end) * penalty_factor_ophours
 
-                current_weight += parcel_obj["weight"]
-                if current_weight > agent_capacity:
-                    total_cost += (current_weight - agent_capacity) * penalty_factor_capacity
-                
-                current_time = service_end_time
-                current_loc_coords = list(to_coords)
+        current_weight += weights[to_node]
+        if current_weight > agent_capacity:
+            total_cost += (current_weight - agent_capacity) * penalty_factor_capacity
         
-        total_cost += route_dist # Add actual distance as part of the cost
+        current_time = service_end_time
+        from_node = to_node
+
+    if params.get("return_to_warehouse", True): # Final arrival at warehouse
+        route_dist += distance_rows[from_node][WAREHOUSE_NODE]
+        current_time += travel_time_rows[from_node][WAREHOUSE_NODE]
+        if current_time > agent_op_end:
+            total_cost += (current_time - agent_op_end) * penalty_factor_ophours
+    
+    total_cost += route_dist # Add actual distance as part of the cost
 
     return total_cost
 
 
-def _get_neighbor_solution(current_routes_struct, unassigned_parcel_ids,
-                           parcels_list, agents_list, parcels_map, params):
-    """Generates a neighbor solution by applying a random move."""
-    new_routes = copy.deepcopy(current_routes_struct)
-    new_unassigned = list(unassigned_parcel_ids) # Ensure it's a copy
+# --- Move Engine ---
+# Moves change the current solution in place and can be undone exactly, so
+# rejected neighbours cost no allocation. A move is a tuple:
+#   (MOVE_UNASSIGN, agent_idx, position)
+#   (MOVE_ASSIGN, unassigned_position, agent_idx, insert_position)
+#   (MOVE_SWAP, agent_idx, position_1, position_2)
+#   (MOVE_RELOCATE, source_agent_idx, position, target_agent_idx, insert_position)
+MOVE_UNASSIGN = 0
+MOVE_ASSIGN = 1
+MOVE_SWAP = 2
+MOVE_RELOCATE = 3
 
-    # All parcel IDs that could be in routes or unassigned
-    all_parcel_ids_master = [p["id"] for p in parcels_list]
-    
-    # Move type probabilities (can be params later)
-    prob_move_assigned_to_unassigned = params.get("prob_move_assigned_to_unassigned", 0.1)
-    prob_move_unassigned_to_assigned = params.get("prob_move_unassigned_to_assigned", 0.3)
-    prob_intra_route_swap = params.get("prob_intra_route_swap", 0.3)
-    # prob_inter_route_move = 1.0 - (sum of above)
-    
-    rnd_val = random.random()
 
-    if not agents_list: # No agents, no moves possible involving agents
-        return new_routes, new_unassigned
+class _Solution:
+    """
+    SA solution over parcel nodes: routes[agent_idx] is an ordered list of nodes and
+    unassigned is a list of nodes. Keeps the agents with non-empty routes and with
+    2+ parcels as sorted lists, so moves pick from them in agent order without scanning.
+    """
+    __slots__ = ("routes", "unassigned", "non_empty_agents", "multi_parcel_agents")
+
+    def __init__(self, routes, unassigned):
+        self.routes = routes
+        self.unassigned = unassigned
+        self.non_empty_agents = [a for a, route in enumerate(routes) if route]
+        self.multi_parcel_agents = [a for a, route in enumerate(routes) if len(route) >= 2]
+
+    def copy(self):
+        return _Solution([list(route) for route in self.routes], list(self.unassigned))
+
+    def apply(self, move):
+        kind = move[0]
+        if kind == MOVE_UNASSIGN:
+            _, agent_idx, position = move
+            self.unassigned.append(self.routes[agent_idx].pop(position))
+            self._route_changed(agent_idx)
+        elif kind == MOVE_ASSIGN:
+            _, unassigned_position, agent_idx, insert_position = move
+            self.routes[agent_idx].insert(insert_position, self.unassigned.pop(unassigned_position))
+            self._route_changed(agent_idx)
+        elif kind == MOVE_SWAP:
+            _, agent_idx, position_1, position_2 = move
+            route = self.routes[agent_idx]
+            route[position_1], route[position_2] = route[position_2], route[position_1]
+        else:
+            _, source_agent_idx, position, target_agent_idx, insert_position = move
+            self.routes[target_agent_idx].insert(insert_position, self.routes[source_agent_idx].pop(position))
+            self._route_changed(source_agent_idx)
+            self._route_changed(target_agent_idx)
+
+    def undo(self, move):
+        kind = move[0]
+        if kind == MOVE_UNASSIGN:
+            _, agent_idx, position = move
+            self.routes[agent_idx].insert(position, self.unassigned.pop())
+            self._route_changed(agent_idx)
+        elif kind == MOVE_ASSIGN:
+            _, unassigned_position, agent_idx, insert_position = move
+            self.unassigned.insert(unassigned_position, self.routes[agent_idx].pop(insert_position))
+            self._route_changed(agent_idx)
+        elif kind == MOVE_SWAP:
+            self.apply(move) # A swap is its own inverse
+        else:
+            _, source_agent_idx, position, target_agent_idx, insert_position = move
+            self.routes[source_agent_idx].insert(position, self.routes[target_agent_idx].pop(insert_position))
+            self._route_changed(source_agent_idx)
+            self._route_changed(target_agent_idx)
+
+    def _route_changed(self, agent_idx):
+        route_length = len(self.routes[agent_idx])
+        _set_membership(self.non_empty_agents, agent_idx, route_length >= 1)
+        _set_membership(self.multi_parcel_agents, agent_idx, route_length >= 2)
+
+
+def _set_membership(sorted_agents, agent_idx, member):
+    position = bisect.bisect_left(sorted_agents, agent_idx)
+    present = position < len(sorted_agents) and sorted_agents[position] == agent_idx
+    if member and not present:
+        sorted_agents.insert(position, agent_idx)
+    elif present and not member:
+        del sorted_agents[position]
+
+
+def _touched_agents(move):
+    """Agents whose routes a move changes."""
+    if move[0] == MOVE_ASSIGN:
+        return (move[2],)
+    if move[0] == MOVE_RELOCATE and move[1] != move[3]:
+        return (move[1], move[3])
+    return (move[1],)
+
+
+def _propose_move(solution, num_agents, move_thresholds):
+    """
+    Picks a random move for the current solution without changing it.
+    Returns None if the chosen move type is not possible (the neighbour is the current solution).
+    """
+    threshold_unassign, threshold_assign, threshold_swap = move_thresholds
+    rnd_val = random.random()
 
+    if not num_agents: # No agents, no moves possible involving agents
+        return None
 
-    if rnd_val < prob_move_assigned_to_unassigned: # Move a parcel from a route to unassigned
-        routable_agents = [aid for aid, p_ids in new_routes.items() if p_ids]
-        if routable_agents:
-            agent_id = random.choice(routable_agents)
-            parcel_idx = random.randrange(len(new_routes[agent_id]))
-            parcel_to_move = new_routes[agent_id].pop(parcel_idx)
-            new_unassigned.append(parcel_to_move)
+    routes = solution.routes
+    if rnd_val < threshold_unassign: # Move a parcel from a route to unassigned
+        if solution.non_empty_agents:
+            agent_idx = random.choice(solution.non_empty_agents)
+            return (MOVE_UNASSIGN, agent_idx, random.randrange(len(routes[agent_idx])))
 
-    elif rnd_val < prob_move_assigned_to_unassigned + prob_move_unassigned_to_assigned: # Move parcel from unassigned to a route
-        if new_unassigned:
-            parcel_to_move = random.choice(new_unassigned)
-            agent_id = random.choice(agents_list)["id"]
+    elif rnd_val < threshold_assign: # Move parcel from unassigned to a route
+        if solution.unassigned:
+            unassigned_position = random.randrange(len(solution.unassigned))
+            agent_idx = random.randrange(num_agents)
             
             insert_idx = 0
-            if new_routes[agent_id]: # If route is not empty
-                insert_idx = random.randrange(len(new_routes[agent_id]) + 1)
-            new_routes[agent_id].insert(insert_idx, parcel_to_move)
-            new_unassigned.remove(parcel_to_move)
-
-    elif rnd_val < prob_move_assigned_to_unassigned + prob_move_unassigned_to_assigned + prob_intra_route_swap: # Intra-route swap
-        agents_with_multiple_parcels = [aid for aid, p_ids in new_routes.items() if len(p_ids) >= 2]
-        if agents_with_multiple_parcels:
-            agent_id = random.choice(agents_with_multiple_parcels)
-            idx1, idx2 = random.sample(range(len(new_routes[agent_id])), 2)
-            new_routes[agent_id][idx1], new_routes[agent_id][idx2] = \
-                new_routes[agent_id][idx2], new_routes[agent_id][idx1]
+            if routes[agent_idx]: # If route is not empty
+                insert_idx = random.randrange(len(routes[agent_idx]) + 1)
+            return (MOVE_ASSIGN, unassigned_position, agent_idx, insert_idx)
+
+    elif rnd_val < threshold_swap: # Intra-route swap
+        if solution.multi_parcel_agents:
+            agent_idx = random.choice(solution.multi_parcel_agents)
+            idx1, idx2 = random.sample(range(len(routes[agent_idx])), 2)
+            return (MOVE_SWAP, agent_idx, idx1, idx2)
     
     else: # Inter-route move (move parcel from one agent to another)
-        source_agents_with_parcels = [aid for aid, p_ids in new_routes.items() if p_ids]
-        if source_agents_with_parcels:
-            source_agent_id = random.choice(source_agents_with_parcels)
+        if solution.non_empty_agents:
+            source_agent_idx = random.choice(solution.non_empty_agents)
             
-            # Ensure target agent is different if possible, or handle if only one agent
-            target_agent_list = [ag for ag in agents_list if ag["id"] != source_agent_id]
-            if not target_agent_list: # Only one agent, or source was the only one with parcels.
-                                      # This move becomes an intra-route re-insertion essentially.
-                target_agent_id = source_agent_id
+            # Target agent is different if possible; with a single agent this becomes
+            # an intra-route re-insertion
+            if num_agents == 1:
+                target_agent_idx = source_agent_idx
             else:
-                target_agent_id = random.choice(target_agent_list)["id"]
+                target_agent_idx = random.randrange(num_agents - 1)
+                if target_agent_idx >= source_agent_idx:
+                    target_agent_idx += 1 # Skip the source agent
 
-            parcel_idx_to_move = random.randrange(len(new_routes[source_agent_id]))
-            parcel_to_move = new_routes[source_agent_id].pop(parcel_idx_to_move)
+            parcel_idx_to_move = random.randrange(len(routes[source_agent_idx]))
             
+            # Insert position is drawn against the target route as it will be after the pop
+            target_length = len(routes[target_agent_idx]) - (1 if target_agent_idx == source_agent_idx else 0)
             insert_idx = 0
-            if new_routes[target_agent_id]: # If target route is not empty
-                insert_idx = random.randrange(len(new_routes[target_agent_id]) + 1)
-            new_routes[target_agent_id].insert(insert_idx, parcel_to_move)
-            
-    return new_routes, new_unassigned
+            if target_length: # If target route is not empty
+                insert_idx = random.randrange(target_length + 1)
+            return (MOVE_RELOCATE, source_agent_idx, parcel_idx_to_move, target_agent_idx, insert_idx)
+
+    return None
 
 
 def _format_solution_for_output(best_routes_struct, final_unassigned_ids,
-                                agents_map, parcels_map, warehouse_coords, params):
+                                instance, warehouse_coords, params):
     """
     Formats the best found solution into the required DVRS output structure.
     This involves detailed simulation of each route to get precise timings.
     """
     optimised_routes_output = []
-    time_per_dist_unit = params.get("time_per_distance_unit", 2.0)
-    default_service_time = params.get("default_service_time", 10)
+    distance_rows = instance.as_list("distance")
+    travel_time_rows = instance.as_list("travel_time")
+    tw_open = instance.as_list("tw_open")
+    service_times = instance.as_list("service_times")
     return_to_warehouse_flag = params.get("return_to_warehouse", True)
 
     assigned_parcel_ids_globally = set()
@@ -225,7 +282,7 @@ def _format_solution_for_output(best_routes_struct, final_unassigned_ids,
         if not parcel_ids_in_route and not return_to_warehouse_flag : # Skip agent if no parcels and no mandatory WH return
             continue
 
-        agent_config = agents_map[agent_id]
+        agent_config = instance.agents[instance.agent_index[agent_id]]
         agent_op_start = agent_config.get("operating_hours_start", 0)
         
         route_stop_ids = ["Warehouse"] + parcel_ids_in_route
@@ -268,31 +325,31 @@ def _format_solution_for_output(best_routes_struct, final_unassigned_ids,
         output_arrival_times.append(round(current_time)) # Arrival at WH is start time
         output_departure_times.append(round(current_time))# Departure from WH is start time
 
-        current_loc_for_calc = list(warehouse_coords)
+        from_node = WAREHOUSE_NODE
 
         for i in range(1, len(route_stop_ids)): # Start from the first actual parcel or final warehouse
             to_stop_id = route_stop_ids[i]
-            to_coords = _get_coords(to_stop_id, warehouse_coords, parcels_map)
+            to_node = instance.node_of(to_stop_id)
             
-            dist = _calculate_distance(current_loc_for_calc, to_coords)
-            route_total_dist += dist
-            travel_time = dist * time_per_dist_unit
+            route_total_dist += distance_rows[from_node][to_node]
+            travel_time = travel_time_rows[from_node][to_node]
             
             arrival_at_current_physical = current_time + travel_time
             
-            output_route_stop_coords.append(list(to_coords))
-            output_arrival_times.append(round(arrival_at_current_physical))
-
-            if to_stop_id == "Warehouse": # Final warehouse stop
+            if to_node == WAREHOUSE_NODE: # Final warehouse stop
+                output_route_stop_coords.append(list(warehouse_coords))
+                output_arrival_times.append(round(arrival_at_current_physical))
                 current_time = arrival_at_current_physical
                 output_departure_times.append(round(current_time)) # Arrival and departure are same
             else: # Parcel stop
-                parcel_obj = parcels_map[to_stop_id]
-                output_parcels_details.append(copy.deepcopy(parcel_obj)) # Store full detail
+                parcel_obj = instance.parcel_of(to_node)
+                output_route_stop_coords.append(list(parcel_obj["coordinates_x_y"]))
+                output_arrival_times.append(round(arrival_at_current_physical))
+                output_parcels_details.append(parcel_obj) # Store full detail
                 assigned_parcel_ids_globally.add(to_stop_id)
 
-                parcel_tw_open = parcel_obj.get("time_window_open", 0)
-                parcel_service_time = parcel_obj.get("service_time", default_service_time)
+                parcel_tw_open = tw_open[to_node]
+                parcel_service_time = service_times[to_node]
                 
                 # Wait if arriving early
                 actual_service_start_time = max(arrival_at_current_physical, parcel_tw_open)
@@ -302,7 +359,7 @@ def _format_solution_for_output(best_routes_struct, final_unassigned_ids,
                 
                 current_time = departure_from_current
                 current_total_weight += parcel_obj["weight"]
-                current_loc_for_calc = list(to_coords)
+            from_node = to_node
         
         optimised_routes_output.append({
             "agent_id": agent_id,
@@ -318,9 +375,9 @@ def _format_solution_for_output(best_routes_struct, final_unassigned_ids,
         })
 
     # Determine truly unassigned parcels for the final output
-    all_configured_parcel_ids = {p["id"] for p in parcels_map.values()}
+    all_configured_parcel_ids = {p["id"] for p in instance.parcels}
     final_unassigned_output_ids = list(all_configured_parcel_ids - assigned_parcel_ids_globally)
-    final_unassigned_details = [parcels_map[pid] for pid in final_unassigned_output_ids]
+    final_unassigned_details = [instance.parcel_of(instance.node_of(pid)) for pid in final_unassigned_output_ids]
 
 
     return {
@@ -417,7 +474,9 @@ def run_optimisation(config_data, params):
 
     # Create maps for easy lookup
     parcels_map = {p["id"]: p for p in parcels_list}
-    agents_map = {a["id"]: a for a in agents_list}
+    # Parcel/agent attribute arrays and routing matrices, built once for the run
+    instance = build_problem_instance(config_data, params, default_time_per_distance_unit=2.0,
+                                      default_service_time=params.get("default_service_time", 10))
 
     # SA Parameters
     temperature = params.get("initial_temperature", 10000.0)
@@ -425,44 +484,85 @@ def run_optimisation(config_data, params):
     min_temperature = params.get("min_temperature", 0.1)
     iterations_per_temp = params.get("iterations_per_temperature", 100)
 
-    # Initial Solution
-    current_routes_struct, current_unassigned_ids = _generate_initial_solution(parcels_list, agents_list, parcels_map)
-    current_cost = _evaluate_solution(current_routes_struct, current_unassigned_ids,
-                                      agents_map, parcels_map, warehouse_coords, params)
+    # Move type probabilities; prob_inter_route_move = 1.0 - (sum of these)
+    prob_move_assigned_to_unassigned = params.get("prob_move_assigned_to_unassigned", 0.1)
+    prob_move_unassigned_to_assigned = params.get("prob_move_unassigned_to_assigned", 0.3)
+    prob_intra_route_swap = params.get("prob_intra_route_swap", 0.3)
+    move_thresholds = (
+        prob_move_assigned_to_unassigned,
+        prob_move_assigned_to_unassigned + prob_move_unassigned_to_assigned,
+        prob_move_assigned_to_unassigned + prob_move_unassigned_to_assigned + prob_intra_route_swap
+    )
+
+    # Initial Solution (parcel IDs are mapped to nodes; routes are indexed by agent)
+    initial_routes, initial_unassigned_ids = _generate_initial_solution(parcels_list, agents_list, parcels_map)
+    node_index = instance.matrices.node_index
+    current = _Solution(
+        [[node_index[parcel_id] for parcel_id in initial_routes[agent["id"]]] for agent in instance.agents],
+        [node_index[parcel_id] for parcel_id in initial_unassigned_ids]
+    )
+    num_agents = instance.num_agents
+    current_cost, current_route_costs = _evaluate_solution(current, instance, params)
+    penalty_factor_unassigned = params.get("penalty_unassigned_parcel", 1000)
     
-    best_routes_struct = copy.deepcopy(current_routes_struct)
-    best_unassigned_ids = list(current_unassigned_ids)
+    best_solution = current.copy()
     best_cost = current_cost
+    # The best solution is only copied out when the search is about to move away from it
+    at_best = False
 
     print(f"SA Initial Cost: {current_cost}")
 
     # SA Main Loop
     while temperature > min_temperature:
         for _ in range(iterations_per_temp):
-            neighbor_routes_struct, neighbor_unassigned_ids = _get_neighbor_solution(
-                current_routes_struct, current_unassigned_ids,
-                parcels_list, agents_list, parcels_map, params
-            )
-            neighbor_cost = _evaluate_solution(neighbor_routes_struct, neighbor_unassigned_ids,
-                                               agents_map, parcels_map, warehouse_coords, params)
+            move = _propose_move(current, num_agents, move_thresholds)
+            if move is None: # Neighbour is the current solution (cost_diff 0, always accepted)
+                random.random() # Acceptance draw, kept so seeded runs follow the same sequence
+                continue
+            
+            # Delta evaluation: apply the move in place and re-simulate only the routes it touched
+            unassigned_before = len(current.unassigned)
+            current.apply(move)
+            touched_agents = _touched_agents(move)
+            neighbor_route_costs = [
+                _evaluate_route(agent_idx, current.routes[agent_idx], instance, params)
+                for agent_idx in touched_agents
+            ]
+            neighbor_cost = current_cost + (len(current.unassigned) - unassigned_before) * penalty_factor_unassigned
+            for agent_idx, route_cost in zip(touched_agents, neighbor_route_costs):
+                neighbor_cost += route_cost - current_route_costs[agent_idx]
 
             cost_diff = neighbor_cost - current_cost
             if cost_diff < 0 or random.random() < math.exp(-cost_diff / temperature):
-                current_routes_struct = neighbor_routes_struct
-                current_unassigned_ids = neighbor_unassigned_ids
+                if at_best: # Leaving the best solution: snapshot it first
+                    current.undo(move)
+                    best_solution = current.copy()
+                    current.apply(move)
+                    at_best = False
                 current_cost = neighbor_cost
+                for agent_idx, route_cost in zip(touched_agents, neighbor_route_costs):
+                    current_route_costs[agent_idx] = route_cost
 
                 if current_cost < best_cost:
-                    best_routes_struct = copy.deepcopy(current_routes_struct)
-                    best_unassigned_ids = list(current_unassigned_ids)
                     best_cost = current_cost
+                    at_best = True
+            else:
+                current.undo(move) # Rejected
         
         temperature *= cooling_rate
         # print(f"Temp: {temperature:.2f}, Current Cost: {current_cost:.2f}, Best Cost: {best_cost:.2f}")
 
+    if at_best:
+        best_solution = current.copy()
 
     print(f"SA Final Best Cost: {best_cost}")
     
     # Format the best solution found for output
+    node_ids = instance.node_ids
+    best_routes_struct = {
+        agent["id"]: [node_ids[node] for node in best_solution.routes[agent_idx]]
+        for agent_idx, agent in enumerate(instance.agents)
+    }
+    best_unassigned_ids = [node_ids[node] for node in best_solution.unassigned]
     return _format_solution_for_output(best_routes_struct, best_unassigned_ids,
-                                       agents_map, parcels_map, warehouse_coords, params)
\ No newline at end of file
+                                       instance, warehouse_coords, params)
\ No newline at end of file